@@ -0,0 +1,47 @@
+"""add image content hash + ingestion manifest
+
+Revision ID: 5b8f0e4c2d91
+Revises: 9c3e1d2a7b10
+Create Date: 2025-09-05 14:02:11.530914
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5b8f0e4c2d91"
+down_revision: Union[str, Sequence[str], None] = "9c3e1d2a7b10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        # the images table only exists on postgres (see 220f8bc6e85a)
+        op.add_column(
+            "images", sa.Column("content_hash", sa.String(64), nullable=True)
+        )
+        op.create_index("ix_images_content_hash", "images", ["content_hash"])
+
+    op.create_table(
+        "ingestion_manifest",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("folder", sa.String(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("mtime_ns", sa.BigInteger(), nullable=False),
+        sa.Column("content_hash", sa.String(64), nullable=False),
+        sa.UniqueConstraint("folder", "path"),
+    )
+
+
+def downgrade():
+    op.drop_table("ingestion_manifest")
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.drop_index("ix_images_content_hash", table_name="images")
+        op.drop_column("images", "content_hash")
@@ -0,0 +1,58 @@
+"""add quantized (halfvec / binary) embedding indexes
+
+Revision ID: 7d2c9a4e1f36
+Revises: 5b8f0e4c2d91
+Create Date: 2025-09-10 09:47:35.204417
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "7d2c9a4e1f36"
+down_revision: Union[str, Sequence[str], None] = "5b8f0e4c2d91"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Expression indexes over the float32 column: queries must use the exact same
+# expressions (see app.index.pgvector). Only the index for the configured
+# VECTOR_STORAGE is built; after changing it, re-run this revision with
+# `alembic downgrade 5b8f0e4c2d91 && alembic upgrade head`.
+QUANTIZED_INDEXES = {
+    "halfvec": (
+        "images_embedding_halfvec_hnsw",
+        "(embedding::halfvec(512)) halfvec_cosine_ops",
+    ),
+    "binary": (
+        "images_embedding_binary_hnsw",
+        "(binary_quantize(embedding)::bit(512)) bit_hamming_ops",
+    ),
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    index = QUANTIZED_INDEXES.get(settings.vector_storage)
+    if index is None:
+        return
+    name, expression = index
+    op.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS {name}
+        ON images USING hnsw ({expression})
+        WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction});
+    """
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for name, _ in QUANTIZED_INDEXES.values():
+        op.execute(f"DROP INDEX IF EXISTS {name};")
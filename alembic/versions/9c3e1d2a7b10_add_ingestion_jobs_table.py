@@ -0,0 +1,45 @@
+"""add ingestion jobs table
+
+Revision ID: 9c3e1d2a7b10
+Revises: 4f5474abc4a9
+Create Date: 2025-09-02 10:21:47.118302
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9c3e1d2a7b10"
+down_revision: Union[str, Sequence[str], None] = "4f5474abc4a9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        "ingestion_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("folder", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("next_offset", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("indexed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column(
+            "started_offset", sa.Integer(), nullable=False, server_default="0"
+        ),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    op.create_index("ix_ingestion_jobs_status", "ingestion_jobs", ["status"])
+
+
+def downgrade():
+    op.drop_index("ix_ingestion_jobs_status", table_name="ingestion_jobs")
+    op.drop_table("ingestion_jobs")
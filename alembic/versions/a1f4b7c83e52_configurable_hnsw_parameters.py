@@ -0,0 +1,67 @@
+"""rebuild HNSW indexes with configured build parameters
+
+Revision ID: a1f4b7c83e52
+Revises: 7d2c9a4e1f36
+Create Date: 2025-09-12 16:05:52.871930
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "a1f4b7c83e52"
+down_revision: Union[str, Sequence[str], None] = "7d2c9a4e1f36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every HNSW index on images and its column expression + operator class.
+HNSW_INDEXES = {
+    "images_embedding_hnsw": "embedding vector_cosine_ops",
+    "images_embedding_halfvec_hnsw": "(embedding::halfvec(512)) halfvec_cosine_ops",
+    "images_embedding_binary_hnsw": (
+        "(binary_quantize(embedding)::bit(512)) bit_hamming_ops"
+    ),
+}
+
+
+def upgrade():
+    """Rebuild existing HNSW indexes whose m / ef_construction differ from
+    HNSW_M / HNSW_EF_CONSTRUCTION.
+
+    The replacement is built concurrently next to the old index, so searches
+    and ingestion keep running during the rebuild.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    wanted = {
+        f"m={settings.hnsw_m}",
+        f"ef_construction={settings.hnsw_ef_construction}",
+    }
+    with op.get_context().autocommit_block():
+        for name, expression in HNSW_INDEXES.items():
+            row = bind.execute(
+                sa.text("SELECT reloptions FROM pg_class WHERE relname = :name"),
+                {"name": name},
+            ).first()
+            if row is None or set(row.reloptions or ()) == wanted:
+                continue
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new;")
+            op.execute(
+                f"""
+                CREATE INDEX CONCURRENTLY {name}_new
+                ON images USING hnsw ({expression})
+                WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction});
+            """
+            )
+            op.execute(f"DROP INDEX CONCURRENTLY {name};")
+            op.execute(f"ALTER INDEX {name}_new RENAME TO {name};")
+
+
+def downgrade():
+    # build parameters do not change the schema; keep the indexes as they are
+    pass
@@ -0,0 +1,46 @@
+"""add feedback aggregates table
+
+Revision ID: c6e2f9a1d4b7
+Revises: a1f4b7c83e52
+Create Date: 2025-09-24 14:05:12.402911
+
+Existing feedback is aggregated by `python -m app.services.feedback_ranking`.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c6e2f9a1d4b7"
+down_revision: Union[str, Sequence[str], None] = "a1f4b7c83e52"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        "feedback_aggregates",
+        sa.Column("query", sa.Text(), nullable=False),
+        sa.Column(
+            "image_id",
+            sa.Integer(),
+            sa.ForeignKey("images.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("good", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("bad", sa.Float(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("query", "image_id"),
+    )
+    # the primary key serves lookups by query; this one serves image deletes
+    op.create_index(
+        "ix_feedback_aggregates_image_id", "feedback_aggregates", ["image_id"]
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_feedback_aggregates_image_id", table_name="feedback_aggregates"
+    )
+    op.drop_table("feedback_aggregates")
@@ -0,0 +1,68 @@
+"""add image search filter columns and filename text indexes
+
+Revision ID: e3b5a7c9d2f1
+Revises: c6e2f9a1d4b7
+Create Date: 2025-10-02 10:21:47.118305
+
+Images indexed before this revision have no collection or source folder
+until their folder is ingested again.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e3b5a7c9d2f1"
+down_revision: Union[str, Sequence[str], None] = "c6e2f9a1d4b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# must match app.index.pgvector.FILENAME_TSVECTOR
+FILENAME_TSVECTOR = (
+    "to_tsvector('simple'::regconfig, translate(filename, '._-', '   '))"
+)
+
+
+def upgrade():
+    op.add_column("ingestion_jobs", sa.Column("collection", sa.String(), nullable=True))
+
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    # the images table only exists on postgres (see 220f8bc6e85a)
+    op.add_column("images", sa.Column("collection", sa.String(), nullable=True))
+    op.add_column("images", sa.Column("source_folder", sa.String(), nullable=True))
+    op.create_index("ix_images_collection", "images", ["collection"])
+    op.create_index("ix_images_source_folder", "images", ["source_folder"])
+    op.create_index("ix_images_created_at", "images", ["created_at"])
+
+    # `filename=` substring filters (ILIKE)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_images_filename_trgm
+        ON images USING gin (filename gin_trgm_ops);
+    """
+    )
+    # words of hybrid searches
+    op.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS ix_images_filename_fts
+        ON images USING gin (({FILENAME_TSVECTOR}));
+    """
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_images_filename_fts;")
+        op.execute("DROP INDEX IF EXISTS ix_images_filename_trgm;")
+        op.drop_index("ix_images_created_at", table_name="images")
+        op.drop_index("ix_images_source_folder", table_name="images")
+        op.drop_index("ix_images_collection", table_name="images")
+        op.drop_column("images", "source_folder")
+        op.drop_column("images", "collection")
+    op.drop_column("ingestion_jobs", "collection")
@@ -0,0 +1,29 @@
+"""add the count of skipped files to ingestion jobs
+
+Revision ID: f4a8c2e6b913
+Revises: e3b5a7c9d2f1
+Create Date: 2025-10-20 09:12:31.402217
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f4a8c2e6b913"
+down_revision: Union[str, Sequence[str], None] = "e3b5a7c9d2f1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column(
+        "ingestion_jobs",
+        sa.Column("skipped", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_column("ingestion_jobs", "skipped")
@@ -0,0 +1,65 @@
+"""Benchmark image row inserts: ORM objects vs the bulk COPY writer.
+
+Usage:
+    python benchmarks/bench_bulk_insert.py --rows 20000 --repeat 3
+
+Runs against DATABASE_URL (COPY is only used on PostgreSQL). Every run is
+rolled back, so the benchmark leaves the database unchanged.
+"""
+
+import argparse
+import time
+import uuid
+
+import numpy as np
+from app.db.base import Base, SessionLocal, engine
+from app.db.bulk import bulk_insert_images
+from app.db.models.image import Image
+
+
+def orm_insert(db, filenames, embeddings):
+    """The previous ingestion path: Python float lists through ORM objects."""
+    rows = [
+        Image(filename=name, url_path=f"/{name}", embedding=emb)
+        for name, emb in zip(filenames, embeddings.tolist())
+    ]
+    db.add_all(rows)
+    db.flush()
+    return [row.id for row in rows]
+
+
+def bulk_insert(db, filenames, embeddings):
+    """The bulk writer used by ingestion."""
+    return bulk_insert_images(
+        db, filenames, [f"/{name}" for name in filenames], embeddings
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.rows, 512)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+    print(f"dialect={engine.dialect.name} rows={args.rows}")
+    for name, insert in (("orm", orm_insert), ("bulk", bulk_insert)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            prefix = uuid.uuid4().hex[:8]
+            filenames = [f"bench-{prefix}-{i}.jpg" for i in range(args.rows)]
+            with SessionLocal() as db:
+                start = time.perf_counter()
+                ids = insert(db, filenames, embeddings)
+                best = min(best, time.perf_counter() - start)
+                assert len(ids) == args.rows
+                db.rollback()
+        print(f"{name:>5}: {args.rows / best:12.0f} rows/sec ({best:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
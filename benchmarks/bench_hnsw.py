@@ -0,0 +1,82 @@
+"""Recall@k and latency of pgvector HNSW search across a parameter grid.
+
+Usage:
+    python benchmarks/bench_hnsw.py --corpus 100000 --k 10 \\
+        --m 16 32 --ef-construction 64 128 --ef-search 40 100 200 400
+
+For every (m, ef_construction) pair an HNSW index is built over a synthetic
+corpus, then every ef_search is measured against exact search. Everything
+runs in one rolled-back transaction that locks `images`: use a dedicated,
+empty database.
+"""
+
+import argparse
+import json
+
+from common import (
+    exact_top_k,
+    latency_stats,
+    recall_at_k,
+    synthetic_embeddings,
+    synthetic_images,
+    timed,
+)
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from app.index.pgvector import PgvectorBackend
+    from sqlalchemy import text
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 100, 200, 400])
+    args = parser.parse_args()
+
+    corpus = synthetic_embeddings(args.corpus)
+    queries = synthetic_embeddings(args.queries, seed=1)
+    truth = exact_top_k(corpus, queries, args.k)
+
+    with synthetic_images(corpus) as (db, ids):
+        truth_ids = ids[truth]
+        db.execute(text("DROP INDEX IF EXISTS images_embedding_hnsw"))
+        for m in args.m:
+            for ef_construction in args.ef_construction:
+                db.execute(text("DROP INDEX IF EXISTS images_embedding_bench"))
+                _, build_seconds = timed(
+                    db.execute,
+                    text(
+                        "CREATE INDEX images_embedding_bench ON images "
+                        "USING hnsw (embedding vector_cosine_ops) "
+                        f"WITH (m = {m}, ef_construction = {ef_construction})"
+                    ),
+                )
+                db.execute(text("ANALYZE images"))
+                for ef_search in args.ef_search:
+                    backend = PgvectorBackend(ef_search=ef_search)
+                    found, latencies = [], []
+                    for query in queries:
+                        rows, seconds = timed(backend.search, db, query, args.k)
+                        found.append([img.id for img, _ in rows])
+                        latencies.append(seconds)
+                    print(
+                        json.dumps(
+                            {
+                                "m": m,
+                                "ef_construction": ef_construction,
+                                "ef_search": ef_search,
+                                "k": args.k,
+                                "build_s": build_seconds,
+                                f"recall@{args.k}": recall_at_k(truth_ids, found),
+                                **latency_stats(latencies),
+                            }
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Recall vs latency of quantized pgvector storage against float32 search.
+
+Usage:
+    # recall of the quantization schemes alone, brute force in NumPy
+    python benchmarks/bench_quantization.py --corpus 100000 --simulate
+
+    # recall and latency of PgvectorBackend on a pgvector database
+    python benchmarks/bench_quantization.py --corpus 100000
+
+Recall@k is measured against exact float32 search. The database mode builds
+the HNSW expression indexes of every mode inside a transaction that is
+rolled back, so it needs an empty `images` table.
+"""
+
+import argparse
+import json
+
+import numpy as np
+from common import (
+    exact_top_k,
+    latency_stats,
+    recall_at_k,
+    synthetic_embeddings,
+    synthetic_images,
+    timed,
+)
+
+STORAGES = ("float32", "halfvec", "binary")
+INDEX_DDL = {
+    "halfvec": "CREATE INDEX ON images USING hnsw "
+    "((embedding::halfvec(512)) halfvec_cosine_ops)",
+    "binary": "CREATE INDEX ON images USING hnsw "
+    "((binary_quantize(embedding)::bit(512)) bit_hamming_ops)",
+}
+
+
+def simulate(corpus, queries, truth, k, oversample):
+    """Recall of quantized candidate generation + exact re-ranking (no ANN)."""
+    results = []
+    half_scores = queries.astype(np.float16).astype(np.float32) @ (
+        corpus.astype(np.float16).astype(np.float32).T
+    )
+    corpus_bits = np.packbits(corpus > 0, axis=1)
+    query_bits = np.packbits(queries > 0, axis=1)
+    hamming = np.stack(
+        [np.unpackbits(corpus_bits ^ q, axis=1).sum(axis=1) for q in query_bits]
+    )
+    for storage in STORAGES:
+        for factor in oversample if storage != "float32" else [1]:
+            n = k * factor
+            if storage == "float32":
+                found = truth
+            else:
+                approx = -half_scores if storage == "halfvec" else hamming
+                candidates = np.argpartition(approx, n - 1, axis=1)[:, :n]
+                exact = np.take_along_axis(queries @ corpus.T, candidates, axis=1)
+                order = np.argsort(-exact, axis=1)[:, :k]
+                found = np.take_along_axis(candidates, order, axis=1)
+            results.append(
+                {
+                    "mode": "simulate",
+                    "storage": storage,
+                    "oversample": factor,
+                    "k": k,
+                    f"recall@{k}": recall_at_k(truth, found),
+                }
+            )
+    return results
+
+
+def run_database(corpus, queries, truth, k, oversample):
+    """Recall and latency of PgvectorBackend for every storage mode."""
+    # pylint: disable=import-outside-toplevel
+    from app.index.pgvector import PgvectorBackend
+    from sqlalchemy import text
+
+    results = []
+    with synthetic_images(corpus) as (db, ids):
+        for ddl in INDEX_DDL.values():
+            db.execute(text(ddl))
+        db.execute(text("ANALYZE images"))
+        truth_ids = ids[truth]
+        for storage in STORAGES:
+            for factor in oversample if storage != "float32" else [1]:
+                backend = PgvectorBackend(storage=storage, oversample=factor)
+                found, latencies = [], []
+                for query in queries:
+                    rows, seconds = timed(backend.search, db, query, k)
+                    found.append([img.id for img, _ in rows])
+                    latencies.append(seconds)
+                results.append(
+                    {
+                        "mode": "database",
+                        "storage": storage,
+                        "oversample": factor,
+                        "k": k,
+                        f"recall@{k}": recall_at_k(truth_ids, found),
+                        **latency_stats(latencies),
+                    }
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--simulate", action="store_true")
+    args = parser.parse_args()
+
+    corpus = synthetic_embeddings(args.corpus)
+    queries = synthetic_embeddings(args.queries, seed=1)
+    truth = exact_top_k(corpus, queries, args.k)
+
+    run = simulate if args.simulate else run_database
+    for result in run(corpus, queries, truth, args.k, args.oversample):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
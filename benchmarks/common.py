@@ -0,0 +1,114 @@
+"""Shared helpers for the benchmark scripts."""
+
+import contextlib
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+from app.db.base import Base, SessionLocal, engine
+from app.db.bulk import bulk_insert_images
+from app.db.models.image import Image
+from PIL import Image as PILImage
+from sqlalchemy import func, select
+
+
+def synthetic_embeddings(
+    n: int, dim: int = 512, clusters: int = 100, seed: int = 0
+) -> np.ndarray:
+    """Unit-norm vectors drawn around random cluster centres.
+
+    CLIP embeddings are far from isotropic: they share a common direction and
+    group by content. A shared offset plus clustered noise mimics that better
+    than plain Gaussian vectors, which are a worst case for quantization.
+    """
+    rng = np.random.default_rng(seed)
+    common = rng.standard_normal(dim)
+    centres = rng.standard_normal((clusters, dim)) + 2 * common
+    vecs = centres[rng.integers(0, clusters, n)] + 1.5 * rng.standard_normal((n, dim))
+    vecs = vecs.astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=-1, keepdims=True)
+
+
+def synthetic_image_files(
+    folder: Path, n: int, size: int = 256, seed: int = 0
+) -> List[Path]:
+    """Write `n` distinct JPEG files of noise over colour gradients.
+
+    The same (n, size, seed) always gives the same bytes, so corpora and their
+    content hashes are reproducible across runs.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    ramp = np.linspace(0, 1, size, dtype=np.float32)
+    paths = []
+    for i in range(n):
+        rng = np.random.default_rng(seed * 1_000_003 + i)
+        colours = rng.uniform(0, 255, (2, 3)).astype(np.float32)
+        pixels = ramp[:, None, None] * colours[0] + ramp[None, :, None] * colours[1]
+        pixels = pixels / 2 + rng.normal(0, 24, (size, size, 3))
+        path = folder / f"synthetic-{seed}-{i:06d}.jpg"
+        PILImage.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(
+            path, quality=90
+        )
+        paths.append(path)
+    return paths
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth top-k row indices of every query by cosine similarity."""
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(
+    truth: Sequence[Sequence[int]], found: Sequence[Sequence[int]]
+) -> float:
+    """Mean fraction of the true top-k found, over all queries."""
+    hits = [len(set(t) & set(f)) / len(t) for t, f in zip(truth, found)]
+    return float(np.mean(hits))
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 latencies in milliseconds and the sequential QPS."""
+    ms = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "qps": float(len(ms) / (ms.sum() / 1000)) if ms.sum() else 0.0,
+    }
+
+
+@contextlib.contextmanager
+def synthetic_images(corpus: np.ndarray) -> Iterator[tuple]:
+    """Insert a synthetic corpus into `images` inside a rolled-back transaction.
+
+    Yields:
+        tuple: (session, ids) where `ids[i]` is the image id of `corpus[i]`.
+    """
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        existing = db.scalar(select(func.count(Image.id)))
+        if existing:
+            raise SystemExit(
+                f"images already holds {existing} rows; use an empty database"
+            )
+        prefix = uuid.uuid4().hex[:8]
+        filenames = [f"bench-{prefix}-{i}.jpg" for i in range(len(corpus))]
+        try:
+            ids = bulk_insert_images(
+                db, filenames, [f"/{name}" for name in filenames], corpus
+            )
+            yield db, np.asarray(ids)
+        finally:
+            db.rollback()
+
+
+def timed(fn, *args, **kwargs):
+    """Call `fn` and return (result, seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
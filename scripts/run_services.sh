@@ -10,4 +10,5 @@ if [ "$ENABLE_MIGRATION" = "true" ]; then
 fi
 
 echo "Starting API..."
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+# WEB_CONCURRENCY worker processes share one copy of the CLIP model
+exec python -m app.serve --host 0.0.0.0 --port 8000
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""In-process LRU cache with optional time-to-live expiry."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and entry age.
+
+    Attributes:
+        max_size (int): Maximum number of entries; 0 disables the cache.
+        ttl_seconds (float): Entry lifetime; 0 or less means entries never expire.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float = 0):
+        self.max_size = max(0, max_size)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Return the value for `key` without touching recency or counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            return None
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert or refresh `key`, evicting the least recently used entries."""
+        if self.max_size == 0:
+            return
+        expires_at = (
+            time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        )
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss/eviction counters and the current size."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -2,6 +2,8 @@
 This module uses Pydantic to define and validate application settings.
 """
 
+from typing import Dict, Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -15,16 +17,106 @@ class Settings(BaseSettings):
 
     # --- Database ---
     database_url: str = Field(default="sqlite:///./app.db", alias="DATABASE_URL")
+    # read-only requests (search, listings) go here when set
+    database_replica_url: Optional[str] = Field(
+        default=None, alias="DATABASE_REPLICA_URL"
+    )
+    db_pool_size: int = 5  # persistent connections per engine
+    db_max_overflow: int = 10  # extra connections under load
+    db_pool_timeout_seconds: float = 30  # wait for a free connection
+    db_pool_recycle_seconds: int = 1800  # reconnect older connections, -1 never
+    db_pool_pre_ping: bool = True  # check connections before handing them out
+    # psycopg: prepare statements server-side (off behind PgBouncer in
+    # transaction mode), after this many runs per connection, 0 = first run
+    db_prepared_statements: bool = True
+    db_prepare_threshold: int = 5
+    db_echo: bool = False  # log every SQL statement
 
     # --- CLIP model ---
     clip_model_id: str = "openai/clip-vit-base-patch32"
     device: str = "cpu"  # "auto" | "cpu" | "cuda" | "mps"
-    dtype: str = "float16"  # "float32" | "float16"
+    encoder_backend: str = "torch"  # "torch" | "onnx"
+    dtype: str = "float16"  # "float32" | "float16" | "bfloat16" | "int8"
+    # prepared weights, tokenizer and ONNX graphs, "" disables
+    model_cache_dir: str = Field(default="/data/models", alias="MODEL_CACHE_DIR")
+    model_warmup: bool = True  # run a forward pass before serving
     batch_size: int = 32
+    decode_workers: int = 0  # image decode/preprocess threads, 0 = one per core
+    decode_prefetch_batches: int = 2  # batches decoded ahead of the model
+    text_batch_max_size: int = 64  # max concurrent queries per text forward pass
+    text_batch_max_wait_ms: float = 5.0  # how long a query waits for others
+    inference_workers: int = 1  # threads running forward passes
+    torch_threads: int = 0  # intra-op threads (torch and onnx), 0 = default
+
+    # --- Search ---
+    search_backend: str = "auto"  # "auto" | "pgvector" | "exact"
+    vector_storage: str = "float32"  # pgvector index: "float32" | "halfvec" | "binary"
+    rerank_oversample: int = 4  # candidates per result re-ranked in float32
+    hnsw_m: int = 16  # index build parameters, applied by alembic
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 40  # default candidate list size per search
+    # filtered searches, pgvector >= 0.8: "off" | "strict_order" | "relaxed_order"
+    hnsw_iterative_scan: str = "relaxed_order"
+    hnsw_ef_search_tiers: Dict[str, int] = {
+        "fast": 40,
+        "balanced": 100,
+        "accurate": 400,
+    }
+    exact_index_dir: str = Field(default="/data/index", alias="EXACT_INDEX_DIR")
+    exact_index_dtype: str = "float32"  # "float32" | "float16" (half the memory)
+    text_cache_size: int = 10000  # cached query embeddings, 0 disables
+    text_cache_ttl_seconds: float = 3600  # 0 = never expire
+    text_cache_dtype: str = "float16"  # "float32" | "float16"
+    text_cache_prewarm: int = 0  # top feedback queries embedded at startup
+    search_cache_size: int = 1000  # cached search responses, 0 disables
+    search_cache_ttl_seconds: float = 300  # 0 = only invalidated by ingestion
+    search_batch_max_queries: int = 256  # queries per /images/search/batch call
+    hybrid_candidates: int = 100  # results of each ranking fused by hybrid search
+    hybrid_rrf_k: int = 60  # reciprocal rank fusion constant
+
+    # --- Listing ---
+    page_size: int = 100  # default page size of GET /images and /feedbacks
+    max_page_size: int = 1000
+    export_batch_size: int = 1000  # rows fetched per round trip by NDJSON exports
+
+    # --- Metrics ---
+    metrics_enabled: bool = True  # /metrics endpoint and per-request timing
+    server_timing: bool = True  # add a Server-Timing header to responses
+
+    # --- Feedback ---
+    feedback_buffer_enabled: bool = False  # write feedback behind, in bulk
+    feedback_buffer_max_size: int = 500  # buffered rows that force a flush
+    feedback_buffer_flush_interval_ms: float = 1000
+    feedback_buffer_max_pending: int = 100_000  # rows kept while writes fail
+    feedback_buffer_max_attempts: int = 5  # failed flushes before a row is dropped
+    feedback_batch_max_size: int = 1000  # feedbacks per POST /feedbacks/batch
+    feedback_rerank: bool = False  # default of /images/search `rerank`
+    feedback_rerank_oversample: int = 4  # candidates re-ranked per result
+    feedback_query_weight: float = 0.1  # boost from feedback on the same query
+    feedback_image_weight: float = 0.02  # boost from feedback on any query
+    feedback_half_life_days: float = 30  # rebuild aggregates after changing it
+    feedback_prior: float = 2.0  # pseudo-votes shrinking sparse feedback to 0
 
     # --- Ingestion ---
     data_dir: str = Field(default="/data", alias="DATA_DIR")
     images_dir: str = Field(default="/data/images", alias="IMAGES_DIR")
+    ingestion_chunk_size: int = 512  # files embedded + committed per checkpoint
+    # "auto" | "reflink" | "hardlink" | "symlink" | "reference" | "copy"
+    image_placement: str = "auto"
+    ingestion_resume_jobs: bool = True  # resume interrupted jobs at startup
+
+    # --- Thumbnails ---
+    thumbnails_dir: str = Field(default="/data/thumbnails", alias="THUMBNAILS_DIR")
+    # variant name -> longest side in pixels, generated at ingestion; {} disables
+    thumbnail_sizes: Dict[str, int] = {"thumb": 256, "preview": 1024}
+    thumbnail_format: str = "webp"  # any format Pillow writes, e.g. "jpeg"
+    thumbnail_quality: int = 80
+    # Cache-Control max-age of originals, whose URLs keep their filename
+    image_cache_max_age_seconds: int = 3600
+
+    # --- Serving ---
+    workers: int = Field(default=1, alias="WEB_CONCURRENCY")  # app.serve processes
+    preload_model: bool = True  # load CLIP before forking workers to share it
 
     class Config:
         """Configuration for Pydantic settings."""
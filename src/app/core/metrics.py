@@ -0,0 +1,285 @@
+"""In-process metrics in the Prometheus text format, and Server-Timing.
+
+Stages are timed with `timed("stage")` (or `observe_stage`) into a single
+histogram labelled by stage. Observing is a bisect and three additions under
+a lock, so instrumentation stays on in production. Gauges such as queue
+depths and pool stats are read from callbacks only when `/metrics` is
+scraped.
+
+`MetricsMiddleware` times every request per route and collects the stages
+timed while serving it, including on threadpool threads, into a
+`Server-Timing` response header. Stages timed on the inference executor run
+outside the request context: they are in the histograms but not the header.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SECONDS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+_registry: List = []
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Histogram with one label, rendered with cumulative buckets.
+
+    Attributes:
+        name (str): Metric name.
+        label (str): Name of the label that tells series apart.
+        buckets (Sequence[float]): Upper bounds, ascending; +Inf is implied.
+    """
+
+    def __init__(
+        self, name: str, help_text: str, buckets: Sequence[float], label: str
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List] = {}  # label value -> [counts, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, label_value: str, value: float) -> None:
+        """Record one observation of the series `label_value`."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                ]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self, label_value: str) -> Tuple[int, float]:
+        """Return the observation count and sum of a series."""
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                return 0, 0.0
+            return sum(series[0]), series[1]
+
+    def render(self) -> Iterator[str]:
+        """Yield the lines of this metric in the Prometheus text format."""
+        with self._lock:
+            series = {
+                key: (list(counts), total)
+                for key, (counts, total) in self._series.items()
+            }
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, (counts, total) in sorted(series.items()):
+            labels = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format(bound)
+                yield f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}'
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {total!r}"
+            yield f"{self.name}_count{{{labels}}} {cumulative}"
+
+
+class Counter:
+    """Monotonic counter with one label.
+
+    Attributes:
+        name (str): Metric name, ending in `_total`.
+        label (str): Name of the label that tells series apart.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        """Add `amount` to the series `label_value`."""
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: str) -> float:
+        """Return the current value of a series."""
+        with self._lock:
+            return self._values.get(label_value, 0)
+
+    def render(self) -> Iterator[str]:
+        """Yield the lines of this metric in the Prometheus text format."""
+        with self._lock:
+            values = dict(self._values)
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for label_value, value in sorted(values.items()):
+            labels = f'{self.label}="{_escape(label_value)}"'
+            yield f"{self.name}{{{labels}}} {_format(value)}"
+
+
+class Gauge:
+    """Gauge with one label whose values are read from callbacks on scrape.
+
+    Attributes:
+        name (str): Metric name.
+        label (str): Name of the label that tells series apart.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._callbacks: Dict[str, Callable[[], float]] = {}
+        _registry.append(self)
+
+    def track(self, label_value: str, callback: Callable[[], float]) -> None:
+        """Report `callback()` as the value of the series `label_value`."""
+        self._callbacks[label_value] = callback
+
+    def render(self) -> Iterator[str]:
+        """Yield the lines of this metric in the Prometheus text format."""
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        for label_value, callback in sorted(self._callbacks.items()):
+            value = callback()
+            if value is not None:
+                labels = f'{self.label}="{_escape(label_value)}"'
+                yield f"{self.name}{{{labels}}} {_format(value)}"
+
+
+STAGE_SECONDS = Histogram(
+    "ifinder_stage_seconds",
+    "Time spent in each processing stage.",
+    SECONDS_BUCKETS,
+    label="stage",
+)
+BATCH_SIZE = Histogram(
+    "ifinder_batch_size", "Items per batch.", SIZE_BUCKETS, label="batch"
+)
+REQUEST_SECONDS = Histogram(
+    "ifinder_http_request_seconds",
+    "Time to serve HTTP requests, by method and route.",
+    SECONDS_BUCKETS,
+    label="route",
+)
+QUEUE_DEPTH = Gauge("ifinder_queue_depth", "Items waiting in a queue.", label="queue")
+ERRORS = Counter(
+    "ifinder_errors_total", "Errors that were logged and skipped.", label="stage"
+)
+DB_POOL = Gauge(
+    "ifinder_db_pool_connections", "Database pool connections.", label="state"
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record the duration of a stage, also for the current request's header."""
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines = [line for metric in _registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Format stage timings as a Server-Timing header value.
+
+    Repeated stages, such as several database queries, are summed.
+    """
+    durations: Dict[str, float] = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    durations["total"] = total
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in durations.items()
+    )
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing requests and adding a Server-Timing header.
+
+    Args:
+        app: The wrapped ASGI application.
+        server_timing_header (bool): Whether to add the Server-Timing header.
+    """
+
+    def __init__(self, app, server_timing_header: bool = True):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing_header:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    server_timing(timings, time.perf_counter() - start),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(
+                f"{scope['method']} {route}", time.perf_counter() - start
+            )
@@ -0,0 +1,76 @@
+"""Cold-start timing.
+
+Startup phases are timed and logged together with the time from process
+start to readiness and to the first served search, which is what an
+autoscaled pod makes its first users wait.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _process_start() -> float:
+    """Start of this process as a `time.time()` timestamp.
+
+    Read from /proc so interpreter start and imports are included; falls back
+    to the time this module was imported elsewhere.
+    """
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # fields after the parenthesized command name start at field 3
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED_AT = _process_start()
+phases: Dict[str, float] = {}
+_first_search_after: Optional[float] = None
+
+
+def since_start() -> float:
+    """Seconds since the process started."""
+    return time.time() - PROCESS_STARTED_AT
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a startup phase under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = time.perf_counter() - start
+
+
+def report_ready() -> float:
+    """Log the time to readiness and the duration of every phase.
+
+    Returns:
+        float: Seconds from process start to readiness.
+    """
+    ready = since_start()
+    logger.info(
+        "Ready %.2fs after process start (%s)",
+        ready,
+        ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items()),
+    )
+    return ready
+
+
+def record_first_search() -> None:
+    """Log the time from process start to the first served search, once."""
+    global _first_search_after
+    if _first_search_after is None:
+        _first_search_after = since_start()
+        logger.info(
+            "First search served %.2fs after process start", _first_search_after
+        )
@@ -1,25 +1,106 @@
 """Database Base Module
-This module sets up the SQLAlchemy base and engine for the application.
-It also registers the pgvector extension for vector support in PostgreSQL.
+This module sets up the SQLAlchemy base and engines for the application.
+Pool sizing, recycling and pre-ping come from `settings.db_*`. Read-only
+sessions (`ReadSessionLocal`, `get_read_db`) go to the replica at
+`settings.database_replica_url` when one is configured, and to the primary
+otherwise.
+
+On PostgreSQL, connections register the pgvector adapters, so NumPy vectors
+are sent as binary parameters, and psycopg prepares a statement server-side
+once a connection has run it `settings.db_prepare_threshold` times, unless
+`settings.db_prepared_statements` is off. Every statement is timed as the
+"db" stage of `app.core.metrics`.
+
+A process forked after using the engines, such as an `app.serve` worker,
+starts with empty pools instead of sharing its parent's connections.
 """
 
+import os
+import time
+from typing import Optional
+
+from app.core import metrics
 from app.core.config import settings
 from pgvector.psycopg import register_vector
-from sqlalchemy import create_engine, event
+from sqlalchemy import Engine, create_engine, event, make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-engine = create_engine(
-    settings.database_url,
-    echo=settings.debug,  # log SQL queries if debug = True
-)
 
+def create_db_engine(url: str) -> Engine:
+    """Create an engine configured from the `db_*` settings.
+
+    Args:
+        url (str): Database URL.
+
+    Returns:
+        Engine: The engine, with pgvector registration and statement timing.
+    """
+    kwargs = {
+        "echo": settings.db_echo,  # log every SQL statement
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":  # SQLite picks its own pool class
+        kwargs.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+        )
+    if parsed.get_driver_name() == "psycopg":
+        threshold = settings.db_prepare_threshold
+        if not settings.db_prepared_statements:
+            threshold = None  # psycopg never prepares
+        kwargs["connect_args"] = {"prepare_threshold": threshold}
+    new_engine = create_engine(url, **kwargs)
+
+    @event.listens_for(new_engine, "connect")
+    def _register_vector(dbapi_conn, _):
+        if new_engine.dialect.name == "postgresql":
+            register_vector(dbapi_conn)
+
+    @event.listens_for(new_engine, "before_cursor_execute")
+    def _start_query(conn, _cursor, _statement, _parameters, _context, _executemany):
+        conn.info["query_started_at"] = time.perf_counter()
+
+    @event.listens_for(new_engine, "after_cursor_execute")
+    def _end_query(conn, _cursor, _statement, _parameters, _context, _executemany):
+        metrics.observe_stage("db", time.perf_counter() - conn.info["query_started_at"])
+
+    return new_engine
+
+
+def _track_pool(prefix: str, pooled: Engine) -> None:
+    def stat(name: str) -> Optional[int]:
+        value = getattr(pooled.pool, name, None)  # absent on NullPool/StaticPool
+        return value() if callable(value) else None
 
-@event.listens_for(engine, "connect")
-def _register_vector(dbapi_conn, _):
-    register_vector(dbapi_conn)
+    metrics.DB_POOL.track(f"{prefix}size", lambda: stat("size"))
+    metrics.DB_POOL.track(f"{prefix}checked_out", lambda: stat("checkedout"))
+    metrics.DB_POOL.track(f"{prefix}idle", lambda: stat("checkedin"))
+    metrics.DB_POOL.track(f"{prefix}overflow", lambda: stat("overflow"))
 
 
+engine = create_db_engine(settings.database_url)
+_track_pool("", engine)
+if settings.database_replica_url:
+    read_engine = create_db_engine(settings.database_replica_url)
+    _track_pool("replica_", read_engine)
+else:
+    read_engine = engine
+
+
+def _reset_pools_after_fork() -> None:
+    # close=False: the parent still owns the inherited sockets
+    engine.dispose(close=False)
+    if read_engine is not engine:
+        read_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 
@@ -30,4 +111,16 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Dependency to get a session for read-only requests.
+
+    It reads from the replica when one is configured, so results may lag
+    recent writes by the replication delay.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
         db.close()
@@ -0,0 +1,138 @@
+"""Bulk writers for high-volume inserts.
+
+On PostgreSQL, image rows are streamed with `COPY ... FROM STDIN (FORMAT
+BINARY)` using pgvector's binary vector encoding, which skips both the ORM
+unit of work and the float -> text -> float round trip of vector literals.
+Other dialects fall back to a single executemany INSERT ... RETURNING.
+"""
+
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+import numpy as np
+from app.db.models.image import Image
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+IMAGE_COPY_COLUMNS = (
+    "id",
+    "filename",
+    "url_path",
+    "content_hash",
+    "embedding",
+    "collection",
+    "source_folder",
+    "created_at",
+)
+IMAGE_COPY_TYPES = (
+    "int4",
+    "text",
+    "text",
+    "text",
+    "vector",
+    "text",
+    "text",
+    "timestamptz",
+)
+
+
+def _allocate_image_ids(db: Session, count: int) -> List[int]:
+    """Reserve `count` ids from the images id sequence in one round trip."""
+    return list(
+        db.scalars(
+            text(
+                "SELECT nextval(pg_get_serial_sequence('images', 'id')) "
+                "FROM generate_series(1, :count)"
+            ),
+            {"count": count},
+        )
+    )
+
+
+def _copy_images(
+    db: Session,
+    ids: List[int],
+    filenames: Sequence[str],
+    url_paths: Sequence[str],
+    content_hashes: Sequence[Optional[str]],
+    embeddings: np.ndarray,
+    collection: Optional[str],
+    source_folder: Optional[str],
+) -> None:
+    created_at = datetime.now(timezone.utc)
+    # the psycopg connection behind the session's transaction
+    dbapi_conn = db.connection().connection.driver_connection
+    statement = (
+        f"COPY images ({', '.join(IMAGE_COPY_COLUMNS)}) FROM STDIN (FORMAT BINARY)"
+    )
+    with dbapi_conn.cursor() as cursor:
+        with cursor.copy(statement) as copy:
+            copy.set_types(IMAGE_COPY_TYPES)
+            for row in zip(ids, filenames, url_paths, content_hashes, embeddings):
+                copy.write_row((*row, collection, source_folder, created_at))
+
+
+def bulk_insert_images(
+    db: Session,
+    filenames: Sequence[str],
+    url_paths: Sequence[str],
+    embeddings: np.ndarray,
+    content_hashes: Optional[Sequence[Optional[str]]] = None,
+    collection: Optional[str] = None,
+    source_folder: Optional[str] = None,
+) -> List[int]:
+    """Insert image rows with their embeddings in bulk.
+
+    The rows are written in the session's transaction; the caller commits.
+
+    Args:
+        db (Session): Database session.
+        filenames (Sequence[str]): Image filenames.
+        url_paths (Sequence[str]): Public URLs, one per filename.
+        embeddings (np.ndarray): Embedding matrix, one row per filename.
+        content_hashes (Sequence[str], optional): Content hashes, one per filename.
+        collection (str, optional): Collection of every row.
+        source_folder (str, optional): Folder every row was ingested from.
+
+    Returns:
+        List[int]: The assigned image ids, in input order.
+    """
+    if not filenames:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if content_hashes is None:
+        content_hashes = [None] * len(filenames)
+
+    if db.get_bind().dialect.name == "postgresql":
+        ids = _allocate_image_ids(db, len(filenames))
+        _copy_images(
+            db,
+            ids,
+            filenames,
+            url_paths,
+            content_hashes,
+            embeddings,
+            collection,
+            source_folder,
+        )
+        return ids
+
+    created_at = datetime.now(timezone.utc)
+    rows = [
+        {
+            "filename": filename,
+            "url_path": url_path,
+            "content_hash": content_hash,
+            "embedding": embedding,
+            "collection": collection,
+            "source_folder": source_folder,
+            "created_at": created_at,
+        }
+        for filename, url_path, content_hash, embedding in zip(
+            filenames, url_paths, content_hashes, embeddings
+        )
+    ]
+    result = db.execute(
+        insert(Image).returning(Image.id, sort_by_parameter_order=True), rows
+    )
+    return list(result.scalars())
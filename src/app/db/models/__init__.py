@@ -0,0 +1,15 @@
+"""Database models. Importing this package registers every model on `Base`."""
+
+from app.db.models.feedback import Feedback
+from app.db.models.feedback_aggregate import FeedbackAggregate
+from app.db.models.image import Image
+from app.db.models.ingestion_job import IngestionJob
+from app.db.models.ingestion_manifest import IngestionManifestEntry
+
+__all__ = [
+    "Feedback",
+    "FeedbackAggregate",
+    "Image",
+    "IngestionJob",
+    "IngestionManifestEntry",
+]
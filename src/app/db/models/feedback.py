@@ -1,9 +1,16 @@
 """Feedback Model"""
 
-from datetime import datetime, timezone
-
 from app.db.base import Base
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, Text
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    Text,
+    func,
+)
 from sqlalchemy.orm import relationship
 
 
@@ -17,6 +24,8 @@ class Feedback(Base):
     score = Column(Float, nullable=True)
 
     is_good = Column(Boolean, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
 
     image = relationship("Image", back_populates="feedbacks")
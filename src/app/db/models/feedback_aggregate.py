@@ -0,0 +1,24 @@
+"""Feedback Aggregate Model"""
+
+from app.db.base import Base
+from sqlalchemy import Column, Float, ForeignKey, Integer, Text
+
+
+class FeedbackAggregate(Base):
+    """Time-decayed good/bad feedback counts of an image for one query.
+
+    Rows with an empty `query` aggregate the image's feedback over every
+    query. Counts are stored scaled to a fixed epoch so that adding feedback
+    is a plain increment; see `app.services.feedback_ranking`.
+    """
+
+    __tablename__ = "feedback_aggregates"
+    query = Column(Text, primary_key=True)  # normalized query, "" = any query
+    image_id = Column(
+        Integer,
+        ForeignKey("images.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    good = Column(Float, nullable=False, default=0.0)
+    bad = Column(Float, nullable=False, default=0.0)
@@ -1,10 +1,8 @@
 """Image Model"""
 
-from datetime import datetime, timezone
-
 from app.db.base import Base
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy import Column, DateTime, Integer, String, func
 from sqlalchemy.orm import relationship
 
 
@@ -16,8 +14,14 @@ class Image(Base):
     filename = Column(String, unique=True, index=True, nullable=False)
     url_path = Column(String, nullable=False)
     embedding = Column(Vector(512))  # CLIP ViT-B/32
+    content_hash = Column(String(64), index=True, nullable=True)  # sha256 hex
 
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    # search filters (see app.index.base.SearchFilters)
+    collection = Column(String, index=True, nullable=True)
+    source_folder = Column(String, index=True, nullable=True)
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
+    )
 
     feedbacks = relationship(
         "Feedback", back_populates="image", cascade="all, delete-orphan"
@@ -0,0 +1,46 @@
+"""Ingestion Job Model"""
+
+from datetime import datetime, timezone
+
+from app.db.base import Base
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+ACTIVE_JOB_STATUSES = (JOB_PENDING, JOB_RUNNING)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class IngestionJob(Base):
+    """Ingestion job model for tracking background folder ingestions.
+
+    The job is checkpointed by `next_offset`: the index (into the sorted list
+    of files found in `folder`) of the first file not yet committed. A job
+    that was interrupted resumes from that offset.
+    """
+
+    __tablename__ = "ingestion_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    folder = Column(String, nullable=False)
+    collection = Column(String, nullable=True)  # given to the ingested images
+    status = Column(String, nullable=False, default=JOB_PENDING, index=True)
+
+    total = Column(Integer, nullable=False, default=0)  # files found in folder
+    next_offset = Column(Integer, nullable=False, default=0)  # checkpoint
+    indexed = Column(Integer, nullable=False, default=0)  # new images committed
+    skipped = Column(Integer, nullable=False, default=0)  # files not decoded
+    error = Column(Text, nullable=True)
+
+    # offset the current run started from, used to compute throughput
+    started_offset = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, default=_utcnow)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=_utcnow, onupdate=_utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,21 @@
+"""Ingestion Manifest Model"""
+
+from app.db.base import Base
+from sqlalchemy import BigInteger, Column, Integer, String, UniqueConstraint
+
+
+class IngestionManifestEntry(Base):
+    """Last seen stat and content hash of a file in an ingested folder.
+
+    Re-ingesting a folder only re-hashes files whose size or mtime changed
+    since they were recorded here.
+    """
+
+    __tablename__ = "ingestion_manifest"
+    __table_args__ = (UniqueConstraint("folder", "path"),)
+    id = Column(Integer, primary_key=True, index=True)
+    folder = Column(String, nullable=False)
+    path = Column(String, nullable=False)  # relative to folder
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    content_hash = Column(String(64), nullable=False)
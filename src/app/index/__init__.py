@@ -0,0 +1,72 @@
+"""Vector search backends.
+
+`settings.search_backend` selects the backend used by `/images/search`:
+"pgvector" queries the HNSW index in PostgreSQL, "exact" searches an
+in-process memory-mapped matrix, and "auto" picks pgvector on PostgreSQL and
+the exact index otherwise.
+"""
+
+from typing import Optional
+
+from app.core.config import settings
+from app.db.base import engine
+from app.db.models.image import Image
+from app.index.base import SearchBackend, SearchFilters
+from app.index.exact import ExactIndex
+from app.index.pgvector import PgvectorBackend
+
+SEARCH_BACKENDS = ("auto", "pgvector", "exact")
+
+
+def create_backend(name: Optional[str] = None) -> SearchBackend:
+    """Create a search backend.
+
+    Args:
+        name (str, optional): One of `SEARCH_BACKENDS`. Defaults to
+            `settings.search_backend`.
+
+    Returns:
+        SearchBackend: The new backend.
+    """
+    name = name or settings.search_backend
+    if name == "auto":
+        name = "pgvector" if engine.dialect.name == "postgresql" else "exact"
+    if name == "pgvector":
+        return PgvectorBackend(
+            storage=settings.vector_storage,
+            oversample=settings.rerank_oversample,
+            ef_search=settings.hnsw_ef_search,
+            iterative_scan=settings.hnsw_iterative_scan,
+        )
+    if name == "exact":
+        return ExactIndex(
+            settings.exact_index_dir,
+            dim=Image.embedding.type.dim,
+            dtype=settings.exact_index_dtype,
+        )
+    raise ValueError(f"Unknown search backend: {name}")
+
+
+_backend = None
+
+
+def get_search_backend() -> SearchBackend:
+    """Get the global search backend, creating it if necessary.
+
+    Returns:
+        SearchBackend: The configured search backend.
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+
+__all__ = [
+    "ExactIndex",
+    "PgvectorBackend",
+    "SearchBackend",
+    "SearchFilters",
+    "create_backend",
+    "get_search_backend",
+]
@@ -0,0 +1,227 @@
+"""Search Backend Interface
+
+Besides ranking by cosine similarity, backends restrict searches to images
+matching `SearchFilters`, applied in the same query as the ranking, and run
+hybrid searches fusing the vector ranking with a lexical ranking of
+filenames by reciprocal rank fusion (RRF): an image ranked r_v by vector
+and r_l by filename scores 1 / (k + r_v) + 1 / (k + r_l), missing ranks
+adding nothing.
+"""
+
+import operator
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields
+from datetime import datetime
+from functools import reduce
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from app.db.models.image import Image
+from sqlalchemy import case, or_, select
+from sqlalchemy.orm import Session, defer
+
+LEXICAL_MAX_TERMS = 16
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """Metadata restrictions of a search, all of which must hold.
+
+    Attributes:
+        collection (str, optional): Collection the image was ingested into.
+        folder (str, optional): Folder the image was ingested from.
+        created_after (datetime, optional): Earliest indexing time, inclusive.
+        created_before (datetime, optional): Latest indexing time, exclusive.
+        filename (str, optional): Text the filename contains, in any case.
+    """
+
+    collection: Optional[str] = None
+    folder: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    filename: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) is not None for f in fields(self))
+
+    def clauses(self) -> list:
+        """SQL conditions on `Image` selecting the matching images."""
+        clauses = []
+        if self.collection is not None:
+            clauses.append(Image.collection == self.collection)
+        if self.folder is not None:
+            clauses.append(Image.source_folder == self.folder)
+        if self.created_after is not None:
+            clauses.append(Image.created_at >= self.created_after)
+        if self.created_before is not None:
+            clauses.append(Image.created_at < self.created_before)
+        if self.filename is not None:
+            clauses.append(
+                Image.filename.ilike(_like_pattern(self.filename), escape="\\")
+            )
+        return clauses
+
+
+def lexical_terms(query: str) -> List[str]:
+    """Distinct lowercase words of a query, as matched against filenames."""
+    terms = re.findall(r"[^\W_]+", query.lower())
+    return list(dict.fromkeys(terms))[:LEXICAL_MAX_TERMS]
+
+
+def lexical_search(
+    db: Session, query: str, limit: int, filters: Optional[SearchFilters] = None
+) -> List[Tuple[Image, float]]:
+    """Rank images by the share of query words their filename contains.
+
+    This portable ranking scans the filenames; the pgvector backend uses a
+    full-text index instead.
+
+    Returns:
+        List[Tuple[Image, float]]: (image, share of matched words) pairs,
+        best first, without the images' `embedding`.
+    """
+    terms = lexical_terms(query)
+    if not terms:
+        return []
+    matches = [
+        Image.filename.ilike(_like_pattern(term), escape="\\") for term in terms
+    ]
+    matched = reduce(operator.add, (case((match, 1), else_=0) for match in matches))
+    score = (matched * 1.0 / len(terms)).label("score")
+    stmt = (
+        select(Image, score)
+        .options(defer(Image.embedding))
+        .where(or_(*matches), *(filters.clauses() if filters else []))
+        .order_by(score.desc(), Image.id)
+        .limit(limit)
+    )
+    return [(img, float(value)) for img, value in db.execute(stmt).all()]
+
+
+def rrf_fuse(
+    rankings: Sequence[Sequence[int]], rrf_k: int = 60
+) -> List[Tuple[int, float]]:
+    """Fuse rankings of image ids by reciprocal rank fusion.
+
+    Args:
+        rankings (Sequence[Sequence[int]]): Image ids of each ranking, best first.
+        rrf_k (int): Rank offset damping the weight of the first ranks.
+
+    Returns:
+        List[Tuple[int, float]]: (image id, fused score) pairs, best first;
+        ties are broken by id.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, image_id in enumerate(ranking, start=1):
+            scores[image_id] = scores.get(image_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class SearchBackend(ABC):
+    """Nearest-neighbour search over image embeddings.
+
+    Backends rank images by cosine similarity to a unit-norm query vector.
+    """
+
+    name: str = ""
+
+    def prepare(self, session_factory) -> None:
+        """Load or build the index before serving. No-op by default."""
+
+    def add(self, ids: Sequence[int], embeddings: np.ndarray) -> None:
+        """Make committed images searchable. No-op for indexes kept by the DB."""
+
+    @abstractmethod
+    def search(
+        self,
+        db: Session,
+        query_vec: np.ndarray,
+        top_k: int,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+    ) -> List[Tuple[Image, float]]:
+        """Find the images closest to a query vector.
+
+        Args:
+            db (Session): Database session.
+            query_vec (np.ndarray): Unit-norm query embedding.
+            top_k (int): Number of results.
+            ef_search (int, optional): HNSW candidate list size; ignored by
+                exact backends.
+            filters (SearchFilters, optional): Only rank matching images.
+
+        Returns:
+            List[Tuple[Image, float]]: (image, cosine similarity) pairs, best
+            first. The `embedding` column of the images is not loaded.
+        """
+
+    def search_many(
+        self,
+        db: Session,
+        query_vecs: np.ndarray,
+        top_ks: Sequence[int],
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[Image, float]]]:
+        """Find the images closest to each of several query vectors.
+
+        Backends override this to answer all queries in one pass; the default
+        runs `search` once per query.
+
+        Args:
+            db (Session): Database session.
+            query_vecs (np.ndarray): Unit-norm query embeddings, one per row.
+            top_ks (Sequence[int]): Number of results of each query.
+            ef_search (int, optional): HNSW candidate list size.
+
+        Returns:
+            List[List[Tuple[Image, float]]]: The results of each query, as
+            returned by `search`.
+        """
+        return [
+            self.search(db, query_vec, top_k, ef_search=ef_search)
+            for query_vec, top_k in zip(query_vecs, top_ks)
+        ]
+
+    def search_hybrid(
+        self,
+        db: Session,
+        query_vec: np.ndarray,
+        query: str,
+        top_k: int,
+        candidates: int,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+        rrf_k: int = 60,
+    ) -> List[Tuple[Image, float]]:
+        """Fuse the vector ranking with the filename ranking of a text query.
+
+        Backends override this to fuse in the database; the default runs
+        `search` and `lexical_search` and fuses their results with `rrf_fuse`.
+
+        Args:
+            db (Session): Database session.
+            query_vec (np.ndarray): Unit-norm embedding of `query`.
+            query (str): Text query, whose words are matched against filenames.
+            top_k (int): Number of results.
+            candidates (int): Results of each ranking that are fused.
+            ef_search (int, optional): HNSW candidate list size.
+            filters (SearchFilters, optional): Only rank matching images.
+            rrf_k (int): Reciprocal rank fusion constant.
+
+        Returns:
+            List[Tuple[Image, float]]: (image, fused score) pairs, best first.
+        """
+        vector = self.search(db, query_vec, candidates, ef_search, filters)
+        lexical = lexical_search(db, query, candidates, filters)
+        images = {img.id: img for img, _ in vector + lexical}
+        fused = rrf_fuse(
+            [[img.id for img, _ in vector], [img.id for img, _ in lexical]], rrf_k
+        )
+        return [(images[image_id], score) for image_id, score in fused[:top_k]]
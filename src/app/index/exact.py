@@ -0,0 +1,377 @@
+"""Exact In-Process Search Backend
+
+Keeps every embedding in a memory-mapped matrix next to an array of image
+ids and answers queries with a matrix-vector product and `argpartition`.
+No database extension is needed, so it serves SQLite and small deployments.
+
+Layout of `index_dir`:
+    embeddings.bin  row-major (n, dim) matrix of float32 or float16
+    ids.bin         (n,) int64 image ids
+    index.lock      advisory lock shared by every process using the index
+
+Both files are append-only. When an image is re-embedded its id is appended
+again and only its last row is searched. Other processes pick up appended
+rows on their next search. Appends and rebuilds hold an exclusive `flock` on
+`index.lock` and mapping the files a shared one, so the rows of processes
+writing at once, such as `app.serve` workers, never interleave and no
+process maps a half-rebuilt index. Searches never wait for the lock: while
+another process writes, they keep their current mapping.
+
+Each mapping is published as one immutable `_Snapshot`, and every search
+reads a single snapshot, so rows appended during a search never meet the
+ids or mask of another mapping.
+
+Filtered searches read the ids of the matching images from the database's
+metadata indexes and score only their rows.
+"""
+
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from app.db.models.image import Image
+from app.index.base import SearchBackend, SearchFilters
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, defer
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.bin"
+IDS_FILE = "ids.bin"
+LOCK_FILE = "index.lock"
+REBUILD_BATCH = 10000
+SCORE_BLOCK = 1 << 16  # rows scored per block when upcasting float16
+QUERY_BLOCK = 64  # queries scored per matrix product, bounds the score matrix
+
+
+class _Snapshot(NamedTuple):
+    """One consistent mapping of the index files."""
+
+    embeddings: np.ndarray  # (n, dim)
+    ids: np.ndarray  # (n,) image id of each row
+    valid: np.ndarray  # (n,) whether the row is its id's live one
+
+
+class ExactIndex(SearchBackend):
+    """Exact cosine search over a memory-mapped embedding matrix.
+
+    Attributes:
+        index_dir (Path): Directory holding the index files.
+        dim (int): Embedding dimension.
+        dtype (np.dtype): Storage dtype of the embeddings.
+    """
+
+    name = "exact"
+
+    def __init__(self, index_dir: str, dim: int = 512, dtype: str = "float32"):
+        self.index_dir = Path(index_dir)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._snapshot = self._empty_snapshot()
+        self._ids_stamp: Optional[Tuple[int, int]] = (-1, -1)
+
+    @property
+    def _embeddings_path(self) -> Path:
+        return self.index_dir / EMBEDDINGS_FILE
+
+    @property
+    def _ids_path(self) -> Path:
+        return self.index_dir / IDS_FILE
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool, wait: bool = True) -> Iterator[bool]:
+        """Hold the index lock against other processes.
+
+        Yields:
+            bool: Whether the lock is held, always True when waiting for it.
+        """
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not wait:
+            operation |= fcntl.LOCK_NB
+        with open(self.index_dir / LOCK_FILE, "ab") as lock_file:
+            try:
+                fcntl.flock(lock_file, operation)
+            except BlockingIOError:
+                yield False
+                return
+            yield True  # closing the file releases the lock
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        """Inode and size of the ids file: both change when it is rebuilt."""
+        try:
+            stat = self._ids_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def __len__(self) -> int:
+        return int(self._current().valid.sum())
+
+    def _empty_snapshot(self) -> _Snapshot:
+        return _Snapshot(
+            np.zeros((0, self.dim), dtype=self.dtype),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=bool),
+        )
+
+    def _current(self) -> _Snapshot:
+        """Return the current snapshot, remapping the files if they changed.
+
+        While the index is being written, the current snapshot is returned.
+        """
+        if self._stamp() != self._ids_stamp and self._lock.acquire(blocking=False):
+            try:
+                with self._file_lock(exclusive=False, wait=False) as locked:
+                    if locked:
+                        self._load()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def _load(self) -> None:
+        """Map the index files; callers hold the lock."""
+        row_bytes = self.dim * self.dtype.itemsize
+        stamp = self._stamp()
+        ids_size = stamp[1] if stamp is not None else 0
+        emb_size = (
+            self._embeddings_path.stat().st_size
+            if self._embeddings_path.exists()
+            else 0
+        )
+        # embeddings are appended before ids, so a torn append only leaves
+        # unreferenced embedding rows behind
+        count = min(ids_size // 8, emb_size // row_bytes)
+        if count == 0:
+            snapshot = self._empty_snapshot()
+        else:
+            embeddings = np.memmap(
+                self._embeddings_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(count, self.dim),
+            )
+            ids = np.memmap(self._ids_path, dtype=np.int64, mode="r", shape=(count,))
+            # only the last row of every id is live
+            _, last_from_end = np.unique(ids[::-1], return_index=True)
+            valid = np.zeros(count, dtype=bool)
+            valid[count - 1 - last_from_end] = True
+            snapshot = _Snapshot(embeddings, ids, valid)
+        self._snapshot = snapshot  # published in a single assignment
+        self._ids_stamp = stamp
+
+    def _append(self, ids: Sequence[int], embeddings: np.ndarray) -> None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._embeddings_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self._ids_path, "ab") as f:
+            f.write(ids.tobytes())
+
+    def add(self, ids: Sequence[int], embeddings: np.ndarray) -> None:
+        if len(ids) == 0:
+            return
+        with self._lock, self._file_lock(exclusive=True):
+            self._append(ids, embeddings)
+            self._load()
+
+    def rebuild(self, session_factory) -> None:
+        """Rebuild the index files from the embeddings stored in the database.
+
+        Processes that mapped the old files keep searching them until the new
+        ones are complete.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            self._rebuild(session_factory)
+
+    def _rebuild(self, session_factory) -> None:
+        self._embeddings_path.unlink(missing_ok=True)
+        self._ids_path.unlink(missing_ok=True)
+        with session_factory() as db:
+            last_id = 0
+            while True:
+                rows = db.execute(
+                    select(Image.id, Image.embedding)
+                    .where(Image.embedding.isnot(None), Image.id > last_id)
+                    .order_by(Image.id)
+                    .limit(REBUILD_BATCH)
+                ).all()
+                if not rows:
+                    break
+                self._append(
+                    [row.id for row in rows],
+                    np.vstack([np.asarray(row.embedding) for row in rows]),
+                )
+                last_id = rows[-1].id
+        self._load()
+
+    def prepare(self, session_factory) -> None:
+        """Map the index, rebuilding it if it is out of sync with the database."""
+        with session_factory() as db:
+            expected = db.scalar(
+                select(func.count(Image.id)).where(Image.embedding.isnot(None))
+            )
+        if len(self) == expected:
+            return
+        with self._lock, self._file_lock(exclusive=True):
+            self._load()  # another process may have rebuilt it meanwhile
+            indexed = int(self._snapshot.valid.sum())
+            if indexed != expected:
+                logger.info(
+                    "Rebuilding exact index (%s rows indexed, %s in database)",
+                    indexed,
+                    expected,
+                )
+                self._rebuild(session_factory)
+
+    @staticmethod
+    def _scores(snapshot: _Snapshot, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row to each query, -inf for stale rows.
+
+        Returns:
+            np.ndarray: (n, len(queries)) scores.
+        """
+        embeddings = snapshot.embeddings
+        if embeddings.dtype == np.float32:
+            scores = np.asarray(embeddings @ queries.T)
+        else:
+            # numpy has no fast float16 matmul: upcast block by block
+            scores = np.empty((len(embeddings), len(queries)), dtype=np.float32)
+            for start in range(0, len(embeddings), SCORE_BLOCK):
+                block = embeddings[start : start + SCORE_BLOCK].astype(np.float32)
+                scores[start : start + SCORE_BLOCK] = block @ queries.T
+        scores[~snapshot.valid] = -np.inf
+        return scores
+
+    def top_k_many(
+        self, query_vecs: np.ndarray, top_ks: Sequence[int]
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Find the best ids of several query vectors at once.
+
+        Queries are scored `QUERY_BLOCK` at a time with one matrix product,
+        which reads the embedding matrix once per block instead of once per
+        query.
+
+        Args:
+            query_vecs (np.ndarray): Unit-norm query embeddings, one per row.
+            top_ks (Sequence[int]): Number of results of each query.
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: Ids and scores of each
+            query, best first.
+        """
+        snapshot = self._current()
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if len(snapshot.ids) == 0:
+            return [empty for _ in top_ks]
+        ids, live = snapshot.ids, int(snapshot.valid.sum())
+
+        queries = np.asarray(query_vecs, dtype=np.float32).reshape(-1, self.dim)
+        results = []
+        for start in range(0, len(queries), QUERY_BLOCK):
+            block_ks = [min(k, live) for k in top_ks[start : start + QUERY_BLOCK]]
+            scores = self._scores(snapshot, queries[start : start + QUERY_BLOCK])
+            max_k = max(block_ks)
+            if max_k <= 0:
+                results.extend(empty for _ in block_ks)
+                continue
+            top = np.argpartition(-scores, max_k - 1, axis=0)[:max_k]
+            for column, k in enumerate(block_ks):
+                rows = top[:, column]
+                rows = rows[np.argsort(-scores[rows, column])][:k]
+                results.append((np.asarray(ids[rows]), scores[rows, column]))
+        return results
+
+    def top_k(self, query_vec: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the ids with the highest cosine similarity to a query vector.
+
+        Args:
+            query_vec (np.ndarray): Unit-norm query embedding.
+            top_k (int): Number of results.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Ids and scores, best first.
+        """
+        return self.top_k_many(np.asarray(query_vec)[None], [top_k])[0]
+
+    def top_k_among(
+        self, query_vec: np.ndarray, top_k: int, allowed_ids: Sequence[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Like `top_k`, scoring only the rows of `allowed_ids`.
+
+        Args:
+            query_vec (np.ndarray): Unit-norm query embedding.
+            top_k (int): Number of results.
+            allowed_ids (Sequence[int]): Ids the results are chosen from.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Ids and scores, best first.
+        """
+        snapshot = self._current()
+        rows = np.zeros(0, dtype=np.int64)
+        if len(snapshot.ids) and len(allowed_ids):
+            allowed = np.asarray(allowed_ids, dtype=np.int64)
+            rows = np.flatnonzero(snapshot.valid & np.isin(snapshot.ids, allowed))
+        k = min(top_k, len(rows))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(query_vec, dtype=np.float32).reshape(self.dim)
+        scores = snapshot.embeddings[rows].astype(np.float32, copy=False) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return np.asarray(snapshot.ids[rows[top]]), scores[top]
+
+    def _load_images(self, db: Session, ids: Sequence[int]) -> Dict[int, Image]:
+        return {
+            img.id: img
+            for img in db.scalars(
+                select(Image)
+                .options(defer(Image.embedding))
+                .where(Image.id.in_(list(ids)))
+            )
+        }
+
+    def search(
+        self,
+        db: Session,
+        query_vec: np.ndarray,
+        top_k: int,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+    ) -> List[Tuple[Image, float]]:
+        if not filters:
+            return self.search_many(db, np.asarray(query_vec)[None], [top_k])[0]
+        allowed = db.scalars(select(Image.id).where(*filters.clauses())).all()
+        ids, scores = self.top_k_among(query_vec, top_k, allowed)
+        images = self._load_images(db, ids.tolist())
+        return [
+            (images[image_id], float(score))
+            for image_id, score in zip(ids.tolist(), scores)
+            if image_id in images
+        ]
+
+    def search_many(
+        self,
+        db: Session,
+        query_vecs: np.ndarray,
+        top_ks: Sequence[int],
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[Image, float]]]:
+        ranked = self.top_k_many(query_vecs, top_ks)
+        images = self._load_images(
+            db, {int(i) for ids, _ in ranked for i in ids.tolist()}
+        )
+        return [
+            [
+                (images[image_id], float(score))
+                for image_id, score in zip(ids.tolist(), scores)
+                if image_id in images
+            ]
+            for ids, scores in ranked
+        ]
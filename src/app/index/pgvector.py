@@ -0,0 +1,344 @@
+"""pgvector Search Backend
+
+Three storage modes are supported, all over the float32 `embedding` column:
+
+- "float32": ORDER BY cosine distance on the full-precision HNSW index.
+- "halfvec": candidates come from an HNSW index on `embedding::halfvec`
+  (half the index size), then are re-ranked in full precision.
+- "binary": candidates come from an HNSW index on the binary-quantized
+  embedding searched by Hamming distance (1/32 of the index size), then are
+  re-ranked in full precision.
+
+Quantized modes fetch `top_k * oversample` candidates, with their float32
+embeddings, from the index scan and re-rank them in an outer query. The
+expression indexes are created by migration 7d2c9a4e1f36.
+
+`search_many` answers a batch of queries in one statement: the query vectors
+and limits are unnested into rows and each row runs its own index scan
+through a LATERAL join.
+
+`search` sends the query vector as a binary `vector` parameter (psycopg's
+pgvector dumper) instead of a text literal, and its SQL text only depends on
+the storage mode and filters, so psycopg prepares it server-side after
+`settings.db_prepare_threshold` runs on a connection.
+
+Filters are WHERE clauses of the index scan itself. Selective filters are
+served by the B-tree indexes on the metadata columns; otherwise HNSW
+iterative scans (pgvector >= 0.8, `hnsw.iterative_scan`) keep walking the
+graph until enough rows pass the filters instead of returning fewer than
+`top_k`.
+
+`search_hybrid` fuses the vector ranking with a full-text ranking of
+filenames (expression GIN index `FILENAME_TSVECTOR`, migration
+e3b5a7c9d2f1) by RRF in a single statement.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from app.db.models.image import Image
+from app.index.base import SearchBackend, SearchFilters, lexical_terms
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    Integer,
+    Text,
+    bindparam,
+    cast,
+    column,
+    func,
+    literal_column,
+    select,
+    text,
+    true,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.types import UserDefinedType
+
+VECTOR_STORAGES = ("float32", "halfvec", "binary")
+ITERATIVE_SCANS = ("off", "strict_order", "relaxed_order")
+MAX_EF_SEARCH = 1000  # pgvector limit
+# must match the expression of the ix_images_filename_fts index
+FILENAME_TSVECTOR = (
+    "to_tsvector('simple'::regconfig, translate(images.filename, '._-', '   '))"
+)
+
+
+class BinaryVector(UserDefinedType):
+    """`vector` bind type handing NumPy arrays to the driver unchanged.
+
+    `pgvector.sqlalchemy.Vector` converts parameters to their text form;
+    without a bind processor the array reaches psycopg, whose pgvector
+    dumper sends it in the binary format.
+    """
+
+    cache_ok = True
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+
+    def get_col_spec(self, **kw) -> str:
+        return "VECTOR" if self.dim is None else f"VECTOR({self.dim})"
+
+
+class PgvectorBackend(SearchBackend):
+    """Search with pgvector's HNSW indexes.
+
+    Attributes:
+        storage (str): One of `VECTOR_STORAGES`.
+        oversample (int): Candidates fetched per result in quantized modes.
+        ef_search (int): Default `hnsw.ef_search`, raised to cover the LIMIT.
+        iterative_scan (str): `hnsw.iterative_scan` of filtered searches, one
+            of `ITERATIVE_SCANS`.
+    """
+
+    name = "pgvector"
+
+    def __init__(
+        self,
+        storage: str = "float32",
+        oversample: int = 4,
+        ef_search: int = 40,
+        iterative_scan: str = "relaxed_order",
+    ):
+        if storage not in VECTOR_STORAGES:
+            raise ValueError(f"Unknown vector storage: {storage}")
+        if iterative_scan not in ITERATIVE_SCANS:
+            raise ValueError(f"Unknown iterative scan mode: {iterative_scan}")
+        self.storage = storage
+        self.oversample = max(1, oversample)
+        self.ef_search = ef_search
+        self.iterative_scan = iterative_scan
+
+    def _approximate_distance(self, qvec):
+        """Distance expression matching the quantized expression index."""
+        dim = Image.embedding.type.dim
+        if self.storage == "halfvec":
+            return cast(Image.embedding, HALFVEC(dim)).cosine_distance(
+                cast(qvec, HALFVEC(dim))
+            )
+        return cast(func.binary_quantize(Image.embedding), BIT(dim)).hamming_distance(
+            cast(func.binary_quantize(cast(qvec, Vector(dim))), BIT(dim))
+        )
+
+    def _set_ef_search(
+        self,
+        db: Session,
+        ef_search: Optional[int],
+        limit: int,
+        filtered: bool = False,
+    ):
+        # the HNSW scan returns at most ef_search rows, so it must cover the
+        # LIMIT; set_config(..., true) is SET LOCAL, scoped to this transaction
+        ef_search = min(max(ef_search or self.ef_search, limit), MAX_EF_SEARCH)
+        statement = "SELECT set_config('hnsw.ef_search', :ef_search, true)"
+        params = {"ef_search": str(ef_search)}
+        if filtered and self.iterative_scan != "off":
+            # rows dropped by the filters make the scan continue
+            statement += ", set_config('hnsw.iterative_scan', :iterative_scan, true)"
+            params["iterative_scan"] = self.iterative_scan
+        db.execute(text(statement), params)
+
+    def _nearest(self, qvec, limit: int, clauses: list):
+        """Select (id, distance) of the `limit` nearest matching images.
+
+        In quantized modes, the quantized index scan selects `limit *
+        oversample` candidates with their embeddings, which are re-ranked by
+        exact distance without going back to the images table. Filters only
+        apply to the index scan.
+        """
+        if self.storage == "float32":
+            distance = Image.embedding.cosine_distance(qvec)
+            return (
+                select(Image.id.label("id"), distance.label("distance"))
+                .where(Image.embedding.isnot(None), *clauses)
+                .order_by(distance)
+                .limit(limit)
+            )
+        candidates = (
+            select(Image.id.label("id"), Image.embedding.label("embedding"))
+            .where(Image.embedding.isnot(None), *clauses)
+            .order_by(self._approximate_distance(qvec))
+            .limit(limit * self.oversample)
+            .subquery("candidates")
+        )
+        distance = candidates.c.embedding.cosine_distance(qvec)
+        return (
+            select(candidates.c.id, distance.label("distance"))
+            .order_by(distance)
+            .limit(limit)
+        )
+
+    def search(
+        self,
+        db: Session,
+        query_vec: np.ndarray,
+        top_k: int,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+    ) -> List[Tuple[Image, float]]:
+        clauses = filters.clauses() if filters else []
+        limit = top_k if self.storage == "float32" else top_k * self.oversample
+        self._set_ef_search(db, ef_search, limit, filtered=bool(clauses))
+        stmt = self._search_statement(query_vec, top_k, clauses)
+        rows = [(img, float(score)) for img, score in db.execute(stmt).all()]
+        if clauses and self.iterative_scan == "relaxed_order":
+            rows.sort(key=lambda row: row[1], reverse=True)  # may be slightly off
+        return rows
+
+    def _search_statement(self, query_vec: np.ndarray, top_k: int, clauses: list):
+        # order by cosine distance ASC (smaller = closer) and also compute a
+        # "score" = 1 - distance to match cosine similarity
+        nearest = self._nearest(_query_param(query_vec), top_k, clauses).subquery(
+            "nearest"
+        )
+        return (
+            select(Image, (1 - nearest.c.distance).label("score"))
+            .join(nearest, Image.id == nearest.c.id)
+            .options(defer(Image.embedding))
+            .order_by(nearest.c.distance)  # nearest first
+        )
+
+    def search_hybrid(
+        self,
+        db: Session,
+        query_vec: np.ndarray,
+        query: str,
+        top_k: int,
+        candidates: int,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+        rrf_k: int = 60,
+    ) -> List[Tuple[Image, float]]:
+        terms = lexical_terms(query)
+        if not terms:
+            return super().search_hybrid(
+                db, query_vec, query, top_k, candidates, ef_search, filters, rrf_k
+            )
+        clauses = filters.clauses() if filters else []
+        oversample = 1 if self.storage == "float32" else self.oversample
+        self._set_ef_search(
+            db, ef_search, candidates * oversample, filtered=bool(clauses)
+        )
+
+        nearest = self._nearest(_query_param(query_vec), candidates, clauses).subquery()
+        vector = select(
+            nearest.c.id,
+            func.row_number().over(order_by=nearest.c.distance).label("rank"),
+        ).subquery("vector")
+
+        # words are alphanumeric, so joining them with | is a valid tsquery
+        tsvector = literal_column(FILENAME_TSVECTOR)
+        tsquery = func.to_tsquery(
+            literal_column("'simple'::regconfig"),
+            bindparam("lexical_query", " | ".join(terms)),
+        )
+        relevance = func.ts_rank(tsvector, tsquery)
+        matches = (
+            select(Image.id.label("id"), relevance.label("relevance"))
+            .where(tsvector.op("@@")(tsquery), *clauses)
+            .order_by(relevance.desc(), Image.id)
+            .limit(candidates)
+            .subquery()
+        )
+        lexical = select(
+            matches.c.id,
+            func.row_number()
+            .over(order_by=(matches.c.relevance.desc(), matches.c.id))
+            .label("rank"),
+        ).subquery("lexical")
+
+        def reciprocal(rank):
+            return func.coalesce(1.0 / (rrf_k + rank), 0.0)
+
+        score = (reciprocal(vector.c.rank) + reciprocal(lexical.c.rank)).label("score")
+        stmt = (
+            select(Image, score)
+            .select_from(vector)
+            .join(lexical, vector.c.id == lexical.c.id, full=True)
+            .join(Image, Image.id == func.coalesce(vector.c.id, lexical.c.id))
+            .options(defer(Image.embedding))
+            .order_by(score.desc(), Image.id)
+            .limit(top_k)
+        )
+        return [(img, float(score)) for img, score in db.execute(stmt).all()]
+
+    def search_many(
+        self,
+        db: Session,
+        query_vecs: np.ndarray,
+        top_ks: Sequence[int],
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[Image, float]]]:
+        if len(top_ks) == 0:
+            return []
+        dim = Image.embedding.type.dim
+        oversample = 1 if self.storage == "float32" else self.oversample
+        self._set_ef_search(db, ef_search, max(top_ks) * oversample)
+
+        # one row per query: (vec, k, ord); vectors travel as text literals
+        queries = (
+            func.unnest(
+                cast([_vector_literal(vec) for vec in query_vecs], ARRAY(Text)),
+                cast(list(top_ks), ARRAY(Integer)),
+            )
+            .table_valued(
+                column("vec", Text), column("k", Integer), with_ordinality="ord"
+            )
+            .render_derived(name="q")
+        )
+        qvec = cast(queries.c.vec, Vector(dim))
+
+        if self.storage == "float32":
+            distance = Image.embedding.cosine_distance(qvec)
+            neighbours = (
+                select(Image.id.label("id"), (1 - distance).label("score"))
+                .where(Image.embedding.isnot(None))
+                .order_by(distance)
+                .limit(queries.c.k)
+                .correlate(queries)
+            )
+        else:
+            candidates = (
+                select(Image.id.label("id"), Image.embedding.label("embedding"))
+                .where(Image.embedding.isnot(None))
+                .order_by(self._approximate_distance(qvec))
+                .limit(queries.c.k * oversample)
+                .correlate(queries)
+                .lateral("candidates")
+            )
+            distance = candidates.c.embedding.cosine_distance(qvec)
+            neighbours = (
+                select(candidates.c.id, (1 - distance).label("score"))
+                .order_by(distance)
+                .limit(queries.c.k)
+                .correlate(queries)
+            )
+        neighbours = neighbours.lateral("n")
+
+        stmt = (
+            select(queries.c.ord, Image, neighbours.c.score)
+            .select_from(queries)
+            .join(neighbours, true())
+            .join(Image, Image.id == neighbours.c.id)
+            .options(defer(Image.embedding))
+            .order_by(queries.c.ord, neighbours.c.score.desc())
+        )
+        results: List[List[Tuple[Image, float]]] = [[] for _ in top_ks]
+        for ord_, img, score in db.execute(stmt).all():
+            results[ord_ - 1].append((img, float(score)))
+        return results
+
+
+def _query_param(query_vec: np.ndarray):
+    """Bind a query vector so that psycopg sends it in binary."""
+    return bindparam(
+        "query_vec",
+        np.asarray(query_vec, dtype=np.float32),
+        type_=BinaryVector(Image.embedding.type.dim),
+    )
+
+
+def _vector_literal(vec: np.ndarray) -> str:
+    """pgvector text representation of a vector."""
+    return "[" + ",".join(map(repr, np.asarray(vec, dtype=np.float32).tolist())) + "]"
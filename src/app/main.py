@@ -2,11 +2,14 @@
 
 from contextlib import asynccontextmanager
 
+from app.core import startup
 from app.core.config import settings
-from app.db.base import Base, engine
-from app.routers import feedback, image
+from app.core.metrics import MetricsMiddleware
+from app.db.base import Base, SessionLocal, engine
+from app.index import get_search_backend
+from app.routers import feedback, image, metrics
+from app.services import feedback_buffer, ingestion, search, storage, thumbnails
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
 
 # Optional: warm up CLIP on startup (so first request is fast)
@@ -17,11 +20,30 @@ async def lifespan(_app: FastAPI):
         # Lazy import to avoid import cost when not starting the server
         from app.ml import clip
 
-        clip.get_model_context().get_model()
+        model_ctx = clip.get_model_context()
+        with startup.phase("model_load"):
+            model_ctx.get_model()
+        clip.get_inference_executor().start()
+        if settings.model_warmup:
+            with startup.phase("warm_up"):
+                clip.warm_up(model_ctx)
+        with startup.phase("index"):
+            get_search_backend().prepare(SessionLocal)
+        with startup.phase("text_cache"):
+            search.prewarm_text_cache()
+        startup.report_ready()
+
+        # Pick up jobs that were queued or interrupted by a previous shutdown
+        if settings.ingestion_resume_jobs:
+            ingestion.get_worker().resume_active_jobs()
         yield
     finally:
-        # If you keep any global handles, close them here
-        pass
+        # Running jobs stop after their current chunk and resume on next boot
+        ingestion.get_worker().stop(timeout=30)
+        # Write feedback still held by the write-behind buffer
+        feedback_buffer.get_feedback_buffer().stop(timeout=10)
+        clip.get_text_batcher().stop(timeout=5)
+        clip.get_inference_executor().stop(timeout=30)
 
 
 def create_app() -> FastAPI:
@@ -37,12 +59,42 @@ def create_app() -> FastAPI:
     # Routers
     app.include_router(image.router)
     app.include_router(feedback.router)
+    if settings.metrics_enabled:
+        app.include_router(metrics.router)
+        app.add_middleware(
+            MetricsMiddleware, server_timing_header=settings.server_timing
+        )
 
+    # Originals keep their URL when re-ingested, so caches revalidate them
+    original_cache_control = f"public, max-age={settings.image_cache_max_age_seconds}"
+    # Symlinked placements point outside IMAGES_DIR
     app.mount(
         image.RAW_IMAGE_ENDPOINT,
-        StaticFiles(directory=str(image.IMAGES_DIR)),
+        storage.CachedStaticFiles(
+            directory=str(image.IMAGES_DIR),
+            follow_symlink=True,
+            cache_control=original_cache_control,
+        ),
         name="image",
     )
+    if settings.image_placement == "reference" and storage.DATA_DIR.is_dir():
+        app.mount(
+            storage.DATA_ENDPOINT,
+            storage.CachedStaticFiles(
+                directory=str(storage.DATA_DIR), cache_control=original_cache_control
+            ),
+            name="data",
+        )
+    # Thumbnail URLs name their content and never change
+    app.mount(
+        thumbnails.THUMBNAIL_ENDPOINT,
+        storage.CachedStaticFiles(
+            directory=str(thumbnails.THUMBNAILS_DIR),
+            cache_control=thumbnails.IMMUTABLE_CACHE_CONTROL,
+            content_addressed=True,
+        ),
+        name="thumbnail",
+    )
 
     # Simple health check
     @app.get("/healthz")
@@ -1,15 +1,31 @@
 """CLIP Model Context and Embedding Functions"""
 
+import asyncio
+import itertools
 import os
-from dataclasses import dataclass
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import torch
+from app.core import metrics
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.ml.encoders import features, load_encoder, load_processor
 from PIL import Image
-from transformers import CLIPModel, CLIPProcessor
 
 DEFAULT_MODEL_NAME = "openai/clip-vit-base-patch32"
 DEFAULT_DEVICE = "cpu"
 
+# inference priorities, lower runs first
+PRIORITY_INTERACTIVE = 0  # search queries
+PRIORITY_BULK = 1  # ingestion batches
+
 
 @dataclass
 class ModelContext:
@@ -18,64 +34,362 @@ class ModelContext:
     Attributes:
         model_name (str): Name of the CLIP model to use.
         device (str): Device to run the model on (e.g., "cpu", "cuda").
-        model (CLIPModel): Loaded CLIP model.
+        backend (str): Encoder backend, "torch" or "onnx".
+        dtype (str): Encoder dtype, "float32", "float16", "bfloat16" or "int8".
+        cache_dir (str): Directory of exported ONNX graphs.
+        num_threads (int): ONNX Runtime intra-op threads, 0 = one per core.
+        model (CLIPModel): Loaded CLIP model, or an encoder with its interface.
         processor (CLIPProcessor): Processor for handling image/text inputs.
     """
 
     model_name: str = DEFAULT_MODEL_NAME
     device: str = DEFAULT_DEVICE
+    backend: str = "torch"
+    dtype: str = "float32"
+    cache_dir: str = ""
+    num_threads: int = 0
     model: any = None
     processor: any = None
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
 
     def get_model(self) -> tuple:
-        """Load and return the CLIP model and processor."""
+        """Load and return the CLIP model and processor.
+
+        Safe to call from several threads: the model is loaded once.
+        """
         if not self.model or not self.processor:
-            self.model = CLIPModel.from_pretrained(
-                self.model_name,
-                # device_map=None,          # don’t spread weights around
-                # low_cpu_mem_usage=False,  # materialize weights immediately
-            ).to(self.device)
-            self.processor = CLIPProcessor.from_pretrained(self.model_name)
-            self.model.eval()
+            with self._lock:
+                if not self.model or not self.processor:
+                    self.processor = load_processor(self.model_name, self.cache_dir)
+                    self.model = load_encoder(
+                        self.model_name,
+                        self.device,
+                        backend=self.backend,
+                        dtype=self.dtype,
+                        cache_dir=self.cache_dir,
+                        num_threads=self.num_threads,
+                    )
         return self.model, self.processor
 
 
 def create_context(
-    model_name: str = DEFAULT_MODEL_NAME, device: str = DEFAULT_DEVICE
+    model_name: str = DEFAULT_MODEL_NAME,
+    device: str = DEFAULT_DEVICE,
+    backend: str = "torch",
+    dtype: str = "float32",
+    cache_dir: str = "",
+    num_threads: int = 0,
 ) -> ModelContext:
     """Create a new ModelContext for CLIP.
 
     Args:
         model_name (str): Name of the CLIP model to use.
         device (str): Device to run the model on (e.g., "cpu", "cuda").
+        backend (str): Encoder backend, "torch" or "onnx".
+        dtype (str): Encoder dtype, "float32", "float16", "bfloat16" or "int8".
+        cache_dir (str): Directory of exported ONNX graphs.
+        num_threads (int): ONNX Runtime intra-op threads, 0 = one per core.
 
     Returns:
         ModelContext: A new context with the specified model and device.
     """
-    return ModelContext(model_name=model_name, device=device)
+    return ModelContext(
+        model_name=model_name,
+        device=device,
+        backend=backend,
+        dtype=dtype,
+        cache_dir=cache_dir,
+        num_threads=num_threads,
+    )
+
+
+class InferenceExecutor:
+    """Runs model forward passes on dedicated threads.
+
+    Work is queued by priority, so an interactive text query waits for at
+    most the forward pass already running, never for a backlog of ingestion
+    batches. Keeping inference off Starlette's threadpool also leaves that
+    pool to database I/O and static files.
+
+    Attributes:
+        num_workers (int): Inference threads.
+        torch_threads (int): Torch intra-op threads, 0 keeps torch's default.
+    """
+
+    def __init__(self, num_workers: int = 1, torch_threads: int = 0):
+        self.num_workers = max(1, num_workers)
+        self.torch_threads = torch_threads
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._seq = itertools.count()  # FIFO within a priority
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the inference threads if they are not running yet."""
+        with self._lock:
+            if self._threads:
+                return
+            if self.torch_threads > 0:
+                # process-wide: bounds the cores one forward pass may use
+                torch.set_num_threads(self.torch_threads)
+            for i in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"clip-inference-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the inference threads once queued work is done."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put((float("inf"), next(self._seq), None))
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(
+        self, fn: Callable, *args, priority: int = PRIORITY_BULK, **kwargs
+    ) -> Future:
+        """Queue `fn(*args, **kwargs)` and return a future of its result."""
+        self.start()
+        future: Future = Future()
+        item = (future, fn, args, kwargs, time.perf_counter())
+        self._queue.put((priority, next(self._seq), item))
+        return future
+
+    def queued(self) -> int:
+        """Number of calls waiting for an inference thread."""
+        return self._queue.qsize()
+
+    def run(self, fn: Callable, *args, priority: int = PRIORITY_BULK, **kwargs):
+        """Run `fn(*args, **kwargs)` on an inference thread and wait for it."""
+        return self.submit(fn, *args, priority=priority, **kwargs).result()
+
+    async def run_async(
+        self, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs
+    ):
+        """Await `fn(*args, **kwargs)` without blocking the event loop."""
+        return await asyncio.wrap_future(
+            self.submit(fn, *args, priority=priority, **kwargs)
+        )
+
+    def _run(self) -> None:
+        while True:
+            _, _, item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs, queued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            metrics.observe_stage("inference_queue", time.perf_counter() - queued_at)
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as exc:  # pylint: disable=broad-except
+                future.set_exception(exc)
+
+
+_executor = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Get the global inference executor, creating it if necessary.
+
+    Returns:
+        InferenceExecutor: The executor sized by `settings.inference_workers`.
+    """
+    global _executor
+    if _executor is None:
+        _executor = InferenceExecutor(
+            num_workers=settings.inference_workers,
+            torch_threads=settings.torch_threads,
+        )
+    return _executor
+
+
+def resolve_device(device: str) -> str:
+    """Resolve "auto" to the best available device."""
+    if device != "auto":
+        return device
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def warm_up(model_ctx: ModelContext) -> None:
+    """Run one image and one text forward pass.
+
+    The first passes allocate buffers and pick kernels, which would
+    otherwise be paid by the first ingestion batch and the first search.
+    """
+    _, processor = model_ctx.get_model()
+    blank = processor(images=[Image.new("RGB", (224, 224))], return_tensors="pt")
+    _image_features(model_ctx, blank["pixel_values"])
+    embed_texts(model_ctx, ["a photo"])
+
+
+def _preprocess_image(processor, image_path, on_decoded=None) -> torch.Tensor:
+    """Decode and preprocess one image file or file object into a pixel tensor."""
+    with metrics.timed("image_decode"):
+        with Image.open(image_path) as img:
+            image = img.convert("RGB")
+        inputs = processor(images=[image], return_tensors="pt")
+    if on_decoded is not None:
+        on_decoded(image_path, image)
+    return inputs["pixel_values"][0]
 
 
 @torch.no_grad()
-def embed_images(model_ctx: ModelContext, image_paths: list):
+def _image_features(model_ctx: ModelContext, pixel_values: torch.Tensor):
+    model, _ = model_ctx.get_model()
+    metrics.BATCH_SIZE.observe("image", len(pixel_values))
+    with metrics.timed("image_forward"):
+        dtype = getattr(model, "dtype", pixel_values.dtype)  # half-precision models
+        pixel_values = pixel_values.to(model_ctx.device, dtype=dtype)
+        feats = features(model.get_image_features(pixel_values=pixel_values)).float()
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+        return feats.cpu().numpy()
+
+
+def iter_image_embeddings(
+    model_ctx: ModelContext,
+    image_paths: list,
+    batch_size: Optional[int] = None,
+    num_workers: Optional[int] = None,
+    prefetch_batches: Optional[int] = None,
+    priority: int = PRIORITY_BULK,
+    on_decoded: Optional[Callable] = None,
+    on_error: Optional[Callable] = None,
+) -> Iterator[np.ndarray]:
+    """Embed images batch by batch, decoding ahead on worker threads.
+
+    A pool of threads decodes and preprocesses images into pixel tensors
+    while the model runs on the previous batch. At most `prefetch_batches`
+    batches are decoded ahead, which bounds memory use. Forward passes run on
+    the inference executor, by default at bulk priority behind interactive
+    queries.
+
+    Args:
+        model_ctx (ModelContext): The model context containing the CLIP model and processor.
+        image_paths (list): List of file paths to images, or binary file objects.
+        batch_size (int, optional): Images per forward pass. Defaults to `settings.batch_size`.
+        num_workers (int, optional): Decode threads. Defaults to `settings.decode_workers`.
+        prefetch_batches (int, optional): Batches decoded ahead of the model.
+            Defaults to `settings.decode_prefetch_batches`.
+        priority (int): Inference priority of the forward passes.
+        on_decoded (Callable, optional): Called as `on_decoded(path, image)`
+            with each decoded RGB `PIL.Image`, on the decode threads.
+        on_error (Callable, optional): Called as `on_error(path, exc)` with
+            each image that cannot be decoded, which is then left out of the
+            embeddings. Without it, decode errors are raised.
+
+    Yields:
+        np.ndarray: Image embeddings of each batch, in input order.
+    """
+    batch_size = max(1, batch_size or settings.batch_size)
+    num_workers = num_workers or settings.decode_workers or os.cpu_count() or 1
+    prefetch_batches = max(1, prefetch_batches or settings.decode_prefetch_batches)
+    _, processor = model_ctx.get_model()
+    executor = get_inference_executor()
+
+    paths = iter(image_paths)
+    max_in_flight = batch_size * (prefetch_batches + 1)
+    with ThreadPoolExecutor(num_workers, thread_name_prefix="clip-decode") as pool:
+        pending = deque()
+
+        def fill():
+            while len(pending) < max_in_flight:
+                path = next(paths, None)
+                if path is None:
+                    return
+                pending.append(
+                    (path, pool.submit(_preprocess_image, processor, path, on_decoded))
+                )
+
+        fill()
+        while pending:
+            batch: List[torch.Tensor] = []
+            while pending and len(batch) < batch_size:
+                path, future = pending.popleft()
+                try:
+                    batch.append(future.result())
+                except Exception as exc:  # pylint: disable=broad-except
+                    if on_error is None:
+                        raise
+                    on_error(path, exc)
+            fill()
+            if not batch:
+                continue
+            yield executor.run(
+                _image_features,
+                model_ctx,
+                torch.stack(batch),
+                priority=priority,
+            )
+
+
+def embed_images(
+    model_ctx: ModelContext,
+    image_paths: list,
+    priority: int = PRIORITY_BULK,
+    on_decoded: Optional[Callable] = None,
+    on_error: Optional[Callable] = None,
+):
     """Embed a list of images using the CLIP model.
 
     Args:
         model_ctx (ModelContext): The model context containing the CLIP model and processor.
-        image_paths (list): List of file paths to images.
+        image_paths (list): List of file paths to images, or binary file objects.
+        priority (int): Inference priority of the forward passes.
+        on_decoded (Callable, optional): Called as `on_decoded(path, image)`
+            with each decoded RGB `PIL.Image`, on the decode threads.
+        on_error (Callable, optional): Called as `on_error(path, exc)` with
+            each image that cannot be decoded, which is then skipped.
 
     Returns:
-        np.ndarray: Array of image embeddings.
+        np.ndarray: Array of image embeddings, one row per decoded image.
     """
-    model, processor = model_ctx.get_model()
-    images = [Image.open(p).convert("RGB") for p in image_paths]
-    inputs = processor(images=images, return_tensors="pt", padding=True)
-    inputs = {k: v.to(model_ctx.device) for k, v in inputs.items()}
-    feats = model.get_image_features(**inputs)
-    feats = feats / feats.norm(dim=-1, keepdim=True)
-    return feats.cpu().numpy()
+    batches = list(
+        iter_image_embeddings(
+            model_ctx,
+            image_paths,
+            priority=priority,
+            on_decoded=on_decoded,
+            on_error=on_error,
+        )
+    )
+    if not batches:
+        model, _ = model_ctx.get_model()
+        return np.zeros((0, model.config.projection_dim), dtype=np.float32)
+    return np.vstack(batches)
 
 
 @torch.no_grad()
+def embed_texts(model_ctx: ModelContext, queries: List[str]):
+    """Embed several text queries in a single CLIP forward pass.
+
+    Args:
+        model_ctx (ModelContext): The model context containing the CLIP model and processor.
+        queries (List[str]): Text queries to embed.
+
+    Returns:
+        np.ndarray: Array of text embeddings, one row per query.
+    """
+    model, processor = model_ctx.get_model()
+    metrics.BATCH_SIZE.observe("text", len(queries))
+    with metrics.timed("tokenize"):
+        inputs = processor(text=list(queries), return_tensors="pt", padding=True)
+    with metrics.timed("text_forward"):
+        inputs = {k: v.to(model_ctx.device) for k, v in inputs.items()}
+        feats = features(model.get_text_features(**inputs)).float()
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+        return feats.cpu().numpy()
+
+
 def embed_text(model_ctx: ModelContext, query: str):
     """Embed a text query using the CLIP model.
 
@@ -86,24 +400,261 @@ def embed_text(model_ctx: ModelContext, query: str):
     Returns:
         np.ndarray: Array of text embeddings.
     """
-    model, processor = model_ctx.get_model()
-    inputs = processor(text=[query], return_tensors="pt", padding=True)
-    inputs = {k: v.to(model_ctx.device) for k, v in inputs.items()}
-    feats = model.get_text_features(**inputs)
-    feats = feats / feats.norm(dim=-1, keepdim=True)
-    return feats.squeeze(0).cpu().numpy()
+    return embed_texts(model_ctx, [query])[0]
+
+
+class TextBatcher:
+    """Collects concurrent text queries into micro-batches.
+
+    Callers block in `embed` while a background thread gathers queries for up
+    to `max_wait_ms` (or until `max_batch_size` are queued) and queues one
+    `embed_texts` pass on the inference executor at interactive priority.
+    Each row is handed back to its caller when the pass completes.
+    """
+
+    def __init__(
+        self,
+        model_ctx: ModelContext,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        executor: Optional[InferenceExecutor] = None,
+    ):
+        self.model_ctx = model_ctx
+        self.executor = executor or get_inference_executor()
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the batching thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="clip-text-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the batching thread once queued queries are served."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, query: str) -> Future:
+        """Queue a query and return a future resolving to its embedding."""
+        self.start()
+        future: Future = Future()
+        self._queue.put((query, future))
+        return future
+
+    def queued(self) -> int:
+        """Number of queries waiting to be batched."""
+        return self._queue.qsize()
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embed a text query as part of the next micro-batch."""
+        return self.submit(query).result()
+
+    def _collect(self, first: tuple) -> Tuple[List[tuple], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+
+            # identical queries in a batch share one row of the forward pass
+            unique = list(dict.fromkeys(query for query, _ in batch))
+            pass_future = self.executor.submit(
+                embed_texts, self.model_ctx, unique, priority=PRIORITY_INTERACTIVE
+            )
+            pass_future.add_done_callback(
+                lambda done, batch=batch, unique=unique: self._deliver(
+                    done, batch, unique
+                )
+            )
+
+    @staticmethod
+    def _deliver(done: Future, batch: List[tuple], unique: List[str]) -> None:
+        exc = done.exception()
+        rows = {} if exc is not None else dict(zip(unique, done.result()))
+        for query, future in batch:
+            # callers that went away, e.g. disconnected clients, cancelled theirs
+            if future.done():
+                continue
+            try:
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(rows[query])
+            except InvalidStateError:
+                pass  # cancelled since the check; the others still get theirs
 
 
 _model_ctx = None
+_model_ctx_lock = threading.Lock()
 
 
 def get_model_context() -> ModelContext:
-    """Get the global CLIP model context, creating it if necessary.
+    """Get the global CLIP model context, creating it from settings if necessary.
 
     Returns:
         ModelContext: The global model context.
     """
     global _model_ctx
     if _model_ctx is None:
-        _model_ctx = create_context()
+        with _model_ctx_lock:
+            if _model_ctx is None:
+                _model_ctx = create_context(
+                    model_name=settings.clip_model_id,
+                    device=resolve_device(settings.device),
+                    backend=settings.encoder_backend,
+                    dtype=settings.dtype,
+                    cache_dir=settings.model_cache_dir,
+                    num_threads=settings.torch_threads,
+                )
     return _model_ctx
+
+
+_text_batcher = None
+
+
+def get_text_batcher() -> TextBatcher:
+    """Get the global text batcher, creating it if necessary.
+
+    Returns:
+        TextBatcher: The global text batcher over the global model context.
+    """
+    global _text_batcher
+    if _text_batcher is None:
+        _text_batcher = TextBatcher(
+            get_model_context(),
+            max_batch_size=settings.text_batch_max_size,
+            max_wait_ms=settings.text_batch_max_wait_ms,
+        )
+    return _text_batcher
+
+
+metrics.QUEUE_DEPTH.track(
+    "inference", lambda: _executor.queued() if _executor is not None else 0
+)
+metrics.QUEUE_DEPTH.track(
+    "text_batch", lambda: _text_batcher.queued() if _text_batcher is not None else 0
+)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a text query for caching.
+
+    The CLIP tokenizer lowercases and collapses whitespace itself, so queries
+    that differ only in case or spacing have the same embedding.
+    """
+    return " ".join(query.lower().split())
+
+
+_text_cache = None
+
+
+def get_text_cache() -> LRUCache:
+    """Get the global text embedding cache, creating it if necessary.
+
+    Returns:
+        LRUCache: Cache of text embeddings keyed by (model name, normalized query).
+    """
+    global _text_cache
+    if _text_cache is None:
+        _text_cache = LRUCache(
+            settings.text_cache_size, ttl_seconds=settings.text_cache_ttl_seconds
+        )
+    return _text_cache
+
+
+async def embed_query_async(query: str) -> np.ndarray:
+    """Embed a search query, serving repeated queries from the text cache.
+
+    Cache misses are awaited on the global text batcher.
+
+    Args:
+        query (str): Text query to embed.
+
+    Returns:
+        np.ndarray: The float32 text embedding.
+    """
+    text = normalize_query(query)
+    key = (get_model_context().model_name, text)
+    cache = get_text_cache()
+    vec = cache.get(key)
+    if vec is None:
+        vec = await asyncio.wrap_future(get_text_batcher().submit(text))
+        # store the compact vector and serve it on misses too, so a query
+        # scores the same whether or not it was cached
+        vec = vec.astype(settings.text_cache_dtype)
+        cache.put(key, vec)
+    return vec.astype(np.float32)
+
+
+async def embed_queries_async(queries: List[str]) -> np.ndarray:
+    """Embed many search queries, running all cache misses in one forward pass.
+
+    The pass is queued at bulk priority: batches come from offline jobs and
+    should not delay interactive searches.
+
+    Args:
+        queries (List[str]): Text queries to embed.
+
+    Returns:
+        np.ndarray: Float32 text embeddings, one row per query.
+    """
+    model_ctx = get_model_context()
+    cache = get_text_cache()
+    texts = [normalize_query(query) for query in queries]
+    vecs = {text: cache.get((model_ctx.model_name, text)) for text in texts}
+    misses = [text for text, vec in vecs.items() if vec is None]
+    if misses:
+        feats = await get_inference_executor().run_async(
+            embed_texts, model_ctx, misses, priority=PRIORITY_BULK
+        )
+        for text, feat in zip(misses, feats):
+            vecs[text] = feat.astype(settings.text_cache_dtype)
+            cache.put((model_ctx.model_name, text), vecs[text])
+    return np.vstack([vecs[text] for text in texts]).astype(np.float32)
+
+
+def warm_text_cache(queries: List[str]) -> int:
+    """Embed queries ahead of time and store them in the text cache.
+
+    Args:
+        queries (List[str]): Text queries, most important first.
+
+    Returns:
+        int: Number of distinct queries cached.
+    """
+    model_ctx = get_model_context()
+    cache = get_text_cache()
+    texts = list(dict.fromkeys(normalize_query(q) for q in queries))
+    texts = texts[: cache.max_size]
+    batch = max(1, settings.batch_size)
+    for i in range(0, len(texts), batch):
+        chunk = texts[i : i + batch]
+        for text, vec in zip(chunk, embed_texts(model_ctx, chunk)):
+            vec = vec.astype(settings.text_cache_dtype)
+            cache.put((model_ctx.model_name, text), vec)
+    return len(texts)
@@ -0,0 +1,392 @@
+"""CLIP Encoder Backends
+
+`load_encoder` returns an object exposing the `CLIPModel` methods the
+embedding code uses (`get_image_features`, `get_text_features` and
+`config.projection_dim`):
+
+- "torch": the PyTorch model in `dtype`. "int8" dynamically quantizes its
+  Linear layers, which hold nearly all of CLIP's weights.
+- "onnx": ONNX Runtime sessions over the image and text towers, exported
+  once to `cache_dir` by `export_onnx`. "int8" runs dynamically quantized
+  copies of the exported graphs.
+
+Half precision only helps on accelerators: CPU kernels for float16 are
+slower than float32, so "float16" falls back to float32 on CPU.
+
+With a `cache_dir`, the first load also writes a prepared copy of the model:
+safetensors weights already in the target dtype plus the serialized
+processor and tokenizer. Later loads memory-map it from local disk, with no
+hub lookups and no dtype conversion.
+"""
+
+import argparse
+import logging
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import CLIPConfig, CLIPModel, CLIPProcessor
+
+logger = logging.getLogger(__name__)
+
+ENCODER_BACKENDS = ("torch", "onnx")
+ENCODER_DTYPES = ("float32", "float16", "bfloat16", "int8")
+ONNX_OPSET = 17
+
+
+def features(output) -> torch.Tensor:
+    """Projected embeddings from a `get_*_features` output.
+
+    transformers < 5 returns the tensor itself, later versions wrap it in a
+    model output as `pooler_output`.
+    """
+    return output if isinstance(output, torch.Tensor) else output.pooler_output
+
+
+def resolve_dtype(dtype: str, device: str, backend: str = "torch") -> str:
+    """Map the configured dtype to the one actually used on `device`.
+
+    Args:
+        dtype (str): One of `ENCODER_DTYPES`.
+        device (str): Device the encoder runs on.
+        backend (str): One of `ENCODER_BACKENDS`.
+
+    Returns:
+        str: The effective dtype.
+    """
+    if dtype not in ENCODER_DTYPES:
+        raise ValueError(f"Unknown encoder dtype: {dtype}")
+    if dtype == "int8" and device != "cpu":
+        raise ValueError("int8 dynamic quantization is only supported on cpu")
+    if dtype == "float16" and device == "cpu":
+        logger.info("float16 has no fast CPU kernels, using float32")
+        return "float32"
+    if dtype == "bfloat16" and backend == "onnx":
+        return "float32"
+    return dtype
+
+
+def model_dir(cache_dir: str, model_name: str) -> Path:
+    """Root directory of the cached artifacts of a model."""
+    return Path(cache_dir) / model_name.replace("/", "--")
+
+
+def _write_atomically(dest: Path, write) -> None:
+    """Call `write(tmp_dir)` and move the result to `dest` in one rename."""
+    tmp = dest.with_name(f".{dest.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    write(tmp)
+    try:
+        tmp.rename(dest)
+    except OSError:  # another process prepared it first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def prepare_torch_weights(
+    model_name: str, dtype: str, cache_dir: str
+) -> Optional[Path]:
+    """Write the model's weights as safetensors in `dtype`, once.
+
+    Args:
+        model_name (str): Hugging Face model id or local path.
+        dtype (str): "float32", "float16" or "bfloat16".
+        cache_dir (str): Root directory of prepared models.
+
+    Returns:
+        Path: Directory of the prepared model, or None if it cannot be written.
+    """
+    dest = model_dir(cache_dir, model_name) / f"torch-{dtype}"
+    if (dest / "config.json").exists():
+        return dest
+    logger.info("Preparing %s weights for %s in %s", dtype, model_name, dest)
+    try:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        model = CLIPModel.from_pretrained(model_name, torch_dtype=getattr(torch, dtype))
+        _write_atomically(dest, model.save_pretrained)
+    except OSError as exc:
+        logger.warning("Could not prepare %s: %s", dest, exc)
+        return None
+    return dest
+
+
+def load_processor(model_name: str, cache_dir: str = "") -> CLIPProcessor:
+    """Load the CLIP processor, from its prepared copy when there is one.
+
+    Args:
+        model_name (str): Hugging Face model id or local path.
+        cache_dir (str): Root directory of prepared models, "" to disable.
+
+    Returns:
+        CLIPProcessor: The image processor and fast tokenizer.
+    """
+    if not cache_dir:
+        return CLIPProcessor.from_pretrained(model_name)
+    dest = model_dir(cache_dir, model_name) / "processor"
+    if (dest / "tokenizer.json").exists():
+        return CLIPProcessor.from_pretrained(dest)
+    processor = CLIPProcessor.from_pretrained(model_name)
+    try:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomically(dest, processor.save_pretrained)
+    except OSError as exc:
+        logger.warning("Could not prepare %s: %s", dest, exc)
+    return processor
+
+
+def load_torch_encoder(
+    model_name: str, device: str, dtype: str, cache_dir: str = ""
+) -> CLIPModel:
+    """Load the PyTorch CLIP model in the given dtype.
+
+    Args:
+        model_name (str): Hugging Face model id or local path.
+        device (str): Device to run the model on.
+        dtype (str): One of `ENCODER_DTYPES`.
+        cache_dir (str): Root directory of prepared models, "" to disable.
+
+    Returns:
+        CLIPModel: The model in eval mode.
+    """
+    dtype = resolve_dtype(dtype, device)
+    weights_dtype = "float32" if dtype == "int8" else dtype
+    source = model_name
+    if cache_dir:
+        source = prepare_torch_weights(model_name, weights_dtype, cache_dir) or source
+    model = CLIPModel.from_pretrained(
+        source, torch_dtype=getattr(torch, weights_dtype)
+    ).to(device)
+    model.eval()
+    if dtype == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model
+
+
+class _ImageTower(torch.nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):  # pylint: disable=arguments-differ
+        return features(self.model.get_image_features(pixel_values=pixel_values))
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):  # pylint: disable=arguments-differ
+        return features(
+            self.model.get_text_features(
+                input_ids=input_ids, attention_mask=attention_mask
+            )
+        )
+
+
+def onnx_dir(cache_dir: str, model_name: str) -> Path:
+    """Directory holding the exported graphs of a model."""
+    return model_dir(cache_dir, model_name) / "onnx"
+
+
+def export_onnx(
+    model: CLIPModel, out_dir: Path, quantize: bool = False
+) -> Tuple[Path, Path]:
+    """Export the image and text towers of a CLIP model to ONNX.
+
+    Existing graphs are reused, so this is cheap after the first call.
+
+    Args:
+        model (CLIPModel): Float32 model to export.
+        out_dir (Path): Output directory.
+        quantize (bool): Also write int8 dynamically quantized graphs and
+            return those.
+
+    Returns:
+        Tuple[Path, Path]: Paths of the image and text graphs.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    image_path, text_path = out_dir / "image.onnx", out_dir / "text.onnx"
+    config = model.config
+    if not image_path.exists():
+        size = config.vision_config.image_size
+        _export(
+            _ImageTower(model),
+            (torch.zeros(1, 3, size, size),),
+            image_path,
+            {"pixel_values": {0: "batch"}},
+        )
+    if not text_path.exists():
+        tokens = torch.zeros(1, 8, dtype=torch.long)
+        _export(
+            _TextTower(model),
+            (tokens, torch.ones_like(tokens)),
+            text_path,
+            {
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+            },
+        )
+    if not quantize:
+        return image_path, text_path
+
+    # pylint: disable=import-outside-toplevel
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = []
+    for path in (image_path, text_path):
+        int8_path = path.with_suffix(".int8.onnx")
+        if not int8_path.exists():
+            quantize_dynamic(str(path), str(int8_path), weight_type=QuantType.QInt8)
+        quantized.append(int8_path)
+    return quantized[0], quantized[1]
+
+
+def _export(tower: torch.nn.Module, args: tuple, path: Path, dynamic_axes: dict):
+    tmp = path.with_suffix(".tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            tower.eval(),
+            args,
+            str(tmp),
+            input_names=list(dynamic_axes),
+            output_names=["features"],
+            dynamic_axes={**dynamic_axes, "features": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+    tmp.replace(path)  # concurrent exporters never see a partial graph
+
+
+class OnnxEncoder:
+    """CLIP image and text towers running on ONNX Runtime.
+
+    Attributes:
+        config: Namespace with the model's `projection_dim`.
+    """
+
+    dtype = torch.float32
+
+    def __init__(
+        self,
+        image_path: Path,
+        text_path: Path,
+        projection_dim: int,
+        num_threads: int = 0,
+    ):
+        import onnxruntime as ort  # pylint: disable=import-outside-toplevel
+
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        self._image = ort.InferenceSession(
+            str(image_path), options, providers=providers
+        )
+        self._text = ort.InferenceSession(str(text_path), options, providers=providers)
+        self.config = SimpleNamespace(projection_dim=projection_dim)
+
+    def eval(self) -> "OnnxEncoder":
+        """No-op, for parity with `CLIPModel`."""
+        return self
+
+    def get_image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Embed preprocessed images."""
+        pixel_values = pixel_values.detach().cpu().numpy().astype(np.float32)
+        (feats,) = self._image.run(None, {"pixel_values": pixel_values})
+        return torch.from_numpy(feats)
+
+    def get_text_features(
+        self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None
+    ) -> torch.Tensor:
+        """Embed tokenized texts."""
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        feeds = {
+            "input_ids": input_ids.cpu().numpy().astype(np.int64),
+            "attention_mask": attention_mask.cpu().numpy().astype(np.int64),
+        }
+        (feats,) = self._text.run(None, feeds)
+        return torch.from_numpy(feats)
+
+
+def load_onnx_encoder(
+    model_name: str,
+    dtype: str,
+    cache_dir: str,
+    num_threads: int = 0,
+) -> OnnxEncoder:
+    """Load the ONNX encoder of a model, exporting it on first use.
+
+    Args:
+        model_name (str): Hugging Face model id or local path.
+        dtype (str): One of `ENCODER_DTYPES`.
+        cache_dir (str): Root directory of exported graphs.
+        num_threads (int): ONNX Runtime intra-op threads, 0 = one per core.
+
+    Returns:
+        OnnxEncoder: The encoder.
+    """
+    dtype = resolve_dtype(dtype, "cpu", backend="onnx")
+    out_dir = onnx_dir(cache_dir, model_name)
+    suffix = ".int8.onnx" if dtype == "int8" else ".onnx"
+    paths = (out_dir / f"image{suffix}", out_dir / f"text{suffix}")
+    if all(path.exists() for path in paths):
+        projection_dim = CLIPConfig.from_pretrained(model_name).projection_dim
+    else:
+        logger.info("Exporting %s to ONNX in %s", model_name, out_dir)
+        model = CLIPModel.from_pretrained(model_name).eval()
+        projection_dim = model.config.projection_dim
+        paths = export_onnx(model, out_dir, quantize=dtype == "int8")
+    return OnnxEncoder(*paths, projection_dim=projection_dim, num_threads=num_threads)
+
+
+def load_encoder(
+    model_name: str,
+    device: str,
+    backend: str = "torch",
+    dtype: str = "float32",
+    cache_dir: str = "",
+    num_threads: int = 0,
+):
+    """Load a CLIP encoder with the given backend.
+
+    Args:
+        model_name (str): Hugging Face model id or local path.
+        device (str): Device to run the model on ("onnx" runs on cpu).
+        backend (str): One of `ENCODER_BACKENDS`.
+        dtype (str): One of `ENCODER_DTYPES`.
+        cache_dir (str): Root directory of prepared models and ONNX graphs.
+        num_threads (int): ONNX Runtime intra-op threads, 0 = one per core.
+
+    Returns:
+        The encoder, a `CLIPModel` or an `OnnxEncoder`.
+    """
+    if backend == "torch":
+        return load_torch_encoder(model_name, device, dtype, cache_dir)
+    if backend == "onnx":
+        return load_onnx_encoder(model_name, dtype, cache_dir, num_threads)
+    raise ValueError(f"Unknown encoder backend: {backend}")
+
+
+def main():
+    """Export the ONNX graphs ahead of deployment."""
+    # pylint: disable=import-outside-toplevel
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--model", default=settings.clip_model_id)
+    parser.add_argument("--cache-dir", default=settings.model_cache_dir)
+    parser.add_argument("--int8", action="store_true", help="also quantize")
+    args = parser.parse_args()
+
+    model = CLIPModel.from_pretrained(args.model).eval()
+    for path in export_onnx(model, onnx_dir(args.cache_dir, args.model), args.int8):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,153 @@
 """Feedback Router for handling image feedback in the iFinder application."""
 
-from typing import List
+from typing import List, Optional
 
-from app.db.base import get_db
+from app.core.config import settings
+from app.db.base import get_db, get_read_db
 from app.db.models.feedback import Feedback
-from app.db.models.image import Image
-from app.schemas.feedback import FeedbackRequest, FeedbackResponse
-from fastapi import APIRouter, Depends, HTTPException
+from app.schemas.feedback import (
+    FeedbackBatchRequest,
+    FeedbackRequest,
+    FeedbackResponse,
+)
+from app.services.feedback_buffer import (
+    get_feedback_buffer,
+    insert_feedbacks,
+    missing_image_ids,
+)
+from app.services.pagination import (
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    keyset_page,
+    stream_ndjson,
+)
+from app.services.search import bump_feedback_generation
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/feedbacks", tags=["feedback"])
 
 
+def _submit(db: Session, reqs: List[FeedbackRequest]) -> List[FeedbackResponse]:
+    """Check that the images exist, then write the feedback or buffer it."""
+    missing = missing_image_ids(db, (req.image_id for req in reqs))
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"Images not found: {sorted(missing)}"
+        )
+    rows = [
+        {
+            "query_text": req.query_text,
+            "image_id": req.image_id,
+            "is_good": req.is_good,
+            "score": req.score,
+        }
+        for req in reqs
+    ]
+    if settings.feedback_buffer_enabled:
+        received_at = get_feedback_buffer().add(rows).isoformat()
+        ids = [None] * len(rows)
+        created = [received_at] * len(rows)
+    else:
+        inserted = insert_feedbacks(db, rows)
+        db.commit()
+        bump_feedback_generation()
+        ids = [fb_id for fb_id, _ in inserted]
+        created = [created_at.isoformat() for _, created_at in inserted]
+    return [
+        FeedbackResponse(
+            id=fb_id,
+            query=row["query_text"],
+            image_id=row["image_id"],
+            is_good=row["is_good"],
+            score=row["score"],
+            created_at=created_at,
+        )
+        for fb_id, created_at, row in zip(ids, created, rows)
+    ]
+
+
 @router.post("", response_model=FeedbackResponse)
-def feedback(req: FeedbackRequest, db: Session = Depends(get_db)):
-    """Submit feedback for an image."""
-    image = db.query(Image).get(req.image_id)
-    if not image:
-        raise HTTPException(status_code=404, detail="Image not found")
-    fb = Feedback(
-        query_text=req.query_text,
-        image_id=image.id,
-        is_good=req.is_good,
-        score=req.score,
-    )
-    db.add(fb)
-    db.commit()
-    return FeedbackResponse(
-        id=fb.id,
-        query=fb.query_text,
-        image_id=fb.image_id,
-        is_good=fb.is_good,
-        score=fb.score,
-        created_at=fb.created_at.isoformat(),
-    )
+def feedback(
+    req: FeedbackRequest, response: Response, db: Session = Depends(get_db)
+):
+    """Submit feedback for an image.
+
+    With the write-behind buffer enabled the feedback is accepted with 202
+    and a null `id`, and written with the next flush.
+    """
+    if settings.feedback_buffer_enabled:
+        response.status_code = 202
+    return _submit(db, [req])[0]
+
+
+@router.post("/batch", response_model=List[FeedbackResponse])
+def feedback_batch(
+    req: FeedbackBatchRequest, response: Response, db: Session = Depends(get_db)
+):
+    """Submit many feedbacks in one request and one transaction.
+
+    Every referenced image is checked with a single query; if any is missing
+    nothing is written and the 404 lists the missing ids.
+    """
+    if len(req.feedbacks) > settings.feedback_batch_max_size:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.feedback_batch_max_size} feedbacks per batch",
+        )
+    if settings.feedback_buffer_enabled:
+        response.status_code = 202
+    return _submit(db, req.feedbacks)
+
+
+def _feedback_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "query": row.query_text,
+        "image_id": row.image_id,
+        "is_good": row.is_good,
+        "score": row.score,
+        "created_at": row.created_at.isoformat(),
+    }
 
 
 @router.get("", response_model=List[FeedbackResponse])
-def get_feedbacks(image_id: int = None, db: Session = Depends(get_db)):
-    """Get feedbacks for a specific image or all feedbacks."""
-    query = db.query(Feedback)
+def get_feedbacks(
+    response: Response,
+    image_id: int = None,
+    limit: int = Query(default=None, ge=1),
+    cursor: Optional[int] = None,
+    output_format: str = Query(
+        default="json", alias="format", pattern="^(json|ndjson)$"
+    ),
+    db: Session = Depends(get_read_db),
+):
+    """Get feedbacks for a specific image or all feedbacks, one page at a time.
+
+    Pass the `X-Next-Cursor` response header as `cursor` to get the next
+    page; it is absent on the last page. With `format=ndjson` every feedback
+    after `cursor` is streamed as newline-delimited JSON instead.
+    """
+    stmt = select(
+        Feedback.id,
+        Feedback.query_text,
+        Feedback.image_id,
+        Feedback.is_good,
+        Feedback.score,
+        Feedback.created_at,
+    )
     if image_id:
-        query = query.filter(Feedback.image_id == image_id)
-    feedbacks = query.all()
-    return [
-        FeedbackResponse(
-            id=fb.id,
-            query=fb.query_text,
-            image_id=fb.image_id,
-            is_good=fb.is_good,
-            score=fb.score,
-            created_at=fb.created_at.isoformat(),
+        stmt = stmt.where(Feedback.image_id == image_id)
+    if output_format == "ndjson":
+        return StreamingResponse(
+            stream_ndjson(stmt, Feedback.id, _feedback_dict, cursor),
+            media_type=NDJSON_MEDIA_TYPE,
         )
-        for fb in feedbacks
-    ]
+
+    limit = min(limit or settings.page_size, settings.max_page_size)
+    rows, next_cursor = keyset_page(db, stmt, Feedback.id, cursor, limit)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return [FeedbackResponse(**_feedback_dict(row)) for row in rows]
@@ -1,133 +1,392 @@
 """Router for image-related endpoints in the iFinder application."""
 
+import hashlib
+import io
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 import numpy as np
+from app.core import metrics, startup
 from app.core.config import settings
-from app.db.base import get_db
+from app.db.base import get_db, get_read_db
 from app.db.models.image import Image
+from app.db.models.ingestion_job import JOB_COMPLETED, JOB_PENDING, IngestionJob
+from app.index import SearchFilters, get_search_backend
 from app.ml import clip
 from app.schemas.image import (
+    BatchSearchRequest,
+    BatchSearchResponse,
     ImageIngestionRequest,
     ImageMatchingResponse,
     ImageResponse,
     ImagesSummaryResponse,
+    IngestionJobResponse,
     SearchResponse,
 )
-from fastapi import APIRouter, Depends, Form, HTTPException
+from app.services import feedback_ranking, ingestion, storage, thumbnails
+from app.services.pagination import (
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    keyset_page,
+    stream_ndjson,
+)
+from app.services.search import (
+    cache_search,
+    feedback_generation,
+    get_cached_search,
+    index_generation,
+    resolve_ef_search,
+    search_excluding,
+)
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 IMAGE_ENDPOINT_PREFIX = "/images"
 router = APIRouter(prefix=IMAGE_ENDPOINT_PREFIX, tags=["image"])
 
 DATA_DIR = settings.data_dir
-IMAGES_DIR = Path(settings.images_dir)
-IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-RAW_IMAGE_ENDPOINT = "/static/image"
+IMAGES_DIR = storage.IMAGES_DIR
+RAW_IMAGE_ENDPOINT = storage.RAW_IMAGE_ENDPOINT
+
+
+def _matching(rows: List[Tuple[Image, float]]) -> List[ImageMatchingResponse]:
+    return [
+        ImageMatchingResponse(
+            id=img.id,
+            filename=img.filename,
+            url=img.url_path,
+            score=float(score),
+            variants=thumbnails.variant_urls(img.content_hash),
+        )
+        for img, score in rows
+    ]
+
+
+def _resolve_ef_search(ef_search: Optional[int], tier: Optional[str]) -> Optional[int]:
+    try:
+        return resolve_ef_search(ef_search, tier)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
 
 
-@router.post("/ingestions", response_model=List[ImageResponse])
+def _job_response(job: IngestionJob) -> IngestionJobResponse:
+    total = job.total or 0
+    processed = job.next_offset or 0
+    if total:
+        progress = processed / total
+    else:
+        progress = 1.0 if job.status == JOB_COMPLETED else 0.0
+
+    images_per_sec = None
+    if job.started_at is not None and job.updated_at is not None:
+        elapsed = (job.updated_at - job.started_at).total_seconds()
+        if elapsed > 0:
+            images_per_sec = (processed - (job.started_offset or 0)) / elapsed
+
+    return IngestionJobResponse(
+        id=job.id,
+        folder=job.folder,
+        collection=job.collection,
+        status=job.status,
+        total=total,
+        processed=processed,
+        indexed=job.indexed or 0,
+        skipped=job.skipped or 0,
+        progress=progress,
+        images_per_sec=images_per_sec,
+        error=job.error,
+        created_at=_isoformat(job.created_at),
+        started_at=_isoformat(job.started_at),
+        finished_at=_isoformat(job.finished_at),
+    )
+
+
+@router.post("/ingestions", response_model=IngestionJobResponse, status_code=202)
 def ingest_from_folder(req: ImageIngestionRequest, db: Session = Depends(get_db)):
-    """Ingest images from a specified folder into the database."""
+    """Start a background job ingesting images from a folder."""
     folder_path = Path(req.folder)
-    if not folder_path.exists():
+    if not folder_path.is_dir():
         raise HTTPException(status_code=400, detail=f"Folder not found: {req.folder}")
-    image_paths: List[Path] = []
-    for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp", "*.bmp", "*.gif"):
-        image_paths.extend(sorted(folder_path.glob(ext)))
-    if not image_paths:
-        raise HTTPException(status_code=400, detail="No images found in folder.")
-
-    existing_items = (
-        db.query(Image).filter(Image.filename.in_([p.name for p in image_paths])).all()
+
+    job = IngestionJob(
+        folder=str(folder_path), collection=req.collection, status=JOB_PENDING
     )
-    existing_filenames = {item.filename for item in existing_items}
-
-    dest_paths = []
-    for src in image_paths:
-        if src.name in existing_filenames:
-            continue
-        dest = IMAGES_DIR / src.name
-        if src.resolve() != dest.resolve():
-            dest.write_bytes(src.read_bytes())
-        dest_paths.append(dest)
-
-    if not dest_paths:
-        raise HTTPException(status_code=400, detail="No new images to index.")
-
-    batch = 32
-    all_embeddings = []
-    for i in range(0, len(dest_paths), batch):
-        embs = clip.embed_images(
-            clip.get_model_context(), [str(p) for p in dest_paths[i : i + batch]]
-        )
-        all_embeddings.append(embs)
-    embeddings = np.vstack(all_embeddings).tolist()
+    db.add(job)
+    db.commit()
+    ingestion.get_worker().submit(job.id)
+    return _job_response(job)
 
-    results = []
-    for path, emb in zip(dest_paths, embeddings):
-        filename = path.name
-        url_path = f"http://localhost:8000{RAW_IMAGE_ENDPOINT}/{filename}"
-        results.append(Image(filename=filename, url_path=url_path, embedding=emb))
-        db.add_all(results)
-        db.flush()  # <-- allocate primary keys for all rows
 
-    db.commit()
-    return [
-        ImageResponse(id=item.id, filename=item.filename, url=item.url_path)
-        for item in results
-    ]
+@router.get("/ingestions/{job_id}", response_model=IngestionJobResponse)
+def get_ingestion(job_id: int, db: Session = Depends(get_db)):
+    """Get the status, progress and throughput of an ingestion job."""
+    job = db.get(IngestionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return _job_response(job)
 
 
 @router.get("/summary", response_model=ImagesSummaryResponse)
-def get_images_summary(db: Session = Depends(get_db)):
+def get_images_summary(db: Session = Depends(get_read_db)):
     """Get a summary of all indexed images."""
     total_images = db.query(Image).count()
     return ImagesSummaryResponse(total=total_images)
 
 
 @router.get("/search", response_model=SearchResponse)
-def search(query: str, top_k: int = 1, db: Session = Depends(get_db)):
-    """Search for images matching a text query using CLIP embeddings."""
-    # 1) embed the query (same as before)
-    text_vec = clip.embed_text(clip.get_model_context(), query)
-    qvec = text_vec.tolist()  # pgvector handles Python lists/ndarrays
-
-    # 2) build a query that orders by cosine distance ASC (smaller = closer)
-    #    and also compute a "score" = 1 - distance to match cosine similarity
-    stmt = (
-        select(Image, (1 - Image.embedding.cosine_distance(qvec)).label("score"))
-        .where(Image.embedding.isnot(None))
-        .order_by(Image.embedding.cosine_distance(qvec))  # nearest first
-        .limit(max(1, top_k))
+async def search(
+    query: str,
+    top_k: int = 1,
+    ef_search: Optional[int] = Query(default=None, ge=1, le=1000),
+    tier: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    collection: Optional[str] = None,
+    folder: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    filename: Optional[str] = None,
+    hybrid: bool = False,
+    db: Session = Depends(get_read_db),
+):
+    """Search for images matching a text query using CLIP embeddings.
+
+    `ef_search` (or a named `tier`) trades recall for latency on HNSW indexes.
+    With `rerank` (default `settings.feedback_rerank`), an oversampled set of
+    candidates is re-ranked by blending recorded feedback into the scores.
+    `collection`, `folder`, `created_after`, `created_before` and `filename`
+    (a substring, in any case) restrict the images searched. With `hybrid`,
+    the ranking fuses vector similarity with matches of the query words in
+    filenames, and scores are reciprocal rank fusion scores; feedback
+    re-ranking is not applied.
+    The handler is async: CLIP runs on the inference executor and the
+    database query on the threadpool, so neither blocks the event loop.
+    """
+    top_k = max(1, top_k)
+    ef_search = _resolve_ef_search(ef_search, tier)
+    rerank = settings.feedback_rerank if rerank is None else rerank
+    rerank = rerank and not hybrid
+    filters = SearchFilters(
+        collection=collection,
+        folder=folder,
+        created_after=created_after,
+        created_before=created_before,
+        filename=filename,
     )
+    with metrics.timed("search_cache"):
+        cached = get_cached_search(query, top_k, ef_search, rerank, filters, hybrid)
+    if cached is not None:
+        startup.record_first_search()
+        return cached
+    generation, feedback_gen = index_generation(), feedback_generation()
+
+    # 1) embed the query (cached, batched with concurrent searches)
+    with metrics.timed("search_embed"):
+        text_vec = await clip.embed_query_async(query)
 
-    rows = db.execute(stmt).all()  # list of (Image, score)
-    if not rows:
+    # 2) rank matching images with the configured backend, in one query
+    backend = get_search_backend()
+    with metrics.timed("search_index"):
+        if hybrid:
+            rows = await run_in_threadpool(
+                backend.search_hybrid,
+                db,
+                text_vec,
+                query,
+                top_k,
+                max(top_k, settings.hybrid_candidates),
+                ef_search=ef_search,
+                filters=filters,
+                rrf_k=settings.hybrid_rrf_k,
+            )
+        else:
+            candidates = (
+                top_k * settings.feedback_rerank_oversample if rerank else top_k
+            )
+            rows = await run_in_threadpool(
+                backend.search,
+                db,
+                text_vec,
+                candidates,
+                ef_search=ef_search,
+                filters=filters,
+            )
+    if rerank:
+        with metrics.timed("search_rerank"):
+            rows = await run_in_threadpool(
+                feedback_ranking.rerank, db, query, rows, top_k
+            )
+    if not rows and not filters:
         raise HTTPException(
             status_code=400,
             detail="No images indexed. Use /index_from_folder or /index_from_zip first.",
         )
 
-    results = [
-        ImageMatchingResponse(
-            id=img.id,
-            filename=img.filename,
-            url=img.url_path,
-            score=float(score),
+    with metrics.timed("search_response"):
+        response = SearchResponse(query=query, results=_matching(rows))
+        cache_search(
+            query,
+            top_k,
+            response,
+            generation,
+            ef_search,
+            rerank,
+            filters,
+            hybrid,
+            feedback_gen=feedback_gen,
         )
-        for (img, score) in rows
-    ]
-    return SearchResponse(query=query, results=results)
+    startup.record_first_search()
+    return response
+
+
+@router.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(req: BatchSearchRequest, db: Session = Depends(get_read_db)):
+    """Search many text queries with one CLIP forward pass and one index pass.
+
+    Results come back in request order, each shaped like `/images/search`.
+    """
+    if len(req.queries) > settings.search_batch_max_queries:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.search_batch_max_queries} queries per batch",
+        )
+    ef_search = _resolve_ef_search(req.ef_search, req.tier)
+    if not req.queries:
+        return BatchSearchResponse(results=[])
+
+    metrics.BATCH_SIZE.observe("search_batch", len(req.queries))
+    with metrics.timed("search_embed"):
+        text_vecs = await clip.embed_queries_async([q.query for q in req.queries])
+    with metrics.timed("search_index"):
+        ranked = await run_in_threadpool(
+            get_search_backend().search_many,
+            db,
+            text_vecs,
+            [q.top_k for q in req.queries],
+            ef_search=ef_search,
+        )
+    if not any(ranked):
+        raise HTTPException(
+            status_code=400,
+            detail="No images indexed. Use /index_from_folder or /index_from_zip first.",
+        )
+
+    return BatchSearchResponse(
+        results=[
+            SearchResponse(query=q.query, results=_matching(rows))
+            for q, rows in zip(req.queries, ranked)
+        ]
+    )
+
+
+@router.post("/search/by-image", response_model=List[ImageMatchingResponse])
+async def search_by_image(
+    file: UploadFile = File(...),
+    top_k: int = 1,
+    ef_search: Optional[int] = Query(default=None, ge=1, le=1000),
+    tier: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Search for images similar to an uploaded image.
+
+    Indexed copies of the uploaded file (same content hash) are left out.
+    """
+    top_k = max(1, top_k)
+    ef_search = _resolve_ef_search(ef_search, tier)
+    data = await file.read()
+    try:
+        image_vecs = await run_in_threadpool(
+            clip.embed_images,
+            clip.get_model_context(),
+            [io.BytesIO(data)],
+            priority=clip.PRIORITY_INTERACTIVE,
+        )
+    except OSError as exc:  # PIL.UnidentifiedImageError and truncated files
+        raise HTTPException(status_code=400, detail="Unreadable image file") from exc
+
+    def search_excluding_upload():
+        content_hash = hashlib.sha256(data).hexdigest()
+        copies = db.scalars(select(Image.id).where(Image.content_hash == content_hash))
+        return search_excluding(db, image_vecs[0], top_k, list(copies), ef_search)
+
+    return _matching(await run_in_threadpool(search_excluding_upload))
+
+
+@router.get("/{image_id}/similar", response_model=List[ImageMatchingResponse])
+def get_similar_images(
+    image_id: int,
+    top_k: int = 1,
+    ef_search: Optional[int] = Query(default=None, ge=1, le=1000),
+    tier: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Find the images most similar to an indexed image.
+
+    The stored embedding is the query, so no model inference is involved.
+    The image itself and its indexed copies (same content hash) are left out
+    of the results.
+    """
+    top_k = max(1, top_k)
+    ef_search = _resolve_ef_search(ef_search, tier)
+    image = db.get(Image, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.embedding is None:
+        raise HTTPException(status_code=400, detail="Image has no embedding")
+    query_vec = np.asarray(image.embedding, dtype=np.float32)
+    excluded = [image_id]
+    if image.content_hash is not None:
+        excluded = list(
+            db.scalars(select(Image.id).where(Image.content_hash == image.content_hash))
+        )
+    return _matching(search_excluding(db, query_vec, top_k, excluded, ef_search))
+
+
+def _image_dict(row) -> dict:
+    return {"id": row.id, "filename": row.filename, "url": row.url_path}
 
 
 @router.get("", response_model=List[ImageResponse])
-def get_images(db: Session = Depends(get_db)):
-    """Get a list of all indexed images."""
-    items = db.query(Image).all()
-    return [
-        ImageResponse(id=item.id, filename=item.filename, url=item.url_path)
-        for item in items
-    ]
+def get_images(
+    response: Response,
+    limit: int = Query(default=None, ge=1),
+    cursor: Optional[int] = None,
+    output_format: str = Query(
+        default="json", alias="format", pattern="^(json|ndjson)$"
+    ),
+    db: Session = Depends(get_read_db),
+):
+    """List indexed images by id, one page at a time.
+
+    Pass the `X-Next-Cursor` response header as `cursor` to get the next
+    page; it is absent on the last page. With `format=ndjson` every image
+    after `cursor` is streamed as newline-delimited JSON instead.
+    """
+    # embeddings are never loaded
+    stmt = select(Image.id, Image.filename, Image.url_path)
+    if output_format == "ndjson":
+        return StreamingResponse(
+            stream_ndjson(stmt, Image.id, _image_dict, cursor),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+
+    limit = min(limit or settings.page_size, settings.max_page_size)
+    rows, next_cursor = keyset_page(db, stmt, Image.id, cursor, limit)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return [ImageResponse(**_image_dict(row)) for row in rows]
@@ -0,0 +1,13 @@
+"""Metrics Router exposing instrumentation in the Prometheus text format."""
+
+from app.core import metrics
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Per-stage latency histograms, batch sizes, queue depths and pool stats."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
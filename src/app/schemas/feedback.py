@@ -3,7 +3,7 @@ This module defines the Pydantic schemas for feedback-related data structures
 used in the iFinder application.
 """
 
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -17,10 +17,20 @@ class FeedbackRequest(BaseModel):
     score: Optional[float] = None
 
 
+class FeedbackBatchRequest(BaseModel):
+    """Request model for submitting many feedbacks at once."""
+
+    feedbacks: List[FeedbackRequest]
+
+
 class FeedbackResponse(BaseModel):
-    """Response model for feedback data."""
+    """Response model for feedback data.
+
+    `id` is null for feedback accepted by the write-behind buffer, which is
+    only assigned an id when the buffer is flushed.
+    """
 
-    id: int
+    id: Optional[int] = None
     query: str
     image_id: int
     is_good: bool
@@ -3,15 +3,35 @@ This module defines the Pydantic schemas for image-related data structures
 used in the iFinder application.
 """
 
-from typing import List
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ImageIngestionRequest(BaseModel):
     """Request model for ingesting images from a folder."""
 
     folder: str
+    collection: Optional[str] = None  # searchable with `collection=`
+
+
+class IngestionJobResponse(BaseModel):
+    """Response model for an ingestion job and its progress."""
+
+    id: int
+    folder: str
+    collection: Optional[str] = None
+    status: str
+    total: int
+    processed: int
+    indexed: int
+    skipped: int = 0
+    progress: float
+    images_per_sec: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
 
 
 class ImageResponse(BaseModel):
@@ -26,6 +46,7 @@ class ImageMatchingResponse(ImageResponse):
     """Response model for image matching results."""
 
     score: float
+    variants: Dict[str, str] = {}  # thumbnail URLs by variant name
 
 
 class SearchResponse(BaseModel):
@@ -35,6 +56,27 @@ class SearchResponse(BaseModel):
     results: List[ImageMatchingResponse]
 
 
+class BatchSearchQuery(BaseModel):
+    """One query of a batch search."""
+
+    query: str
+    top_k: int = Field(default=1, ge=1)
+
+
+class BatchSearchRequest(BaseModel):
+    """Request model for searching many text queries at once."""
+
+    queries: List[BatchSearchQuery]
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    tier: Optional[str] = None
+
+
+class BatchSearchResponse(BaseModel):
+    """Response model for a batch search, one result per query in order."""
+
+    results: List[SearchResponse]
+
+
 class ImagesSummaryResponse(BaseModel):
     """Response model for image summary."""
 
@@ -0,0 +1,162 @@
+"""Run the API in several worker processes that share one CLIP model.
+
+    python -m app.serve --host 0.0.0.0 --port 8000 --workers 4
+
+The parent process imports the application, loads the model and maps the
+search index, then forks the workers, which all accept connections on the
+socket it bound. The workers inherit the weights instead of loading their
+own copy: inference only reads them, so their pages stay shared
+copy-on-write and each added worker costs its own interpreter state, caches
+and pools rather than a whole model. Each worker then runs the application
+lifespan, starting its inference threads and warming up after the fork; the
+parent runs no forward pass, as thread pools do not survive fork.
+
+CUDA contexts and ONNX Runtime sessions do not survive fork either: with
+`settings.device` resolving to anything but "cpu" or the ONNX backend, or with
+`settings.preload_model` off, each worker loads its own model.
+
+Any worker can run an ingestion job; the exact index serializes their writes
+with a file lock. Only the first worker resumes interrupted ingestion jobs at
+startup. Workers that exit unexpectedly are restarted; SIGTERM and SIGINT
+stop them all.
+Metrics are kept per worker. With one worker, the server runs in this
+process, like `uvicorn app.main:app`.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import time
+from typing import Dict
+
+import uvicorn
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY_SECONDS = 1.0  # between a worker's exit and its replacement
+
+
+def can_share_model() -> bool:
+    """Whether the model can be loaded before forking and shared by workers."""
+    if not settings.preload_model or settings.encoder_backend != "torch":
+        return False
+    from app.ml.clip import resolve_device  # pylint: disable=import-outside-toplevel
+
+    return resolve_device(settings.device) == "cpu"
+
+
+def preload():
+    """Import the application and load what the workers will share.
+
+    Returns:
+        FastAPI: The application.
+    """
+    # pylint: disable=import-outside-toplevel,unused-import
+    from app.db.base import SessionLocal
+    from app.index import get_search_backend
+    from app.main import app
+    from app.ml import clip
+
+    if can_share_model():
+        clip.get_model_context().get_model()
+    else:
+        logger.info("Each worker loads its own model")
+    get_search_backend().prepare(SessionLocal)
+    # objects allocated so far are never collected, so the workers' garbage
+    # collector does not write to, and unshare, their pages
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def _run_worker(config: uvicorn.Config, sock, resume_jobs: bool) -> None:
+    settings.ingestion_resume_jobs = resume_jobs
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)  # uvicorn installs its own
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(app, host: str, port: int, workers: int) -> None:
+    """Serve `app`, forking `workers` processes if there is more than one.
+
+    Args:
+        app (FastAPI): The application, preloaded in this process.
+        host (str): Address to bind.
+        port (int): Port to bind.
+        workers (int): Number of worker processes.
+    """
+    config = uvicorn.Config(app, host=host, port=port)
+    if workers <= 1:
+        uvicorn.Server(config).run()
+        return
+    sock = config.bind_socket()
+    children: Dict[int, int] = {}  # pid -> worker index
+    stopping = False
+
+    def spawn(index: int, resume_jobs: bool) -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                _run_worker(config, sock, resume_jobs)
+                status = 0
+            finally:
+                os._exit(status)  # skip the parent's exit handlers
+        children[pid] = index
+
+    def stop(_signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        # a restarted worker does not resume jobs, which may still be running
+        # in the others
+        spawn(index, resume_jobs=settings.ingestion_resume_jobs and index == 0)
+    logger.info("Started %d workers on %s:%d", workers, host, port)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(
+            "Worker %d (pid %d) exited with status %d, restarting",
+            index,
+            pid,
+            os.waitstatus_to_exitcode(status),
+        )
+        time.sleep(RESTART_DELAY_SECONDS)
+        if not stopping:
+            spawn(index, resume_jobs=False)
+    sock.close()
+
+
+def main():
+    """Run the API server, sharing the CLIP model across worker processes."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.workers,
+        help="worker processes (default: WEB_CONCURRENCY or 1)",
+    )
+    args = parser.parse_args()
+    serve(preload(), args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Bulk feedback writes and the write-behind feedback buffer.
+
+With `settings.feedback_buffer_enabled`, accepted feedback is queued in
+process and written by a background thread in one multi-row INSERT and one
+commit per flush, every `feedback_buffer_flush_interval_ms` or as soon as
+`feedback_buffer_max_size` rows are waiting. Each row keeps the time it was
+received as `created_at`. Rows still buffered when the process stops are
+flushed by `FeedbackBuffer.stop`; a crash loses at most one interval.
+
+Rows of a failed flush are retried by the next ones, up to
+`feedback_buffer_max_attempts` flushes each. While the database is down, at
+most `feedback_buffer_max_pending` rows are kept and the oldest are dropped
+first. Dropped rows are logged and counted as "feedback" errors.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.db.models.feedback import Feedback
+from app.db.models.image import Image
+from app.services.feedback_ranking import update_aggregates
+from app.services.search import bump_feedback_generation
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def missing_image_ids(db: Session, image_ids: Iterable[int]) -> Set[int]:
+    """Return the ids among `image_ids` that match no image, in one query."""
+    wanted = set(image_ids)
+    if not wanted:
+        return set()
+    found = db.scalars(select(Image.id).where(Image.id.in_(wanted)))
+    return wanted - set(found)
+
+
+def insert_feedbacks(db: Session, rows: List[Dict]) -> List:
+    """Insert feedback rows with a single executemany INSERT ... RETURNING.
+
+    Rows without `created_at` get the database's timestamp. The feedback
+    aggregates are updated in the same transaction; the caller commits.
+
+    Args:
+        db (Session): Database session.
+        rows (List[Dict]): Column values of each row; all rows have the same keys.
+
+    Returns:
+        List: (id, created_at) of each row, in input order.
+    """
+    if not rows:
+        return []
+    inserted = db.execute(
+        insert(Feedback).returning(
+            Feedback.id, Feedback.created_at, sort_by_parameter_order=True
+        ),
+        rows,
+    ).all()
+    update_aggregates(
+        db,
+        (
+            (row["query_text"], row["image_id"], row["is_good"], created_at)
+            for row, (_, created_at) in zip(rows, inserted)
+        ),
+    )
+    return inserted
+
+
+class FeedbackBuffer:
+    """Buffers feedback rows in memory and writes them in bulk.
+
+    Attributes:
+        max_size (int): Buffered rows that trigger an immediate flush.
+        flush_interval (float): Seconds between periodic flushes.
+        max_pending (int): Buffered rows kept at most; the oldest are dropped.
+        max_attempts (int): Failed flushes after which a row is dropped.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_size: int = 500,
+        flush_interval_ms: float = 1000,
+        max_pending: int = 100_000,
+        max_attempts: int = 5,
+    ):
+        self.session_factory = session_factory
+        self.max_size = max(1, max_size)
+        self.flush_interval = max(0.001, flush_interval_ms / 1000)
+        self.max_pending = max(self.max_size, max_pending)
+        self.max_attempts = max(1, max_attempts)
+        # (row, failed flushes), oldest first
+        self._rows: List[Tuple[Dict, int]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def start(self) -> None:
+        """Start the flushing thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="feedback-buffer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the flushing thread after writing every buffered row."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def add(self, rows: List[Dict]) -> datetime:
+        """Queue feedback rows, stamping them with the current time.
+
+        Returns:
+            datetime: The `created_at` given to the rows.
+        """
+        now = datetime.now(timezone.utc)
+        self.start()
+        with self._lock:
+            self._rows.extend(({**row, "created_at": now}, 0) for row in rows)
+            self._trim()
+            full = len(self._rows) >= self.max_size
+        if full:
+            self._wake.set()
+        return now
+
+    def flush(self) -> int:
+        """Write every buffered row now.
+
+        Rows whose image was deleted since they were accepted, and rows that
+        violate another constraint, are dropped. If the write fails, the rows
+        are kept for the next flush, unless they failed `max_attempts` times.
+
+        Returns:
+            int: Number of rows written.
+        """
+        with self._lock:
+            entries, self._rows = self._rows, []
+        if not entries:
+            return 0
+        try:
+            return self._write([row for row, _ in entries])
+        except Exception:
+            retried = [(row, failed + 1) for row, failed in entries]
+            kept = [entry for entry in retried if entry[1] < self.max_attempts]
+            self._drop(len(retried) - len(kept), "after failed flushes")
+            # ahead of newer rows
+            with self._lock:
+                self._rows[:0] = kept
+                self._trim()
+            raise
+
+    def _trim(self) -> None:
+        # called with the lock held
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            del self._rows[:overflow]
+            self._drop(overflow, "over the buffer limit")
+
+    @staticmethod
+    def _drop(count: int, reason: str) -> None:
+        if count:
+            logger.error("Dropped %d buffered feedback rows %s", count, reason)
+            metrics.ERRORS.inc("feedback", count)
+
+    def _write(self, rows: List[Dict]) -> int:
+        metrics.BATCH_SIZE.observe("feedback_flush", len(rows))
+        with self.session_factory() as db:
+            try:
+                insert_feedbacks(db, rows)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                rows = self._write_valid(db, rows)
+        bump_feedback_generation()
+        return len(rows)
+
+    def _write_valid(self, db: Session, rows: List[Dict]) -> List[Dict]:
+        missing = missing_image_ids(db, (row["image_id"] for row in rows))
+        if missing:
+            logger.warning("Dropping feedback for deleted images %s", missing)
+            rows = [row for row in rows if row["image_id"] not in missing]
+        try:
+            with db.begin_nested():
+                insert_feedbacks(db, rows)
+        except IntegrityError:
+            # another constraint: write row by row to find the offending ones
+            written = []
+            for row in rows:
+                try:
+                    with db.begin_nested():
+                        insert_feedbacks(db, [row])
+                    written.append(row)
+                except IntegrityError:
+                    logger.exception("Could not write feedback %s", row)
+            self._drop(len(rows) - len(written), "violating a constraint")
+            rows = written
+        db.commit()
+        return rows
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Feedback flush failed")
+
+
+_buffer = None
+
+
+def get_feedback_buffer() -> FeedbackBuffer:
+    """Get the global feedback buffer, creating it if necessary.
+
+    Returns:
+        FeedbackBuffer: The buffer sized by the `feedback_buffer_*` settings.
+    """
+    global _buffer
+    if _buffer is None:
+        _buffer = FeedbackBuffer(
+            max_size=settings.feedback_buffer_max_size,
+            flush_interval_ms=settings.feedback_buffer_flush_interval_ms,
+            max_pending=settings.feedback_buffer_max_pending,
+            max_attempts=settings.feedback_buffer_max_attempts,
+        )
+    return _buffer
+
+
+metrics.QUEUE_DEPTH.track(
+    "feedback_buffer", lambda: len(_buffer) if _buffer is not None else 0
+)
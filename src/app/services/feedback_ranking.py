@@ -0,0 +1,192 @@
+"""Feedback aggregates and feedback-aware re-ranking of search results.
+
+Every feedback row adds to two `FeedbackAggregate` rows: the image's counts
+for the normalized query, and its counts over every query (`query = ""`).
+Counts decay exponentially with `settings.feedback_half_life_days`. They are
+stored scaled to `FEEDBACK_EPOCH`: feedback received at time t adds
+2^((t - epoch) / half_life), and the stored sums are multiplied by
+2^(-(now - epoch) / half_life) when read. Recording feedback is therefore a
+plain increment and reading it needs no per-row timestamps.
+
+Re-ranking looks up the aggregates of an oversampled candidate set in one
+primary-key lookup and adds to each cosine score
+
+    query_weight * net(query counts) + image_weight * net(image counts)
+
+where net = (good - bad) / (good + bad + prior) lies in (-1, 1) and the
+prior keeps a single vote from moving an image far.
+
+The stored sums are tied to the half-life: after changing it, or to
+aggregate feedback recorded before the table existed, run
+
+    python -m app.services.feedback_ranking
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.db.models.feedback import Feedback
+from app.db.models.feedback_aggregate import FeedbackAggregate
+from app.db.models.image import Image
+from app.ml.clip import normalize_query
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+FEEDBACK_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+ANY_QUERY = ""
+
+
+def decay_scale(at: datetime) -> float:
+    """Factor converting stored (epoch-scaled) counts to counts at time `at`."""
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)  # SQLite drops the time zone
+    half_life = settings.feedback_half_life_days * 86400
+    return 2.0 ** (-(at - FEEDBACK_EPOCH).total_seconds() / half_life)
+
+
+def _accumulate(
+    totals: Dict[Tuple[str, int], List[float]],
+    feedbacks: Iterable[Tuple[str, int, bool, datetime]],
+) -> None:
+    for query_text, image_id, is_good, created_at in feedbacks:
+        weight = 1.0 / decay_scale(created_at)
+        for query in (normalize_query(query_text), ANY_QUERY):
+            totals[(query, image_id)][0 if is_good else 1] += weight
+
+
+def _upsert(db: Session, totals: Dict[Tuple[str, int], List[float]]) -> None:
+    if not totals:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(FeedbackAggregate)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FeedbackAggregate.query, FeedbackAggregate.image_id],
+        set_={
+            "good": FeedbackAggregate.good + stmt.excluded.good,
+            "bad": FeedbackAggregate.bad + stmt.excluded.bad,
+        },
+    )
+    # a fixed key order keeps concurrent upserts from deadlocking
+    rows = [
+        {"query": query, "image_id": image_id, "good": good, "bad": bad}
+        for (query, image_id), (good, bad) in sorted(totals.items())
+    ]
+    db.execute(stmt, rows)
+
+
+def update_aggregates(
+    db: Session, feedbacks: Iterable[Tuple[str, int, bool, datetime]]
+) -> None:
+    """Add new feedback to the aggregates, in the caller's transaction.
+
+    Args:
+        db (Session): Database session.
+        feedbacks (Iterable[Tuple[str, int, bool, datetime]]): (query_text,
+            image_id, is_good, created_at) of each new feedback row.
+    """
+    totals: Dict[Tuple[str, int], List[float]] = defaultdict(lambda: [0.0, 0.0])
+    _accumulate(totals, feedbacks)
+    _upsert(db, totals)
+
+
+def rebuild_aggregates(db: Session) -> int:
+    """Recompute every aggregate from the feedbacks table. The caller commits.
+
+    Returns:
+        int: Number of feedback rows aggregated.
+    """
+    db.execute(delete(FeedbackAggregate))
+    totals: Dict[Tuple[str, int], List[float]] = defaultdict(lambda: [0.0, 0.0])
+    feedbacks = db.execute(
+        select(
+            Feedback.query_text,
+            Feedback.image_id,
+            Feedback.is_good,
+            Feedback.created_at,
+        )
+    ).all()
+    _accumulate(totals, feedbacks)
+    _upsert(db, totals)
+    return len(feedbacks)
+
+
+def feedback_boosts(
+    db: Session,
+    query: str,
+    image_ids: Iterable[int],
+    now: Optional[datetime] = None,
+) -> Dict[int, float]:
+    """Score adjustment of each image from its feedback, in one lookup.
+
+    Args:
+        db (Session): Database session.
+        query (str): Text query as sent by the client.
+        image_ids (Iterable[int]): Candidate image ids.
+        now (datetime, optional): Time the counts are decayed to.
+
+    Returns:
+        Dict[int, float]: Boost per image id; images without feedback are absent.
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return {}
+    rows = db.execute(
+        select(
+            FeedbackAggregate.query,
+            FeedbackAggregate.image_id,
+            FeedbackAggregate.good,
+            FeedbackAggregate.bad,
+        ).where(
+            FeedbackAggregate.query.in_([normalize_query(query), ANY_QUERY]),
+            FeedbackAggregate.image_id.in_(image_ids),
+        )
+    )
+    scale = decay_scale(now or datetime.now(timezone.utc))
+    boosts: Dict[int, float] = defaultdict(float)
+    for agg_query, image_id, good, bad in rows:
+        good, bad = good * scale, bad * scale
+        net = (good - bad) / (good + bad + settings.feedback_prior)
+        if agg_query == ANY_QUERY:
+            boosts[image_id] += settings.feedback_image_weight * net
+        else:
+            boosts[image_id] += settings.feedback_query_weight * net
+    return dict(boosts)
+
+
+def rerank(
+    db: Session, query: str, rows: List[Tuple[Image, float]], top_k: int
+) -> List[Tuple[Image, float]]:
+    """Blend feedback into the cosine scores of candidates and keep the best.
+
+    Args:
+        db (Session): Database session.
+        query (str): Text query as sent by the client.
+        rows (List[Tuple[Image, float]]): Candidates with cosine similarities.
+        top_k (int): Number of results to keep.
+
+    Returns:
+        List[Tuple[Image, float]]: (image, blended score) pairs, best first.
+    """
+    boosts = feedback_boosts(db, query, (img.id for img, _ in rows))
+    blended = [(img, score + boosts.get(img.id, 0.0)) for img, score in rows]
+    blended.sort(key=lambda row: row[1], reverse=True)
+    return blended[:top_k]
+
+
+def main():
+    """Rebuild the feedback aggregates from every recorded feedback."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.parse_args()
+    with SessionLocal() as db:
+        count = rebuild_aggregates(db)
+        db.commit()
+    print(f"Aggregated {count} feedbacks")
+
+
+if __name__ == "__main__":
+    main()
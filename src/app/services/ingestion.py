@@ -0,0 +1,395 @@
+"""Background ingestion of image folders.
+
+Ingestion jobs are persisted in the `ingestion_jobs` table and processed by a
+single worker thread. A job walks the sorted files of its folder in chunks of
+`settings.ingestion_chunk_size`: each chunk is placed, embedded and committed
+together with the job checkpoint, so an interrupted job resumes from its last
+committed chunk instead of starting over. Thumbnail variants are written from
+the images decoded for CLIP. Files that cannot be decoded are skipped and
+counted, so that one corrupt file does not fail the whole job.
+"""
+
+import hashlib
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from app.core import metrics
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.db.bulk import bulk_insert_images
+from app.db.models.image import Image
+from app.db.models.ingestion_job import (
+    ACTIVE_JOB_STATUSES,
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_RUNNING,
+    IngestionJob,
+)
+from app.db.models.ingestion_manifest import IngestionManifestEntry
+from app.index import get_search_backend
+from app.ml import clip
+from app.services import storage, thumbnails
+from app.services.search import bump_index_generation
+from sqlalchemy import select
+from sqlalchemy.orm import Session, defer
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ("*.jpg", "*.jpeg", "*.png", "*.webp", "*.bmp", "*.gif")
+
+
+def list_image_files(folder: Path) -> List[Path]:
+    """List the image files of a folder in a stable order.
+
+    The order must be deterministic across runs since job checkpoints are
+    offsets into this list.
+    """
+    image_paths: List[Path] = []
+    for ext in IMAGE_EXTENSIONS:
+        image_paths.extend(sorted(folder.glob(ext)))
+    return image_paths
+
+
+def hash_file(path: Path, block_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 of a file, streaming it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_chunk(db: Session, image_paths: List[Path]) -> Dict[Path, str]:
+    """Hash a chunk of files from one folder, reusing the folder manifest.
+
+    Files whose size and mtime match their manifest entry keep the recorded
+    hash; the others are hashed and their manifest entry is updated.
+
+    Args:
+        db (Session): Database session.
+        image_paths (List[Path]): Source image files, all in the same folder.
+
+    Returns:
+        Dict[Path, str]: Content hash of every file.
+    """
+    if not image_paths:
+        return {}
+    folder = str(image_paths[0].parent)
+    entries = {
+        entry.path: entry
+        for entry in db.scalars(
+            select(IngestionManifestEntry).where(
+                IngestionManifestEntry.folder == folder,
+                IngestionManifestEntry.path.in_([p.name for p in image_paths]),
+            )
+        )
+    }
+
+    hashes = {}
+    for src in image_paths:
+        stat = src.stat()
+        entry = entries.get(src.name)
+        if (
+            entry is not None
+            and entry.size == stat.st_size
+            and entry.mtime_ns == stat.st_mtime_ns
+        ):
+            hashes[src] = entry.content_hash
+            continue
+        if entry is None:
+            entry = IngestionManifestEntry(folder=folder, path=src.name)
+            db.add(entry)
+        entry.size = stat.st_size
+        entry.mtime_ns = stat.st_mtime_ns
+        entry.content_hash = hashes[src] = hash_file(src)
+    return hashes
+
+
+def ingest_chunk(
+    db: Session, image_paths: List[Path], collection: Optional[str] = None
+) -> Tuple[List[int], np.ndarray, int]:
+    """Place, embed and write a chunk of images in the session's transaction.
+
+    Every file is indexed under its own filename, but each content is only
+    embedded once: a file whose content hash is already indexed, or comes
+    earlier in the chunk, gets a copy of that embedding. Files of the same
+    name and content as their indexed image are left unchanged. New images
+    are written with the bulk COPY path, changed ones through the ORM. The
+    caller is responsible for committing. Indexed images found again are
+    moved to this folder and, if given, collection. Files that cannot be
+    decoded are logged, counted as "ingest_decode" errors and left out.
+
+    Args:
+        db (Session): Database session.
+        image_paths (List[Path]): Source image files, all in the same folder.
+        collection (str, optional): Collection of the images.
+
+    Returns:
+        Tuple[List[int], np.ndarray, int]: Ids of the new or changed images,
+        their embeddings, and the number of files skipped.
+    """
+    metrics.BATCH_SIZE.observe("ingest_chunk", len(image_paths))
+    folder = str(image_paths[0].parent) if image_paths else None
+    with metrics.timed("ingest_hash"):
+        hashes = hash_chunk(db, image_paths)
+    by_name = {
+        item.filename: item
+        for item in db.scalars(
+            select(Image)
+            .options(defer(Image.embedding))
+            .where(Image.filename.in_([p.name for p in image_paths]))
+        )
+    }
+
+    pending = []  # (servable path, url, existing row or None, content hash)
+    for src in image_paths:
+        content_hash = hashes[src]
+        existing = by_name.get(src.name)
+        dest = storage.IMAGES_DIR / src.name
+        if existing is not None:
+            existing.source_folder = folder
+            if collection is not None:
+                existing.collection = collection
+        if existing is not None and existing.content_hash is None:
+            # row indexed before content hashing: backfill from the stored copy
+            if dest.exists() and hash_file(dest) == content_hash:
+                existing.content_hash = content_hash
+        if existing is not None and existing.content_hash == content_hash:
+            continue  # unchanged
+        path, url = storage.place_image(src)
+        pending.append((path, url, existing, content_hash))
+
+    empty = np.zeros((0, Image.embedding.type.dim), dtype=np.float32)
+    if not pending:
+        return [], empty, 0
+
+    # content indexed under another name: reuse its embedding
+    by_hash = dict(
+        db.execute(
+            select(Image.content_hash, Image.embedding).where(
+                Image.content_hash.in_({item[3] for item in pending})
+            )
+        ).all()
+    )
+    to_embed = set()
+    hash_by_path = {}  # files to embed, one per new content
+    for path, _, _, content_hash in pending:
+        if content_hash not in by_hash and content_hash not in to_embed:
+            hash_by_path[str(path)] = content_hash
+            to_embed.add(content_hash)
+
+    failed = set()
+
+    def save_thumbnails(path: str, image) -> None:
+        thumbnails.save_variants(image, hash_by_path[path])
+
+    def skip(path: str, exc: Exception) -> None:
+        logger.warning("Skipping %s, which cannot be decoded: %s", path, exc)
+        metrics.ERRORS.inc("ingest_decode")
+        failed.add(path)
+
+    if hash_by_path:
+        # decoding runs on worker threads, overlapping with the forward passes
+        with metrics.timed("ingest_embed"):
+            embeddings = clip.embed_images(
+                clip.get_model_context(),
+                list(hash_by_path),
+                on_decoded=save_thumbnails,
+                on_error=skip,
+            )
+        decoded = [path for path in hash_by_path if path not in failed]
+        by_hash.update(zip((hash_by_path[path] for path in decoded), embeddings))
+
+    ids, ordered_embeddings, new_rows, skipped = [], [], [], 0
+    for path, url, existing, content_hash in pending:
+        if content_hash not in by_hash:
+            skipped += 1  # could not be decoded
+            continue
+        emb = np.asarray(by_hash[content_hash], dtype=np.float32)
+        if existing is None:
+            new_rows.append((path.name, url, content_hash, emb))
+            continue
+        existing.url_path = url
+        existing.embedding = emb
+        existing.content_hash = content_hash
+        ids.append(existing.id)
+        ordered_embeddings.append(emb)
+    if new_rows:
+        filenames, url_paths, content_hashes, new_embeddings = zip(*new_rows)
+        with metrics.timed("ingest_write"):
+            ids.extend(
+                bulk_insert_images(
+                    db,
+                    filenames,
+                    url_paths,
+                    np.vstack(new_embeddings),
+                    content_hashes,
+                    collection=collection,
+                    source_folder=folder,
+                )
+            )
+        ordered_embeddings.extend(new_embeddings)
+    if not ids:
+        return [], empty, skipped
+    return ids, np.vstack(ordered_embeddings), skipped
+
+
+def run_job(
+    job_id: int,
+    session_factory=SessionLocal,
+    stop_event: Optional[threading.Event] = None,
+) -> None:
+    """Run (or resume) an ingestion job until it completes, fails or is stopped.
+
+    Args:
+        job_id (int): Id of the job to run.
+        session_factory: Callable returning a new database session.
+        stop_event (threading.Event, optional): When set, the job stops after
+            the current chunk and stays resumable.
+    """
+    with session_factory() as db:
+        job = db.get(IngestionJob, job_id)
+        if job is None or job.status not in ACTIVE_JOB_STATUSES:
+            return
+        try:
+            image_paths = list_image_files(Path(job.folder))
+            job.status = JOB_RUNNING
+            job.total = len(image_paths)
+            job.started_offset = job.next_offset
+            job.started_at = datetime.now(timezone.utc)
+            job.error = None
+            db.commit()
+
+            chunk_size = max(1, settings.ingestion_chunk_size)
+            for start in range(job.next_offset, len(image_paths), chunk_size):
+                if stop_event is not None and stop_event.is_set():
+                    logger.info("Ingestion job %s paused at %s", job_id, start)
+                    return
+                ids, embeddings, skipped = ingest_chunk(
+                    db, image_paths[start : start + chunk_size], job.collection
+                )
+                job.indexed += len(ids)
+                job.skipped += skipped
+                job.next_offset = min(start + chunk_size, len(image_paths))
+                with metrics.timed("ingest_commit"):
+                    db.commit()
+                if ids:
+                    with metrics.timed("ingest_index"):
+                        get_search_backend().add(ids, embeddings)
+                    bump_index_generation()
+
+            job.status = JOB_COMPLETED
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("Ingestion job %s failed", job_id)
+            db.rollback()
+            _mark_failed(job_id, session_factory, exc)
+
+
+def _mark_failed(job_id: int, session_factory, exc: Exception) -> None:
+    # in a new session: the job's session may have lost its connection
+    try:
+        with session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            job.status = JOB_FAILED
+            job.error = str(exc)
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+    except Exception:  # pylint: disable=broad-except
+        # the job stays active and is resumed at the next startup
+        logger.exception("Could not mark ingestion job %s as failed", job_id)
+
+
+class IngestionWorker:
+    """Single background thread processing queued ingestion jobs in order."""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the worker thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="ingestion-worker", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, job_id: int) -> None:
+        """Queue a job for processing."""
+        self.start()
+        self._queue.put(job_id)
+
+    def resume_active_jobs(self) -> List[int]:
+        """Queue every pending or interrupted job, oldest first.
+
+        Returns:
+            List[int]: Ids of the queued jobs.
+        """
+        with self.session_factory() as db:
+            job_ids = list(
+                db.scalars(
+                    select(IngestionJob.id)
+                    .where(IngestionJob.status.in_(ACTIVE_JOB_STATUSES))
+                    .order_by(IngestionJob.id)
+                )
+            )
+        for job_id in job_ids:
+            self.submit(job_id)
+        return job_ids
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker after its current chunk; running jobs stay resumable."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def queued(self) -> int:
+        """Number of jobs waiting behind the running one."""
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None or self._stop_event.is_set():
+                return
+            try:
+                run_job(job_id, self.session_factory, self._stop_event)
+            except Exception:  # pylint: disable=broad-except
+                # e.g. the database is unreachable; keep serving later jobs
+                logger.exception("Ingestion job %s could not run", job_id)
+
+
+_worker = None
+
+
+def get_worker() -> IngestionWorker:
+    """Get the global ingestion worker, creating it if necessary.
+
+    Returns:
+        IngestionWorker: The global ingestion worker.
+    """
+    global _worker
+    if _worker is None:
+        _worker = IngestionWorker()
+    return _worker
+
+
+metrics.QUEUE_DEPTH.track(
+    "ingestion_jobs", lambda: _worker.queued() if _worker is not None else 0
+)
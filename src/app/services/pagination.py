@@ -0,0 +1,80 @@
+"""Keyset pagination and NDJSON export of large tables.
+
+Pages are ordered by a unique, indexed key (the primary key) and a page
+starts strictly after the last key of the previous one, so every page is an
+index range scan however deep the client has paged. Exports stream rows
+from a server-side cursor in batches, in constant memory.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db.base import ReadSessionLocal
+from sqlalchemy import Select
+from sqlalchemy.orm import Session
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def keyset_page(
+    db: Session,
+    stmt: Select,
+    key,
+    cursor: Optional[int],
+    limit: int,
+) -> Tuple[List[Any], Optional[int]]:
+    """Fetch one page of rows ordered by `key`.
+
+    Args:
+        db (Session): Database session.
+        stmt (Select): Statement selecting the rows, without ordering or limit.
+        key: Unique column to paginate on, selected by `stmt` as `key.name`.
+        cursor (int, optional): Key of the last row of the previous page.
+        limit (int): Page size.
+
+    Returns:
+        Tuple[List[Any], Optional[int]]: The rows, and the cursor of the next
+        page or None on the last page.
+    """
+    if cursor is not None:
+        stmt = stmt.where(key > cursor)
+    # one extra row tells whether there is a next page
+    rows = db.execute(stmt.order_by(key).limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, getattr(rows[-1], key.name)
+
+
+def stream_ndjson(
+    stmt: Select,
+    key,
+    to_dict: Callable[[Any], Dict[str, Any]],
+    cursor: Optional[int] = None,
+    session_factory=ReadSessionLocal,
+) -> Iterator[bytes]:
+    """Yield rows as newline-delimited JSON from a server-side cursor.
+
+    The generator owns its session, since it outlives the request handler.
+
+    Args:
+        stmt (Select): Statement selecting the rows, without ordering.
+        key: Unique column to order on.
+        to_dict (Callable): Converts a row to a JSON-serializable dict.
+        cursor (int, optional): Only export rows with a larger key.
+        session_factory: Callable returning a new database session.
+
+    Yields:
+        bytes: Batches of NDJSON lines.
+    """
+    if cursor is not None:
+        stmt = stmt.where(key > cursor)
+    batch_size = settings.export_batch_size
+    with session_factory() as db:
+        result = db.execute(
+            stmt.order_by(key).execution_options(yield_per=batch_size)
+        )
+        for rows in result.partitions():
+            yield "".join(json.dumps(to_dict(row)) + "\n" for row in rows).encode()
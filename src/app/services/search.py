@@ -0,0 +1,262 @@
+"""Search helpers shared by the image router and the application lifespan."""
+
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.base import ReadSessionLocal
+from app.db.models.feedback import Feedback
+from app.db.models.image import Image
+from app.index import SearchFilters, get_search_backend
+from app.ml import clip
+from app.schemas.image import SearchResponse
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_generation = 0
+_feedback_generation = 0
+_generation_lock = threading.Lock()
+
+
+def index_generation() -> int:
+    """Return the current generation of the image index.
+
+    The generation is bumped every time ingestion commits new images, so any
+    result computed under an older generation may be stale. It is tracked per
+    process; `settings.search_cache_ttl_seconds` bounds staleness for images
+    ingested by another process.
+    """
+    return _generation
+
+
+def bump_index_generation() -> int:
+    """Mark every cached search result as stale.
+
+    Returns:
+        int: The new generation.
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        return _generation
+
+
+def feedback_generation() -> int:
+    """Return the current generation of the recorded feedback.
+
+    It is bumped every time feedback is committed, so results re-ranked under
+    an older generation may be stale. Like the index generation it is tracked
+    per process.
+    """
+    return _feedback_generation
+
+
+def bump_feedback_generation() -> int:
+    """Mark every cached re-ranked search result as stale.
+
+    Returns:
+        int: The new generation.
+    """
+    global _feedback_generation
+    with _generation_lock:
+        _feedback_generation += 1
+        return _feedback_generation
+
+
+_result_cache = None
+
+
+def get_result_cache() -> LRUCache:
+    """Get the global search result cache, creating it if necessary.
+
+    Returns:
+        LRUCache: Cache of (generation, feedback generation, top_k,
+        SearchResponse) keyed by (model name, normalized query, options).
+    """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = LRUCache(
+            settings.search_cache_size, ttl_seconds=settings.search_cache_ttl_seconds
+        )
+    return _result_cache
+
+
+def resolve_ef_search(ef_search: Optional[int], tier: Optional[str]) -> Optional[int]:
+    """Pick the HNSW `ef_search` of a request.
+
+    An explicit `ef_search` wins over a named tier from
+    `settings.hnsw_ef_search_tiers`; with neither, the backend default is used.
+
+    Raises:
+        ValueError: If the tier is unknown.
+    """
+    if ef_search is not None:
+        return ef_search
+    if tier is None:
+        return None
+    if tier not in settings.hnsw_ef_search_tiers:
+        raise ValueError(
+            f"Unknown search tier: {tier}. "
+            f"Expected one of {sorted(settings.hnsw_ef_search_tiers)}"
+        )
+    return settings.hnsw_ef_search_tiers[tier]
+
+
+def _result_key(
+    query: str,
+    ef_search: Optional[int],
+    rerank: bool,
+    filters: Optional[SearchFilters],
+    hybrid: bool,
+) -> tuple:
+    return (
+        clip.get_model_context().model_name,
+        clip.normalize_query(query),
+        ef_search,
+        rerank,
+        filters or None,
+        hybrid,
+    )
+
+
+def get_cached_search(
+    query: str,
+    top_k: int,
+    ef_search: Optional[int] = None,
+    rerank: bool = False,
+    filters: Optional[SearchFilters] = None,
+    hybrid: bool = False,
+) -> Optional[SearchResponse]:
+    """Return a cached search response, if one is fresh and large enough.
+
+    A response cached for `cached_k` results also serves any `top_k <= cached_k`,
+    as well as any `top_k` when it already holds every indexed image.
+    Re-ranked responses are also stale once new feedback is committed.
+
+    Args:
+        query (str): Text query as sent by the client.
+        top_k (int): Number of results requested.
+        ef_search (int, optional): HNSW `ef_search` of the request.
+        rerank (bool): Whether the results were re-ranked with feedback.
+        filters (SearchFilters, optional): Filters of the request.
+        hybrid (bool): Whether filename matches were fused into the ranking.
+
+    Returns:
+        Optional[SearchResponse]: The response, or None on a miss.
+    """
+    entry = get_result_cache().get(
+        _result_key(query, ef_search, rerank, filters, hybrid)
+    )
+    if entry is None:
+        return None
+    generation, feedback_gen, cached_k, response = entry
+    if generation != index_generation():
+        return None
+    if rerank and feedback_gen != feedback_generation():
+        return None
+    exhausted = len(response.results) < cached_k
+    if top_k > cached_k and not exhausted:
+        return None
+    return response.model_copy(
+        update={"query": query, "results": response.results[:top_k]}
+    )
+
+
+def cache_search(
+    query: str,
+    top_k: int,
+    response: SearchResponse,
+    generation: int,
+    ef_search: Optional[int] = None,
+    rerank: bool = False,
+    filters: Optional[SearchFilters] = None,
+    hybrid: bool = False,
+    feedback_gen: Optional[int] = None,
+) -> None:
+    """Cache a search response computed under `generation`.
+
+    A larger cached result for the same query and generation is kept.
+
+    Args:
+        query (str): Text query as sent by the client.
+        top_k (int): Number of results requested.
+        response (SearchResponse): The computed response.
+        generation (int): Index generation read before running the search.
+        ef_search (int, optional): HNSW `ef_search` of the request.
+        rerank (bool): Whether the results were re-ranked with feedback.
+        filters (SearchFilters, optional): Filters of the request.
+        hybrid (bool): Whether filename matches were fused into the ranking.
+        feedback_gen (int, optional): Feedback generation read before running
+            the search; re-ranked responses cached without it never hit.
+    """
+    cache = get_result_cache()
+    key = _result_key(query, ef_search, rerank, filters, hybrid)
+    entry = cache.peek(key)
+    if (
+        entry is not None
+        and entry[:2] == (generation, feedback_gen)
+        and entry[2] >= top_k
+    ):
+        return
+    cache.put(key, (generation, feedback_gen, top_k, response))
+
+
+def search_excluding(
+    db: Session,
+    query_vec: np.ndarray,
+    top_k: int,
+    exclude_ids: Iterable[int],
+    ef_search: Optional[int] = None,
+) -> List[Tuple[Image, float]]:
+    """Search the index, leaving out some images such as the query image.
+
+    Args:
+        db (Session): Database session.
+        query_vec (np.ndarray): Unit-norm query embedding.
+        top_k (int): Number of results.
+        exclude_ids (Iterable[int]): Ids of images to leave out.
+        ef_search (int, optional): HNSW `ef_search` of the request.
+
+    Returns:
+        List[Tuple[Image, float]]: (image, cosine similarity) pairs, best first.
+    """
+    exclude = set(exclude_ids)
+    rows = get_search_backend().search(
+        db, query_vec, top_k + len(exclude), ef_search=ef_search
+    )
+    return [(img, score) for img, score in rows if img.id not in exclude][:top_k]
+
+
+def prewarm_text_cache(
+    session_factory=ReadSessionLocal, limit: Optional[int] = None
+) -> int:
+    """Embed the most frequent feedback queries into the text cache.
+
+    Args:
+        session_factory: Callable returning a new database session.
+        limit (int, optional): Number of queries to warm. Defaults to
+            `settings.text_cache_prewarm`.
+
+    Returns:
+        int: Number of distinct queries cached.
+    """
+    limit = settings.text_cache_prewarm if limit is None else limit
+    if limit <= 0:
+        return 0
+    with session_factory() as db:
+        queries = list(
+            db.scalars(
+                select(Feedback.query_text)
+                .group_by(Feedback.query_text)
+                .order_by(func.count().desc())
+                .limit(limit)
+            )
+        )
+    warmed = clip.warm_text_cache(queries)
+    logger.info("Pre-warmed text cache with %s queries", warmed)
+    return warmed
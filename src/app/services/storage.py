@@ -0,0 +1,163 @@
+"""Placement of ingested image files for static serving.
+
+Ingested files are made available under `IMAGES_DIR` (served at
+`RAW_IMAGE_ENDPOINT`) without copying bytes through Python when possible:
+
+- "reflink": copy-on-write clone (btrfs, XFS, ...); no extra disk use.
+- "hardlink": a second name for the same inode; source and index must share
+  a filesystem.
+- "symlink": a link to the source file, which must stay in place.
+- "reference": nothing is written; the file is served from `DATA_DIR` at
+  `DATA_ENDPOINT`. Files outside `DATA_DIR` fall back to "symlink".
+- "copy": a streamed copy.
+- "auto": reflink, then hardlink, then copy.
+
+`CachedStaticFiles` serves these files with a `Cache-Control` header, and
+content-addressed files (thumbnails) with a strong ETag derived from their
+path, identical on every server.
+"""
+
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.core.config import settings
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+
+logger = logging.getLogger(__name__)
+
+PLACEMENT_MODES = ("auto", "reflink", "hardlink", "symlink", "reference", "copy")
+
+IMAGES_DIR = Path(settings.images_dir)
+IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+RAW_IMAGE_ENDPOINT = "/static/image"
+
+DATA_DIR = Path(settings.data_dir)
+DATA_ENDPOINT = "/static/data"
+
+_FICLONE = 0x40049409  # linux/fs.h
+
+
+def image_url(filename: str) -> str:
+    """Build the public URL of an image stored under `IMAGES_DIR`."""
+    return f"http://localhost:8000{RAW_IMAGE_ENDPOINT}/{filename}"
+
+
+def data_url(relative_path: Path) -> str:
+    """Build the public URL of a file referenced in place under `DATA_DIR`."""
+    return f"http://localhost:8000{DATA_ENDPOINT}/{relative_path.as_posix()}"
+
+
+def servable_path(url: str) -> Path:
+    """Local path of the file served at an image URL built by this module."""
+    path = urlsplit(url).path
+    if path.startswith(DATA_ENDPOINT + "/"):
+        return DATA_DIR / path[len(DATA_ENDPOINT) + 1 :]
+    return IMAGES_DIR / path[len(RAW_IMAGE_ENDPOINT) + 1 :]
+
+
+class CachedStaticFiles(StaticFiles):
+    """Static files served with a `Cache-Control` header.
+
+    Args:
+        cache_control (str): Value of the `Cache-Control` header.
+        content_addressed (bool): Whether a path always names the same bytes.
+            The ETag is then derived from the path rather than the file's
+            mtime and size, so every server and copy agrees on it.
+    """
+
+    def __init__(
+        self, *args, cache_control: str, content_addressed: bool = False, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+        self.content_addressed = content_addressed
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        headers = {"Cache-Control": self.cache_control}
+        if self.content_addressed:
+            path = Path(full_path)
+            headers["ETag"] = f'"{path.parent.name}-{path.stem}"'
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result, headers=headers
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def reflink(src: Path, dest: Path) -> None:
+    """Clone `src` to `dest` sharing data blocks; raises OSError if unsupported."""
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflink is only supported on Linux")
+    import fcntl  # pylint: disable=import-outside-toplevel
+
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            dest.unlink(missing_ok=True)
+            raise
+
+
+def _place(src: Path, dest: Path, mode: str) -> None:
+    if mode == "reflink":
+        reflink(src, dest)
+    elif mode == "hardlink":
+        os.link(src, dest)
+    elif mode == "symlink":
+        dest.symlink_to(src.resolve())
+    elif mode == "copy":
+        shutil.copyfile(src, dest)  # streamed, uses copy_file_range/sendfile
+    elif mode == "auto":
+        for fallback in ("reflink", "hardlink"):
+            try:
+                _place(src, dest, fallback)
+                return
+            except OSError:
+                pass
+        _place(src, dest, "copy")
+    else:
+        raise ValueError(f"Unknown image placement mode: {mode}")
+
+
+def place_image(src: Path, mode: Optional[str] = None) -> Tuple[Path, str]:
+    """Make a source image servable according to the placement mode.
+
+    An existing file of the same name under `IMAGES_DIR` is replaced
+    atomically.
+
+    Args:
+        src (Path): Source image file.
+        mode (str, optional): One of `PLACEMENT_MODES`. Defaults to
+            `settings.image_placement`.
+
+    Returns:
+        Tuple[Path, str]: Path of the servable file and its public URL.
+    """
+    mode = mode or settings.image_placement
+    if mode == "reference":
+        try:
+            relative = src.resolve().relative_to(DATA_DIR.resolve())
+            return src, data_url(relative)
+        except ValueError:
+            logger.debug("%s is outside %s, symlinking instead", src, DATA_DIR)
+            mode = "symlink"
+
+    dest = IMAGES_DIR / src.name
+    if src.resolve() == dest.resolve():
+        return dest, image_url(dest.name)
+
+    tmp = dest.with_name(f".{dest.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    _place(src, tmp, mode)
+    os.replace(tmp, dest)
+    return dest, image_url(dest.name)
@@ -0,0 +1,171 @@
+"""Pre-generated thumbnail and preview variants of indexed images.
+
+Variants are generated during ingestion from the image already decoded for
+CLIP, on the decode threads. Each one is bounded by a longest side from
+`settings.thumbnail_sizes` and stored by content:
+
+    THUMBNAILS_DIR/w<size>q<quality>/<content hash>.<ext>
+
+A variant URL therefore always names the same bytes, so it is served with a
+strong ETag and an immutable `Cache-Control`: browsers and CDNs keep it for
+a year and never revalidate. Changing the size or quality of a variant
+changes its URLs.
+
+To generate the variants of images ingested before they were enabled, or
+after changing their settings, run
+
+    python -m app.services.thumbnails
+"""
+
+import argparse
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.db.models.image import Image
+from app.services import storage
+from PIL import Image as PILImage
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = Path(settings.thumbnails_dir)
+THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+THUMBNAIL_ENDPOINT = "/static/thumbnail"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _relative_path(size: int, content_hash: str) -> str:
+    ext = {"jpeg": "jpg"}.get(settings.thumbnail_format, settings.thumbnail_format)
+    return f"w{size}q{settings.thumbnail_quality}/{content_hash}.{ext}"
+
+
+def variant_path(variant: str, content_hash: str) -> Path:
+    """Path of a variant of the image with the given content hash."""
+    size = settings.thumbnail_sizes[variant]
+    return THUMBNAILS_DIR / _relative_path(size, content_hash)
+
+
+def variant_urls(content_hash: Optional[str]) -> Dict[str, str]:
+    """Public URL of every variant of an image, by variant name.
+
+    Only variants written to disk are listed: images indexed before content
+    hashing, or whose variants failed or are not generated yet, have fewer
+    or none, and clients fall back to the original's URL.
+    """
+    if content_hash is None:
+        return {}
+    return {
+        variant: "http://localhost:8000"
+        f"{THUMBNAIL_ENDPOINT}/{_relative_path(size, content_hash)}"
+        for variant, size in settings.thumbnail_sizes.items()
+        if (THUMBNAILS_DIR / _relative_path(size, content_hash)).exists()
+    }
+
+
+def save_variants(image: PILImage.Image, content_hash: str) -> int:
+    """Write the missing variants of a decoded image.
+
+    Variants are resized from largest to smallest, each from the previous
+    one, and written atomically. Failures are logged and counted as
+    "thumbnail" errors, not raised, so that a variant never fails ingestion.
+
+    Args:
+        image (PIL.Image.Image): The decoded image; it is left unchanged.
+        content_hash (str): SHA-256 of the image file.
+
+    Returns:
+        int: Number of variants written.
+    """
+    sizes = sorted(settings.thumbnail_sizes.items(), key=lambda item: -item[1])
+    missing = {
+        variant
+        for variant, _ in sizes
+        if not variant_path(variant, content_hash).exists()
+    }
+    if not missing:
+        return 0
+    written = 0
+    with metrics.timed("thumbnail"):
+        try:
+            current = image.copy()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not copy the image %s", content_hash)
+            metrics.ERRORS.inc("thumbnail")
+            return 0
+        for variant, size in sizes:
+            path = variant_path(variant, content_hash)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            try:
+                # keeps the aspect ratio, never enlarges
+                current.thumbnail((size, size))
+                if variant not in missing:
+                    continue
+                path.parent.mkdir(parents=True, exist_ok=True)
+                current.save(
+                    tmp,
+                    format=settings.thumbnail_format,
+                    quality=settings.thumbnail_quality,
+                )
+                os.replace(tmp, path)
+                written += 1
+            except Exception:  # pylint: disable=broad-except
+                # e.g. an unknown format or options the encoder rejects
+                logger.exception("Could not write %s", path)
+                metrics.ERRORS.inc("thumbnail")
+                tmp.unlink(missing_ok=True)
+    return written
+
+
+def backfill(db: Session, force: bool = False) -> int:
+    """Generate the missing variants of every indexed image.
+
+    Args:
+        db (Session): Database session.
+        force (bool): Regenerate variants that already exist.
+
+    Returns:
+        int: Number of images whose variants were generated.
+    """
+    count = 0
+    rows = db.execute(
+        select(Image.url_path, Image.content_hash).where(
+            Image.content_hash.isnot(None)
+        )
+    )
+    for url_path, content_hash in rows:
+        paths = [variant_path(name, content_hash) for name in settings.thumbnail_sizes]
+        if not force and all(path.exists() for path in paths):
+            continue
+        if force:
+            for path in paths:
+                path.unlink(missing_ok=True)
+        try:
+            with PILImage.open(storage.servable_path(url_path)) as img:
+                save_variants(img.convert("RGB"), content_hash)
+            count += 1
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not read %s", url_path)
+            metrics.ERRORS.inc("thumbnail")
+    return count
+
+
+def main():
+    """Generate the thumbnail variants of indexed images."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--force", action="store_true", help="regenerate existing variants"
+    )
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        count = backfill(db, force=args.force)
+    print(f"Generated variants of {count} images")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Tests for the in-process LRU cache."""
+
+import unittest
+from unittest import mock
+
+from app.core.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Unit tests for size- and TTL-based eviction."""
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted first."""
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(
+            cache.stats(),
+            {"size": 2, "hits": 3, "misses": 1, "evictions": 1, "expirations": 0},
+        )
+
+    def test_ttl_expiry(self):
+        """Entries older than the TTL are misses."""
+        cache = LRUCache(max_size=2, ttl_seconds=10)
+        with mock.patch("app.core.cache.time.monotonic", return_value=100.0):
+            cache.put("a", 1)
+        with mock.patch("app.core.cache.time.monotonic", return_value=105.0):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("app.core.cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        """A cache of size 0 stores nothing."""
+        cache = LRUCache(max_size=0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
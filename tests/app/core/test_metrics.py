@@ -0,0 +1,92 @@
+"""Tests for the metrics registry, Prometheus rendering and Server-Timing."""
+
+import asyncio
+import unittest
+
+from app.core import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Unit tests for histograms, gauges and the timing middleware."""
+
+    def test_histogram_renders_cumulative_buckets(self):
+        """Buckets are cumulative and end with +Inf, count and sum."""
+        histogram = metrics.Histogram(
+            "test_latency_seconds", "Test latency.", (0.1, 1.0), label="stage"
+        )
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe("embed", value)
+        self.assertEqual(
+            list(histogram.render()),
+            [
+                "# HELP test_latency_seconds Test latency.",
+                "# TYPE test_latency_seconds histogram",
+                'test_latency_seconds_bucket{stage="embed",le="0.1"} 1',
+                'test_latency_seconds_bucket{stage="embed",le="1"} 3',
+                'test_latency_seconds_bucket{stage="embed",le="+Inf"} 4',
+                'test_latency_seconds_sum{stage="embed"} 4.05',
+                'test_latency_seconds_count{stage="embed"} 4',
+            ],
+        )
+
+    def test_gauge_reads_callbacks(self):
+        """Gauges are read on render, skipping series without a value."""
+        depth = {"value": 3}
+        gauge = metrics.Gauge("test_depth", "Test depth.", label="queue")
+        gauge.track("jobs", lambda: depth["value"])
+        gauge.track("absent", lambda: None)
+        depth["value"] = 7
+        self.assertEqual(list(gauge.render())[-1], 'test_depth{queue="jobs"} 7')
+        self.assertIn('test_depth{queue="jobs"} 7', metrics.render())
+
+    def test_counter_accumulates(self):
+        """Counters add up per series and render as counter samples."""
+        counter = metrics.Counter("test_errors_total", "Test errors.", label="stage")
+        counter.inc("thumbnail")
+        counter.inc("thumbnail", 2)
+        self.assertEqual(counter.value("thumbnail"), 3)
+        self.assertEqual(counter.value("other"), 0)
+        self.assertEqual(
+            list(counter.render()),
+            [
+                "# HELP test_errors_total Test errors.",
+                "# TYPE test_errors_total counter",
+                'test_errors_total{stage="thumbnail"} 3',
+            ],
+        )
+
+    def test_timed_records_stage(self):
+        """`timed` adds one observation to the stage histogram."""
+        before, _ = metrics.STAGE_SECONDS.snapshot("test_stage")
+        with metrics.timed("test_stage"):
+            pass
+        after, total = metrics.STAGE_SECONDS.snapshot("test_stage")
+        self.assertEqual(after, before + 1)
+        self.assertGreaterEqual(total, 0.0)
+
+    def test_middleware_adds_server_timing(self):
+        """Stages timed while serving a request end up in its header."""
+
+        async def app(_scope, _receive, send):
+            metrics.observe_stage("db", 0.002)
+            metrics.observe_stage("db", 0.001)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+        asyncio.run(metrics.MetricsMiddleware(app)(scope, None, send))
+
+        headers = dict(sent[0]["headers"])
+        value = headers[b"server-timing"].decode()
+        self.assertTrue(value.startswith("db;dur=3.00, total;dur="), value)
+        count, _ = metrics.REQUEST_SECONDS.snapshot("GET unmatched")
+        self.assertGreaterEqual(count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
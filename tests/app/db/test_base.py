@@ -0,0 +1,84 @@
+"""Tests for the database engine factory."""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from app.db import base
+from app.db.base import create_db_engine
+from app.db.models.image import Image
+from app.index.pgvector import BinaryVector
+from sqlalchemy import bindparam, create_engine, select
+from sqlalchemy.dialects import postgresql
+
+
+class TestCreateDbEngine(unittest.TestCase):
+    """Unit tests for `create_db_engine`."""
+
+    def test_pool_settings(self):
+        """Pool size, overflow, recycle and pre-ping come from the settings."""
+        with patch.multiple(
+            "app.db.base.settings",
+            db_pool_size=7,
+            db_max_overflow=3,
+            db_pool_recycle_seconds=60,
+            db_pool_pre_ping=True,
+            db_prepared_statements=False,
+        ), patch("app.db.base.create_engine", wraps=create_engine) as factory:
+            engine = create_db_engine("postgresql+psycopg://user@localhost/db")
+        self.assertEqual(engine.pool.size(), 7)
+        self.assertEqual(engine.pool._max_overflow, 3)
+        self.assertEqual(engine.pool._recycle, 60)
+        self.assertTrue(engine.pool._pre_ping)
+        connect_args = factory.call_args.kwargs["connect_args"]
+        self.assertIsNone(connect_args["prepare_threshold"])
+        engine.dispose()
+
+    def test_sqlite_keeps_its_pool(self):
+        """SQLite engines are created without queue pool arguments."""
+        engine = create_db_engine("sqlite://")
+        with engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("SELECT 1").scalar(), 1)
+        engine.dispose()
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_forked_child_starts_with_empty_pool(self):
+        """A forked process does not reuse its parent's pooled connections."""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_db_engine(f"sqlite:///{tmp}/app.db")
+            with patch.multiple(base, engine=engine, read_engine=engine):
+                with engine.connect():
+                    pass
+                self.assertEqual(engine.pool.checkedin(), 1)
+                read_fd, write_fd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.write(write_fd, str(engine.pool.checkedin()).encode())
+                    os._exit(0)
+                os.close(write_fd)
+                os.waitpid(pid, 0)
+                with os.fdopen(read_fd, "rb") as reader:
+                    self.assertEqual(reader.read(), b"0")
+                self.assertEqual(engine.pool.checkedin(), 1)
+            engine.dispose()
+
+
+class TestBinaryVector(unittest.TestCase):
+    """Unit tests for the binary vector bind type."""
+
+    def test_array_reaches_the_driver(self):
+        """The NumPy array is passed through, not rendered as text."""
+        vec = np.ones(Image.embedding.type.dim, dtype=np.float32)
+        qvec = bindparam("query_vec", vec, type_=BinaryVector())
+        compiled = select(Image.embedding.cosine_distance(qvec)).compile(
+            dialect=postgresql.psycopg.dialect()
+        )
+        processors = compiled._bind_processors
+        self.assertNotIn("query_vec", processors)
+        self.assertIs(compiled.construct_params()["query_vec"], vec)
+
+
+if __name__ == "__main__":
+    unittest.main()
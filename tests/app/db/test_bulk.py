@@ -0,0 +1,74 @@
+"""Tests for the bulk image writer."""
+
+import unittest
+
+import numpy as np
+from app.db.bulk import bulk_insert_images
+from app.db.models.image import Image
+from helpers import PostgresTestCase, SqliteTestCase
+from sqlalchemy import func, select
+
+
+def unit_vectors(n: int, dim: int = 512) -> np.ndarray:
+    """Random unit-norm vectors."""
+    vecs = np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=-1, keepdims=True)
+
+
+class BulkInsertChecks:
+    """Checks shared by every dialect; `self.session_factory` is set up."""
+
+    def test_writes_every_column_in_input_order(self):
+        """Ids follow the input order and every column is stored."""
+        filenames = ["c.jpg", "a.jpg", "b.jpg"]
+        url_paths = [f"/static/image/{name}" for name in filenames]
+        hashes = ["cc" * 32, None, "bb" * 32]
+        embeddings = unit_vectors(3)
+        with self.session_factory() as db:
+            ids = bulk_insert_images(
+                db,
+                filenames,
+                url_paths,
+                embeddings,
+                content_hashes=hashes,
+                collection="holidays",
+                source_folder="/data/dataset",
+            )
+            db.commit()
+            self.assertEqual(len(ids), 3)
+            self.assertEqual(ids, sorted(ids))
+            for image_id, filename, url_path, content_hash, embedding in zip(
+                ids, filenames, url_paths, hashes, embeddings
+            ):
+                image = db.get(Image, image_id)
+                self.assertEqual(image.filename, filename)
+                self.assertEqual(image.url_path, url_path)
+                self.assertEqual(image.content_hash, content_hash)
+                self.assertEqual(image.collection, "holidays")
+                self.assertEqual(image.source_folder, "/data/dataset")
+                self.assertIsNotNone(image.created_at)
+                np.testing.assert_allclose(image.embedding, embedding, rtol=1e-6)
+
+    def test_defaults_and_empty_input(self):
+        """Hashes, collection and folder default to NULL; no rows, no ids."""
+        with self.session_factory() as db:
+            self.assertEqual(bulk_insert_images(db, [], [], unit_vectors(0)), [])
+            ids = bulk_insert_images(db, ["a.jpg"], ["/a.jpg"], unit_vectors(1))
+            db.commit()
+            image = db.get(Image, ids[0])
+            self.assertIsNone(image.content_hash)
+            self.assertIsNone(image.collection)
+            self.assertIsNone(image.source_folder)
+            self.assertEqual(db.scalar(select(func.count(Image.id))), 1)
+
+
+class TestBulkInsertSqlite(BulkInsertChecks, SqliteTestCase):
+    """The executemany INSERT ... RETURNING fallback, on SQLite."""
+
+
+class TestBulkInsertPostgres(BulkInsertChecks, PostgresTestCase):
+    """COPY ... FROM STDIN (FORMAT BINARY), on PostgreSQL with pgvector."""
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Test cases and helpers shared by the test packages."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.db.base import Base, create_db_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+# a disposable PostgreSQL database with pgvector, for the tests that need one
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL", "")
+
+
+def _enable_foreign_keys(dbapi_conn, _record):
+    dbapi_conn.execute("PRAGMA foreign_keys=ON")
+
+
+def sqlite_session_factory(path: Path, foreign_keys: bool = False) -> sessionmaker:
+    """Create every table in a SQLite database file and return its sessions.
+
+    Args:
+        path (Path): Database file, created if missing.
+        foreign_keys (bool): Enforce foreign keys, which SQLite does not by
+            default.
+
+    Returns:
+        sessionmaker: Sessions bound to the database.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    if foreign_keys:
+        event.listen(engine, "connect", _enable_foreign_keys)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Test case with a temporary directory, removed after each test.
+
+    Attributes:
+        tmp_dir (Path): The temporary directory.
+    """
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+
+class SqliteTestCase(TempDirTestCase):
+    """Test case with a fresh SQLite database in its temporary directory.
+
+    Attributes:
+        session_factory (sessionmaker): Sessions bound to the database.
+        foreign_keys (bool): Enforce foreign keys; set by subclasses.
+    """
+
+    foreign_keys = False
+
+    def setUp(self):
+        super().setUp()
+        self.session_factory = sqlite_session_factory(
+            self.tmp_dir / "test.db", foreign_keys=self.foreign_keys
+        )
+        self.addCleanup(self.session_factory.kw["bind"].dispose)
+
+
+@unittest.skipUnless(
+    TEST_POSTGRES_URL.startswith("postgresql"), "needs TEST_POSTGRES_URL"
+)
+class PostgresTestCase(unittest.TestCase):
+    """Test case on the `TEST_POSTGRES_URL` database, skipped without one.
+
+    Every table is created, and the images and their dependent rows are
+    deleted after each test.
+
+    Attributes:
+        engine (Engine): Engine of the database.
+        session_factory (sessionmaker): Sessions bound to the database.
+    """
+
+    def setUp(self):
+        self.engine = create_db_engine(TEST_POSTGRES_URL)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        Base.metadata.create_all(bind=self.engine)
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    def tearDown(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("TRUNCATE images RESTART IDENTITY CASCADE"))
+        self.engine.dispose()
@@ -0,0 +1,90 @@
+"""Tests for the search filters and hybrid ranking helpers."""
+
+import unittest
+from datetime import datetime, timezone
+
+from app.db.base import Base
+from app.db.models.image import Image
+from app.index.base import SearchFilters, lexical_search, lexical_terms, rrf_fuse
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+
+class TestSearchHelpers(unittest.TestCase):
+    """Unit tests for `SearchFilters`, lexical search and RRF."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        with self.session_factory() as db:
+            db.add_all(
+                [
+                    Image(
+                        filename="red_cat.jpg",
+                        url_path="/1",
+                        collection="pets",
+                        created_at=datetime(2025, 1, 1, tzinfo=timezone.utc),
+                    ),
+                    Image(
+                        filename="cat_100%.png",
+                        url_path="/2",
+                        collection="pets",
+                        created_at=datetime(2025, 6, 1, tzinfo=timezone.utc),
+                    ),
+                    Image(filename="red_car.jpg", url_path="/3", collection="cars"),
+                ]
+            )
+            db.commit()
+
+    def _filtered(self, filters: SearchFilters):
+        with self.session_factory() as db:
+            stmt = select(Image.filename).where(*filters.clauses()).order_by(Image.id)
+            return list(db.scalars(stmt))
+
+    def test_filters(self):
+        """Every set filter must hold; LIKE wildcards are matched literally."""
+        self.assertFalse(SearchFilters())
+        self.assertEqual(
+            self._filtered(SearchFilters(collection="pets")),
+            ["red_cat.jpg", "cat_100%.png"],
+        )
+        self.assertEqual(
+            self._filtered(
+                SearchFilters(
+                    collection="pets",
+                    created_after=datetime(2025, 3, 1, tzinfo=timezone.utc),
+                )
+            ),
+            ["cat_100%.png"],
+        )
+        self.assertEqual(self._filtered(SearchFilters(filename="0%")), ["cat_100%.png"])
+        self.assertEqual(
+            self._filtered(SearchFilters(filename="D_CAT")), ["red_cat.jpg"]
+        )
+        self.assertEqual(self._filtered(SearchFilters(filename="r_d")), [])
+
+    def test_lexical_search(self):
+        """Filenames are ranked by the share of query words they contain."""
+        self.assertEqual(
+            lexical_terms("A red, RED cat_photo!"), ["a", "red", "cat", "photo"]
+        )
+        with self.session_factory() as db:
+            rows = lexical_search(db, "red cat", 10)
+            self.assertEqual(
+                [(img.filename, score) for img, score in rows],
+                [("red_cat.jpg", 1.0), ("cat_100%.png", 0.5), ("red_car.jpg", 0.5)],
+            )
+            rows = lexical_search(db, "red cat", 10, SearchFilters(collection="cars"))
+            self.assertEqual([img.filename for img, _ in rows], ["red_car.jpg"])
+            self.assertEqual(lexical_search(db, "!!", 10), [])
+
+    def test_rrf_fuse(self):
+        """Images ranked well by both rankings come first."""
+        fused = rrf_fuse([[1, 2, 3], [3, 4, 1]], rrf_k=60)
+        self.assertEqual([image_id for image_id, _ in fused], [1, 3, 2, 4])
+        self.assertAlmostEqual(fused[0][1], 1 / 61 + 1 / 63)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+"""Tests for the exact in-process search backend."""
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+from app.db.models.image import Image
+from app.index import ExactIndex, SearchFilters
+from helpers import TempDirTestCase, sqlite_session_factory
+
+
+def unit_vectors(n: int, dim: int = 512, seed: int = 0) -> np.ndarray:
+    """Random unit-norm vectors."""
+    vecs = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=-1, keepdims=True)
+
+
+class TestExactIndex(TempDirTestCase):
+    """Unit tests for the memory-mapped exact index."""
+
+    def setUp(self):
+        super().setUp()
+        self.vecs = unit_vectors(100)
+
+    def test_top_k_matches_brute_force(self):
+        """Results equal a sorted brute-force ranking."""
+        for dtype in ("float32", "float16"):
+            index = ExactIndex(str(self.tmp_dir / dtype), dtype=dtype)
+            index.add(list(range(1, 101)), self.vecs)
+
+            ids, scores = index.top_k(self.vecs[7], 5)
+            expected = np.argsort(-(self.vecs @ self.vecs[7]))[:5] + 1
+            np.testing.assert_array_equal(ids, expected)
+            self.assertAlmostEqual(float(scores[0]), 1.0, places=2)
+
+    def test_top_k_many_matches_top_k(self):
+        """Batched queries return what one query at a time would."""
+        index = ExactIndex(str(self.tmp_dir))
+        index.add(list(range(1, 101)), self.vecs)
+
+        queries = unit_vectors(70, seed=1)  # more than one query block
+        top_ks = [1 + i % 7 for i in range(70)]
+        for (ids, scores), query, k in zip(
+            index.top_k_many(queries, top_ks), queries, top_ks
+        ):
+            expected_ids, expected_scores = index.top_k(query, k)
+            np.testing.assert_array_equal(ids, expected_ids)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_readd_supersedes(self):
+        """A re-embedded id only matches through its latest vector."""
+        index = ExactIndex(str(self.tmp_dir))
+        index.add([1, 2], self.vecs[:2])
+        index.add([1], self.vecs[2:3])
+
+        self.assertEqual(len(index), 2)
+        ids, _ = index.top_k(self.vecs[0], 5)
+        self.assertEqual(sorted(ids.tolist()), [1, 2])
+        ids, _ = index.top_k(self.vecs[2], 1)
+        self.assertEqual(ids.tolist(), [1])
+
+    def test_add_during_search_keeps_its_snapshot(self):
+        """Rows appended while a search runs do not mix with the rows it read."""
+        index = ExactIndex(str(self.tmp_dir))
+        index.add([1, 2], self.vecs[:2])
+        scores = ExactIndex._scores
+
+        def add_then_score(snapshot, queries):
+            index.add([1, 3], self.vecs[2:4])  # the ingestion thread appends
+            return scores(snapshot, queries)
+
+        with mock.patch.object(ExactIndex, "_scores", staticmethod(add_then_score)):
+            ids, _ = index.top_k(self.vecs[0], 5)
+
+        self.assertEqual(ids.tolist(), [1, 2])
+        ids, _ = index.top_k(self.vecs[3], 1)
+        self.assertEqual(ids.tolist(), [3])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_concurrent_processes_keep_rows_paired(self):
+        """Processes appending at once never pair a row with another id."""
+        pids = []
+        for worker in range(4):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    index = ExactIndex(str(self.tmp_dir), dim=8)
+                    for i in range(200):
+                        image_id = worker * 1000 + i
+                        index.add([image_id], np.full((1, 8), image_id, np.float32))
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+        index = ExactIndex(str(self.tmp_dir), dim=8)
+        self.assertEqual(len(index), 800)
+        snapshot = index._current()
+        np.testing.assert_array_equal(snapshot.embeddings[:, 0], snapshot.ids)
+
+    def test_search_does_not_wait_for_a_writer(self):
+        """While another process holds the write lock, searches keep their mapping."""
+        writer = ExactIndex(str(self.tmp_dir))
+        reader = ExactIndex(str(self.tmp_dir))
+        writer.add([1], self.vecs[:1])
+        self.assertEqual(reader.top_k(self.vecs[0], 5)[0].tolist(), [1])
+
+        with writer._file_lock(exclusive=True):
+            writer._append([2], self.vecs[1:2])
+            self.assertEqual(reader.top_k(self.vecs[1], 5)[0].tolist(), [1])
+        self.assertEqual(reader.top_k(self.vecs[1], 5)[0].tolist(), [2, 1])
+
+    def test_other_instance_sees_appends(self):
+        """Rows appended by another process are picked up on the next search."""
+        reader = ExactIndex(str(self.tmp_dir))
+        self.assertEqual(len(reader), 0)
+        ExactIndex(str(self.tmp_dir)).add([5], self.vecs[:1])
+        ids, _ = reader.top_k(self.vecs[0], 1)
+        self.assertEqual(ids.tolist(), [5])
+
+    def test_prepare_rebuilds_from_database(self):
+        """An index out of sync with the database is rebuilt from it."""
+        session_factory = sqlite_session_factory(self.tmp_dir / "test.db")
+        with session_factory() as db:
+            db.add_all(
+                Image(filename=f"{i}.jpg", url_path=f"/{i}.jpg", embedding=self.vecs[i])
+                for i in range(10)
+            )
+            db.commit()
+
+        index = ExactIndex(str(self.tmp_dir / "index"))
+        index.prepare(session_factory)
+        self.assertEqual(len(index), 10)
+        with session_factory() as db:
+            (img, score), = index.search(db, self.vecs[3], 1)
+        self.assertEqual(img.filename, "3.jpg")
+        self.assertAlmostEqual(score, 1.0, places=4)
+
+    def test_filtered_and_hybrid_search(self):
+        """Filters restrict the ranking; hybrid search fuses filename matches."""
+        session_factory = sqlite_session_factory(self.tmp_dir / "test.db")
+        with session_factory() as db:
+            db.add_all(
+                Image(
+                    id=i + 1,
+                    filename=f"{'beach' if i % 10 == 0 else 'img'}_{i}.jpg",
+                    url_path=f"/{i}.jpg",
+                    collection="even" if i % 2 == 0 else "odd",
+                )
+                for i in range(100)
+            )
+            db.commit()
+        index = ExactIndex(str(self.tmp_dir / "index"))
+        index.add(list(range(1, 101)), self.vecs)
+
+        with session_factory() as db:
+            rows = index.search(
+                db, self.vecs[3], 5, filters=SearchFilters(collection="even")
+            )
+            self.assertEqual(len(rows), 5)
+            self.assertTrue(all(img.collection == "even" for img, _ in rows))
+            scores = [score for _, score in rows]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            expected = np.argsort(-(self.vecs[::2] @ self.vecs[3]))[:5] * 2 + 1
+            self.assertEqual([img.id for img, _ in rows], expected.tolist())
+
+            rows = index.search(
+                db,
+                self.vecs[3],
+                5,
+                filters=SearchFilters(collection="odd", filename="BEACH"),
+            )
+            self.assertEqual(rows, [])
+
+            # the best vector match and the filename matches both rank
+            rows = index.search_hybrid(db, self.vecs[3], "beach", 5, candidates=20)
+            self.assertIn(4, [img.id for img, _ in rows])
+            self.assertTrue(any(img.filename.startswith("beach") for img, _ in rows))
+            scores = [score for _, score in rows]
+            self.assertEqual(scores, sorted(scores, reverse=True))
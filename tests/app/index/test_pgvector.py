@@ -0,0 +1,171 @@
+"""Tests for the pgvector search backend."""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+from app.db.models.image import Image
+from app.index import SearchFilters
+from app.index.pgvector import MAX_EF_SEARCH, PgvectorBackend
+from helpers import PostgresTestCase
+from sqlalchemy.dialects import postgresql
+
+DIM = Image.embedding.type.dim
+
+
+def unit_vectors(n: int, seed: int = 0) -> np.ndarray:
+    """Random unit-norm vectors."""
+    vecs = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=-1, keepdims=True)
+
+
+class TestSearchStatement(unittest.TestCase):
+    """Compile-level checks of the single-query search statement."""
+
+    def _compile(self, storage: str, top_k: int = 5, filters=None):
+        backend = PgvectorBackend(storage=storage, oversample=4)
+        clauses = filters.clauses() if filters else []
+        stmt = backend._search_statement(np.zeros(DIM, np.float32), top_k, clauses)
+        compiled = stmt.compile(dialect=postgresql.dialect())
+        return " ".join(str(compiled).split()), compiled.params
+
+    def test_float32_orders_by_the_index_distance(self):
+        """Without quantization, the HNSW scan returns the top_k itself."""
+        sql, params = self._compile("float32")
+        self.assertIn("ORDER BY images.embedding <=> %(query_vec)s LIMIT", sql)
+        self.assertNotIn("candidates", sql)
+        self.assertEqual(params["param_1"], 5)
+
+    def test_quantized_candidates_are_reranked_exactly(self):
+        """The quantized scan oversamples; the outer query re-ranks its rows."""
+        index_orders = {
+            "halfvec": "ORDER BY CAST(images.embedding AS HALFVEC(512)) <=> "
+            "CAST(%(query_vec)s AS HALFVEC(512)) LIMIT %(param_1)s",
+            "binary": "ORDER BY CAST(binary_quantize(images.embedding) AS BIT(512))"
+            " <~> CAST(binary_quantize(CAST(%(query_vec)s AS VECTOR(512)))"
+            " AS BIT(512)) LIMIT %(param_1)s",
+        }
+        for storage, index_order in index_orders.items():
+            with self.subTest(storage=storage):
+                sql, params = self._compile(storage)
+                # the candidates carry their embedding out of the index scan
+                self.assertIn(
+                    "SELECT images.id AS id, images.embedding AS embedding", sql
+                )
+                self.assertIn(index_order, sql)
+                self.assertIn(
+                    ") AS candidates ORDER BY candidates.embedding <=> "
+                    "%(query_vec)s LIMIT %(param_2)s",
+                    sql,
+                )
+                self.assertNotIn("ORDER BY images.embedding <=>", sql)
+                self.assertEqual((params["param_1"], params["param_2"]), (20, 5))
+
+    def test_filters_only_apply_to_the_index_scan(self):
+        """Filters are written once, inside the innermost query."""
+        filters = SearchFilters(collection="pets")
+        for storage in ("float32", "halfvec", "binary"):
+            with self.subTest(storage=storage):
+                sql, _ = self._compile(storage, filters=filters)
+                self.assertEqual(sql.count("images.collection ="), 1)
+                inner = sql.rindex("FROM images WHERE")
+                self.assertGreater(sql.index("images.collection ="), inner)
+
+
+class TestSetEfSearch(unittest.TestCase):
+    """Unit tests for the per-transaction HNSW search settings."""
+
+    def _settings(self, backend: PgvectorBackend, *args, **kwargs) -> dict:
+        db = mock.Mock()
+        backend._set_ef_search(db, *args, **kwargs)
+        (statement, params), _ = db.execute.call_args
+        self.assertIn("set_config('hnsw.ef_search', :ef_search, true)", str(statement))
+        return params
+
+    def test_default_and_override(self):
+        """The backend default applies unless the request sets its own."""
+        backend = PgvectorBackend(ef_search=40)
+        self.assertEqual(self._settings(backend, None, 10), {"ef_search": "40"})
+        self.assertEqual(self._settings(backend, 400, 10), {"ef_search": "400"})
+
+    def test_clamped_to_the_limit_and_pgvector_maximum(self):
+        """ef_search covers the LIMIT and never exceeds pgvector's maximum."""
+        backend = PgvectorBackend(ef_search=40)
+        self.assertEqual(self._settings(backend, 10, 120), {"ef_search": "120"})
+        self.assertEqual(
+            self._settings(backend, 5000, 10), {"ef_search": str(MAX_EF_SEARCH)}
+        )
+        self.assertEqual(
+            self._settings(backend, None, 5000), {"ef_search": str(MAX_EF_SEARCH)}
+        )
+
+    def test_filtered_searches_scan_iteratively(self):
+        """Filtered searches also set the iterative scan, unless it is off."""
+        backend = PgvectorBackend(iterative_scan="strict_order")
+        db = mock.Mock()
+        backend._set_ef_search(db, None, 10, filtered=True)
+        (statement, params), _ = db.execute.call_args
+        self.assertIn(
+            "set_config('hnsw.iterative_scan', :iterative_scan, true)", str(statement)
+        )
+        self.assertEqual(params["iterative_scan"], "strict_order")
+        self.assertNotIn("iterative_scan", self._settings(backend, None, 10))
+
+        backend = PgvectorBackend(iterative_scan="off")
+        self.assertNotIn(
+            "iterative_scan", self._settings(backend, None, 10, filtered=True)
+        )
+
+    def test_quantized_search_covers_the_oversampled_limit(self):
+        """A quantized search sizes ef_search for all its candidates."""
+        backend = PgvectorBackend(storage="halfvec", oversample=4, ef_search=40)
+        db = mock.Mock()
+        db.execute.return_value.all.return_value = []
+        backend.search(db, np.zeros(DIM, np.float32), 25)
+        (_, params), _ = db.execute.call_args_list[0]
+        self.assertEqual(params, {"ef_search": "100"})
+
+
+class TestPgvectorSearch(PostgresTestCase):
+    """Searches on PostgreSQL, without the HNSW indexes of the migrations."""
+
+    def setUp(self):
+        super().setUp()
+        self.vecs = unit_vectors(50)
+        with self.session_factory() as db:
+            db.add_all(
+                Image(
+                    filename=f"{i}.jpg",
+                    url_path=f"/{i}.jpg",
+                    embedding=vec,
+                    collection="even" if i % 2 == 0 else "odd",
+                )
+                for i, vec in enumerate(self.vecs)
+            )
+            db.commit()
+
+    def test_search_returns_exact_neighbours(self):
+        """Every storage mode ranks by exact cosine similarity."""
+        query = self.vecs[7]
+        expected = [f"{i}.jpg" for i in np.argsort(-(self.vecs @ query))[:3]]
+        for storage in ("float32", "halfvec", "binary"):
+            with self.subTest(storage=storage), self.session_factory() as db:
+                backend = PgvectorBackend(storage=storage, oversample=50)
+                results = backend.search(db, query, 3)
+                self.assertEqual([img.filename for img, _ in results], expected)
+                self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+    def test_filtered_search(self):
+        """Filters restrict the candidates of every storage mode."""
+        filters = SearchFilters(collection="odd")
+        for storage in ("float32", "halfvec", "binary"):
+            with self.subTest(storage=storage), self.session_factory() as db:
+                backend = PgvectorBackend(storage=storage, oversample=50)
+                results = backend.search(db, self.vecs[7], 5, filters=filters)
+                self.assertEqual(len(results), 5)
+                self.assertEqual(results[0][0].filename, "7.jpg")
+                self.assertTrue(all(img.collection == "odd" for img, _ in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,23 @@
 """Tests for CLIP embedding helpers."""
 
+import asyncio
+import importlib.util
+import io
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
 import numpy as np
-from app.ml import clip
+import torch
+from app.core.cache import LRUCache
+from app.ml import clip, encoders
+from PIL import Image, UnidentifiedImageError
+from transformers import CLIPConfig, CLIPModel
 
 TEST_ASSETS_PATH = "./tests/assets/ml/clip"
 
@@ -46,3 +60,321 @@ class TestClip(unittest.TestCase):
         mat = np.array(list(embeddings), dtype=np.float32)
         scores = mat @ text_vec.astype(np.float32)
         self.assertGreater(scores[elephant_idx], scores[cat_idx])
+
+
+class FakeProcessor:
+    """Processor stand-in encoding the image width as its only pixel."""
+
+    def __call__(self, images, return_tensors="pt"):
+        return {"pixel_values": torch.tensor([[float(img.width)] for img in images])}
+
+
+class FakeModel:
+    """Model stand-in recording the size of every forward pass."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def get_image_features(self, pixel_values):
+        self.batch_sizes.append(len(pixel_values))
+        return torch.cat([pixel_values, torch.ones_like(pixel_values)], dim=-1)
+
+
+class TestImagePipeline(unittest.TestCase):
+    """Unit tests for the parallel decode/preprocess pipeline."""
+
+    def test_iter_image_embeddings(self):
+        """Batches keep input order and respect the batch size."""
+        model = FakeModel()
+        model_ctx = clip.ModelContext(model=model, processor=FakeProcessor())
+        image_paths = [f"{TEST_ASSETS_PATH}/{name}.jpg" for name in ("cat", "elephant")]
+        widths = [Image.open(p).width for p in image_paths]
+
+        batches = list(
+            clip.iter_image_embeddings(
+                model_ctx, image_paths * 3, batch_size=4, num_workers=3
+            )
+        )
+        self.assertEqual(model.batch_sizes, [4, 2])
+
+        feats = np.vstack(batches)
+        expected = np.array([[w, 1.0] for w in widths * 3])
+        expected /= np.linalg.norm(expected, axis=-1, keepdims=True)
+        np.testing.assert_allclose(feats, expected, rtol=1e-6)
+
+    def test_embed_file_objects(self):
+        """Uploaded images are embedded from memory; bad bytes raise OSError."""
+        model_ctx = clip.ModelContext(model=FakeModel(), processor=FakeProcessor())
+        with open(f"{TEST_ASSETS_PATH}/cat.jpg", "rb") as f:
+            upload = io.BytesIO(f.read())
+        width = Image.open(f"{TEST_ASSETS_PATH}/cat.jpg").width
+
+        feats = clip.embed_images(
+            model_ctx, [upload], priority=clip.PRIORITY_INTERACTIVE
+        )
+        expected = np.array([width, 1.0]) / np.hypot(width, 1.0)
+        np.testing.assert_allclose(feats[0], expected, rtol=1e-6)
+        with self.assertRaises(OSError):
+            clip.embed_images(model_ctx, [io.BytesIO(b"not an image")])
+
+    def test_skip_undecodable_images(self):
+        """With `on_error`, images that cannot be decoded are left out."""
+        model_ctx = clip.ModelContext(model=FakeModel(), processor=FakeProcessor())
+        bad = io.BytesIO(b"not an image")
+        good = f"{TEST_ASSETS_PATH}/cat.jpg"
+        errors = []
+        feats = clip.embed_images(
+            model_ctx,
+            [bad, good],
+            on_error=lambda path, exc: errors.append((path, type(exc))),
+        )
+        self.assertEqual(feats.shape, (1, 2))
+        self.assertEqual(errors, [(bad, UnidentifiedImageError)])
+
+
+class FakeTextProcessor:
+    """Processor stand-in encoding each text as its length."""
+
+    def __call__(self, text, return_tensors="pt", padding=True):
+        return {"input_ids": torch.tensor([[float(len(t))] for t in text])}
+
+
+class FakeTextModel:
+    """Model stand-in recording the size of every text forward pass."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def get_text_features(self, input_ids):
+        self.batch_sizes.append(len(input_ids))
+        return torch.cat([input_ids, torch.ones_like(input_ids)], dim=-1)
+
+
+class TestTextBatcher(unittest.TestCase):
+    """Unit tests for micro-batching of concurrent text queries."""
+
+    def test_concurrent_queries_share_a_batch(self):
+        """Concurrent queries run in one forward pass and get their own rows."""
+        model = FakeTextModel()
+        model_ctx = clip.ModelContext(model=model, processor=FakeTextProcessor())
+        batcher = clip.TextBatcher(model_ctx, max_batch_size=8, max_wait_ms=200)
+
+        queries = ["a", "bb", "ccc", "bb"]
+        with ThreadPoolExecutor(len(queries)) as pool:
+            feats = list(pool.map(batcher.embed, queries))
+        batcher.stop(timeout=5)
+
+        self.assertEqual(model.batch_sizes, [3])
+        for query, feat in zip(queries, feats):
+            expected = np.array([len(query), 1.0]) / np.hypot(len(query), 1.0)
+            np.testing.assert_allclose(feat, expected, rtol=1e-6)
+
+    def test_embed_queries_async(self):
+        """Batch queries run their cache misses in a single forward pass."""
+        model = FakeTextModel()
+        model_ctx = clip.ModelContext(model=model, processor=FakeTextProcessor())
+        cache = LRUCache(100)
+        cache.put((model_ctx.model_name, "a"), np.array([0.6, 0.8], dtype=np.float16))
+        with mock.patch.multiple(
+            clip, get_model_context=lambda: model_ctx, get_text_cache=lambda: cache
+        ):
+            feats = asyncio.run(clip.embed_queries_async(["A", "bb", "ccc", " BB "]))
+
+        self.assertEqual(model.batch_sizes, [2])
+        self.assertEqual(feats.shape, (4, 2))
+        np.testing.assert_allclose(feats[0], [0.6, 0.8], rtol=1e-3)
+        np.testing.assert_array_equal(feats[1], feats[3])
+        self.assertEqual(len(cache), 3)
+
+    def test_max_batch_size(self):
+        """Queued queries are split into batches of at most max_batch_size."""
+        model = FakeTextModel()
+        model_ctx = clip.ModelContext(model=model, processor=FakeTextProcessor())
+        batcher = clip.TextBatcher(model_ctx, max_batch_size=2, max_wait_ms=200)
+
+        futures = [batcher.submit(str(i) * (i + 1)) for i in range(5)]
+        for future in futures:
+            future.result(timeout=5)
+        batcher.stop(timeout=5)
+
+        self.assertEqual(model.batch_sizes, [2, 2, 1])
+
+    def test_cancelled_caller_does_not_strand_the_batch(self):
+        """A caller cancelled mid-pass does not keep the others from their rows."""
+        model = FakeTextModel()
+        model_ctx = clip.ModelContext(model=model, processor=FakeTextProcessor())
+        executor = clip.InferenceExecutor(num_workers=1)
+        release = threading.Event()
+        executor.submit(release.wait, 5)
+        batcher = clip.TextBatcher(
+            model_ctx, max_batch_size=2, max_wait_ms=200, executor=executor
+        )
+
+        cancelled, kept = batcher.submit("a"), batcher.submit("bb")
+        deadline = time.monotonic() + 5
+        while executor.queued() == 0 and time.monotonic() < deadline:
+            time.sleep(0.001)  # the batch's pass waits behind the blocker
+        self.assertTrue(cancelled.cancel())
+        release.set()
+
+        feat = kept.result(timeout=5)
+        batcher.stop(timeout=5)
+        executor.stop(timeout=5)
+        np.testing.assert_allclose(feat, np.array([2.0, 1.0]) / np.hypot(2, 1))
+        self.assertEqual(model.batch_sizes, [2])
+
+
+class TestInferenceExecutor(unittest.TestCase):
+    """Unit tests for the prioritized inference executor."""
+
+    def test_interactive_work_runs_first(self):
+        """Queued interactive work overtakes queued bulk work."""
+        executor = clip.InferenceExecutor(num_workers=1)
+        release = threading.Event()
+        order = []
+
+        executor.submit(release.wait, 5)
+        futures = [
+            executor.submit(order.append, "bulk-1", priority=clip.PRIORITY_BULK),
+            executor.submit(order.append, "bulk-2", priority=clip.PRIORITY_BULK),
+            executor.submit(
+                order.append, "query", priority=clip.PRIORITY_INTERACTIVE
+            ),
+        ]
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        executor.stop(timeout=5)
+
+        self.assertEqual(order, ["query", "bulk-1", "bulk-2"])
+
+    def test_run_async(self):
+        """Async callers await results and exceptions of inference work."""
+        executor = clip.InferenceExecutor(num_workers=2)
+
+        async def main():
+            self.assertEqual(await executor.run_async(sum, [1, 2, 3]), 6)
+            with self.assertRaises(ZeroDivisionError):
+                await executor.run_async(divmod, 1, 0)
+
+        asyncio.run(main())
+        executor.stop(timeout=5)
+
+
+def tiny_clip_model():
+    """A small randomly initialized CLIP model, so parity tests run offline."""
+    torch.manual_seed(0)
+    config = CLIPConfig(
+        text_config={
+            "hidden_size": 64,
+            "intermediate_size": 128,
+            "num_hidden_layers": 2,
+            "num_attention_heads": 2,
+            "vocab_size": 100,
+            "max_position_embeddings": 16,
+            "bos_token_id": 0,
+            "eos_token_id": 1,
+            "pad_token_id": 1,
+        },
+        vision_config={
+            "hidden_size": 64,
+            "intermediate_size": 128,
+            "num_hidden_layers": 2,
+            "num_attention_heads": 2,
+            "image_size": 32,
+            "patch_size": 8,
+        },
+        projection_dim=32,
+    )
+    return CLIPModel(config).eval()
+
+
+class TestEncoderParity(unittest.TestCase):
+    """Bounds on the cosine drift of optimized encoders against torch float32."""
+
+    MIN_COSINE = 0.98
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_dir = str(Path(self.tmp_dir) / "model")
+        self.model = tiny_clip_model()
+        self.model.save_pretrained(self.model_dir)
+        self.pixel_values = torch.randn(4, 3, 32, 32)
+        self.input_ids = torch.tensor([[0, 5, 6, 7, 1], [0, 9, 1, 1, 1]])
+        self.attention_mask = torch.tensor([[1, 1, 1, 1, 1], [1, 1, 1, 0, 0]])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _embed(self, model) -> np.ndarray:
+        model_ctx = clip.ModelContext(model=model, processor=object())
+        with torch.no_grad():
+            text = encoders.features(
+                model.get_text_features(
+                    input_ids=self.input_ids, attention_mask=self.attention_mask
+                )
+            ).float()
+        text = (text / text.norm(dim=-1, keepdim=True)).numpy()
+        return np.vstack([clip._image_features(model_ctx, self.pixel_values), text])
+
+    def assert_parity(self, backend, dtype):
+        """Each image and text embedding stays close to the torch one."""
+        encoder = encoders.load_encoder(
+            self.model_dir, "cpu", backend=backend, dtype=dtype, cache_dir=self.tmp_dir
+        )
+        cosine = np.sum(self._embed(self.model) * self._embed(encoder), axis=-1)
+        self.assertGreater(cosine.min(), self.MIN_COSINE)
+
+    def test_torch_int8(self):
+        """Dynamically quantized Linear layers barely move the embeddings."""
+        self.assert_parity("torch", "int8")
+
+    def test_torch_bfloat16(self):
+        """bfloat16 weights barely move the embeddings."""
+        self.assert_parity("torch", "bfloat16")
+
+    @unittest.skipUnless(importlib.util.find_spec("onnxruntime"), "needs onnxruntime")
+    def test_onnx(self):
+        """Exported float32 and int8 ONNX graphs match the torch model."""
+        self.assert_parity("onnx", "float32")
+        self.assert_parity("onnx", "int8")
+
+
+class TestModelStartup(unittest.TestCase):
+    """Unit tests for settings-driven, prepared model loading."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_dir = str(Path(self.tmp_dir) / "model")
+        tiny_clip_model().save_pretrained(self.model_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_prepared_weights_are_reused(self):
+        """The first load writes weights in the target dtype, later loads read them."""
+        cache_dir = str(Path(self.tmp_dir) / "cache")
+        model = encoders.load_torch_encoder(
+            self.model_dir, "cpu", "bfloat16", cache_dir
+        )
+        prepared = encoders.model_dir(cache_dir, self.model_dir) / "torch-bfloat16"
+        self.assertTrue((prepared / "model.safetensors").exists())
+        self.assertEqual(model.dtype, torch.bfloat16)
+
+        from_pretrained = encoders.CLIPModel.from_pretrained
+        with mock.patch.object(
+            encoders.CLIPModel, "from_pretrained", wraps=from_pretrained
+        ) as spy:
+            encoders.load_torch_encoder(self.model_dir, "cpu", "bfloat16", cache_dir)
+        self.assertEqual([call.args[0] for call in spy.call_args_list], [prepared])
+
+    def test_global_context_from_settings(self):
+        """Concurrent first calls share one context built from settings."""
+        with mock.patch.object(clip, "_model_ctx", None), mock.patch.multiple(
+            clip.settings, clip_model_id=self.model_dir, device="auto", dtype="int8"
+        ):
+            with ThreadPoolExecutor(4) as pool:
+                contexts = list(pool.map(lambda _: clip.get_model_context(), range(8)))
+        self.assertTrue(all(ctx is contexts[0] for ctx in contexts))
+        self.assertEqual(contexts[0].model_name, self.model_dir)
+        self.assertEqual(contexts[0].dtype, "int8")
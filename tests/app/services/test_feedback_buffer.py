@@ -0,0 +1,162 @@
+"""Tests for bulk feedback writes and the write-behind buffer."""
+
+import time
+import unittest
+from unittest import mock
+
+from app.core import metrics
+from app.db.models.feedback import Feedback
+from app.db.models.image import Image
+from app.services import feedback_buffer, search
+from helpers import SqliteTestCase
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+
+class TestFeedbackBuffer(SqliteTestCase):
+    """Unit tests for feedback inserts, size/interval flushes and draining."""
+
+    foreign_keys = True
+
+    def setUp(self):
+        super().setUp()
+        with self.session_factory() as db:
+            db.add_all(
+                Image(filename=f"{i}.jpg", url_path=f"/{i}.jpg") for i in range(3)
+            )
+            db.commit()
+
+    def _row(self, image_id=1):
+        return {"query_text": "cat", "image_id": image_id, "is_good": True}
+
+    def _feedbacks(self):
+        with self.session_factory() as db:
+            return db.scalars(select(Feedback).order_by(Feedback.id)).all()
+
+    def test_missing_image_ids(self):
+        """Unknown ids are found with one query."""
+        with self.session_factory() as db:
+            missing = feedback_buffer.missing_image_ids(db, [1, 3, 4, 9, 4])
+        self.assertEqual(missing, {4, 9})
+
+    def test_insert_feedbacks(self):
+        """Rows are inserted in order and get ids and distinct timestamps."""
+        with self.session_factory() as db:
+            inserted = feedback_buffer.insert_feedbacks(
+                db, [self._row(1), self._row(2), self._row(3)]
+            )
+            db.commit()
+        self.assertEqual([fb.image_id for fb in self._feedbacks()], [1, 2, 3])
+        self.assertEqual([fb_id for fb_id, _ in inserted], [1, 2, 3])
+        self.assertTrue(all(created_at is not None for _, created_at in inserted))
+
+    def test_flush_on_size(self):
+        """A full buffer is flushed without waiting for the interval."""
+        buffer = feedback_buffer.FeedbackBuffer(
+            self.session_factory, max_size=2, flush_interval_ms=60_000
+        )
+        try:
+            buffer.add([self._row()])
+            buffer.add([self._row()])
+            deadline = time.monotonic() + 5
+            while len(self._feedbacks()) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(self._feedbacks()), 2)
+        finally:
+            buffer.stop(timeout=5)
+
+    def test_flush_on_interval(self):
+        """Buffered rows are written after the flush interval."""
+        buffer = feedback_buffer.FeedbackBuffer(
+            self.session_factory, max_size=100, flush_interval_ms=20
+        )
+        try:
+            buffer.add([self._row()])
+            deadline = time.monotonic() + 5
+            while not self._feedbacks() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(self._feedbacks()), 1)
+        finally:
+            buffer.stop(timeout=5)
+
+    def test_stop_drains_and_keeps_received_time(self):
+        """Stopping writes every buffered row, stamped when it was added."""
+        buffer = feedback_buffer.FeedbackBuffer(
+            self.session_factory, max_size=100, flush_interval_ms=60_000
+        )
+        first = buffer.add([self._row(1)])
+        time.sleep(0.05)
+        second = buffer.add([self._row(2)])
+        buffer.stop(timeout=5)
+
+        self.assertEqual(len(buffer), 0)
+        # SQLite drops the time zone; both are UTC
+        stored = [fb.created_at.replace(tzinfo=None) for fb in self._feedbacks()]
+        self.assertEqual(
+            stored, [first.replace(tzinfo=None), second.replace(tzinfo=None)]
+        )
+
+    def test_flush_bumps_feedback_generation(self):
+        """Writing buffered feedback marks re-ranked search results stale."""
+        buffer = feedback_buffer.FeedbackBuffer(self.session_factory)
+        buffer.add([self._row()])
+        generation = search.feedback_generation()
+        buffer.flush()
+        buffer.stop(timeout=5)
+        self.assertGreater(search.feedback_generation(), generation)
+
+    def test_flush_drops_deleted_images(self):
+        """Feedback for an image deleted while buffered is dropped."""
+        buffer = feedback_buffer.FeedbackBuffer(self.session_factory)
+        buffer.add([self._row(1), self._row(2)])
+        with self.session_factory() as db:
+            db.delete(db.get(Image, 2))
+            db.commit()
+        self.assertEqual(buffer.flush(), 1)
+        buffer.stop(timeout=5)
+        self.assertEqual([fb.image_id for fb in self._feedbacks()], [1])
+
+    def test_flush_drops_rows_violating_other_constraints(self):
+        """Only the rows that still fail are dropped, and they are counted."""
+        buffer = feedback_buffer.FeedbackBuffer(self.session_factory)
+        buffer.add([self._row(1), {**self._row(2), "is_good": None}, self._row(3)])
+        errors = metrics.ERRORS.value("feedback")
+        with self.assertLogs(feedback_buffer.logger, "ERROR"):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual([fb.image_id for fb in self._feedbacks()], [1, 3])
+        self.assertEqual(metrics.ERRORS.value("feedback"), errors + 1)
+        self.assertEqual(len(buffer), 0)
+
+    def test_failed_flush_retries_then_drops(self):
+        """Rows of a failed flush are retried up to `max_attempts` flushes."""
+        buffer = feedback_buffer.FeedbackBuffer(self.session_factory, max_attempts=2)
+        buffer.add([self._row()])
+        failure = OperationalError("INSERT", {}, Exception("database is down"))
+        with mock.patch.object(
+            feedback_buffer, "insert_feedbacks", side_effect=failure
+        ):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+            self.assertEqual(len(buffer), 1)
+            with self.assertLogs(feedback_buffer.logger, "ERROR"):
+                with self.assertRaises(OperationalError):
+                    buffer.flush()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_pending_rows_are_capped(self):
+        """Past `max_pending` rows, the oldest are dropped."""
+        buffer = feedback_buffer.FeedbackBuffer(
+            self.session_factory, max_size=2, max_pending=3, flush_interval_ms=60_000
+        )
+        # keep the flushing thread from writing them
+        buffer.start = lambda: None
+        with self.assertLogs(feedback_buffer.logger, "ERROR"):
+            buffer.add([self._row(1), self._row(2), self._row(3), self._row(1)])
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual([fb.image_id for fb in self._feedbacks()], [2, 3, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Tests for feedback aggregates and feedback-aware re-ranking."""
+
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from app.db.models.feedback_aggregate import FeedbackAggregate
+from app.db.models.image import Image
+from app.services import feedback_ranking
+from app.services.feedback_buffer import insert_feedbacks
+from helpers import SqliteTestCase
+from sqlalchemy import select
+
+
+class TestFeedbackRanking(SqliteTestCase):
+    """Unit tests for maintaining aggregates and blending them into scores."""
+
+    def setUp(self):
+        super().setUp()
+        with self.session_factory() as db:
+            db.add_all(
+                Image(filename=f"{i}.jpg", url_path=f"/{i}.jpg") for i in range(3)
+            )
+            db.commit()
+
+    def _add(self, db, query_text, image_id, is_good, created_at=None):
+        row = {"query_text": query_text, "image_id": image_id, "is_good": is_good}
+        if created_at is not None:
+            row["created_at"] = created_at
+        insert_feedbacks(db, [row])
+
+    def _aggregates(self, db):
+        now = datetime.now(timezone.utc)
+        scale = feedback_ranking.decay_scale(now)
+        return {
+            (agg.query, agg.image_id): (
+                round(agg.good * scale, 3),
+                round(agg.bad * scale, 3),
+            )
+            for agg in db.scalars(select(FeedbackAggregate))
+        }
+
+    def test_aggregates_are_maintained_on_insert(self):
+        """Feedback counts per normalized query and per image are kept."""
+        with self.session_factory() as db:
+            self._add(db, "A  Cat", 1, True)
+            self._add(db, "a cat", 1, False)
+            self._add(db, "a dog", 1, True)
+            db.commit()
+            self.assertEqual(
+                self._aggregates(db),
+                {
+                    ("a cat", 1): (1.0, 1.0),
+                    ("a dog", 1): (1.0, 0.0),
+                    ("", 1): (2.0, 1.0),
+                },
+            )
+
+    def test_counts_decay_with_half_life(self):
+        """Feedback one half-life old counts half."""
+        old = datetime.now(timezone.utc) - timedelta(days=30)
+        with mock.patch.object(
+            feedback_ranking.settings, "feedback_half_life_days", 30
+        ), self.session_factory() as db:
+            self._add(db, "cat", 2, True, created_at=old)
+            db.commit()
+            self.assertEqual(self._aggregates(db)[("cat", 2)], (0.5, 0.0))
+
+    def test_rebuild_matches_incremental(self):
+        """Rebuilding from the feedbacks table gives the same aggregates."""
+        with self.session_factory() as db:
+            self._add(db, "cat", 1, True)
+            self._add(db, "cat", 2, False)
+            db.commit()
+            incremental = self._aggregates(db)
+            self.assertEqual(feedback_ranking.rebuild_aggregates(db), 2)
+            db.commit()
+            self.assertEqual(self._aggregates(db), incremental)
+
+    def test_rerank_blends_feedback(self):
+        """Liked images move up and disliked ones down for the same query."""
+        with self.session_factory() as db:
+            for _ in range(5):
+                self._add(db, "cat", 3, True)
+                self._add(db, "cat", 1, False)
+            db.commit()
+            images = {img.id: img for img in db.scalars(select(Image))}
+            rows = [(images[1], 0.30), (images[2], 0.29), (images[3], 0.28)]
+
+            reranked = feedback_ranking.rerank(db, "Cat", rows, top_k=2)
+            self.assertEqual([img.id for img, _ in reranked], [3, 2])
+            self.assertGreater(reranked[0][1], 0.28)
+
+            # another query only gets the smaller any-query boost
+            unrelated = {
+                img.id: score
+                for img, score in feedback_ranking.rerank(db, "dog", rows, top_k=3)
+            }
+            self.assertLess(unrelated[3], reranked[0][1])
+            self.assertAlmostEqual(unrelated[2], 0.29)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+"""Tests for background ingestion jobs."""
+
+import shutil
+import threading
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from app.core.config import settings
+from app.db.models.image import Image
+from app.db.models.ingestion_job import JOB_COMPLETED, JOB_RUNNING, IngestionJob
+from app.index import ExactIndex
+from app.services import ingestion, storage, thumbnails
+from helpers import SqliteTestCase
+from PIL import Image as PILImage
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+TEST_ASSETS_PATH = "./tests/assets/ml/clip"
+
+
+def fake_embed_images(_model_ctx, image_paths, on_decoded=None, on_error=None):
+    """Return deterministic unit vectors instead of running CLIP."""
+    decoded = 0
+    for path in image_paths:
+        try:
+            with PILImage.open(path) as img:
+                image = img.convert("RGB")
+        except OSError as exc:
+            on_error(path, exc)
+            continue
+        if on_decoded is not None:
+            on_decoded(path, image)
+        decoded += 1
+    rng = np.random.default_rng(decoded)
+    feats = rng.standard_normal((decoded, 512)).astype(np.float32)
+    return feats / np.linalg.norm(feats, axis=-1, keepdims=True)
+
+
+class TestIngestion(SqliteTestCase):
+    """Unit tests for chunked, resumable ingestion jobs."""
+
+    def setUp(self):
+        super().setUp()
+        self.source_dir = self.tmp_dir / "source"
+        self.source_dir.mkdir()
+        for name in ("cat", "elephant", "cat_copy"):
+            src = "elephant" if name == "elephant" else "cat"
+            shutil.copy(f"{TEST_ASSETS_PATH}/{src}.jpg", self.source_dir / f"{name}.jpg")
+        images_dir = self.tmp_dir / "images"
+        images_dir.mkdir()
+
+        self.index = ExactIndex(str(self.tmp_dir / "index"))
+        self.patches = [
+            mock.patch.object(ingestion, "get_search_backend", lambda: self.index),
+            mock.patch.object(storage, "IMAGES_DIR", images_dir),
+            mock.patch.object(thumbnails, "THUMBNAILS_DIR", self.tmp_dir / "thumbs"),
+            mock.patch.object(ingestion.clip, "embed_images", fake_embed_images),
+            mock.patch.object(ingestion.clip, "get_model_context", lambda: None),
+            mock.patch.object(settings, "ingestion_chunk_size", 2),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def _create_job(self, **kwargs) -> int:
+        with self.session_factory() as db:
+            job = IngestionJob(folder=str(self.source_dir), **kwargs)
+            db.add(job)
+            db.commit()
+            return job.id
+
+    def test_run_job(self):
+        """A job indexes every image in checkpointed chunks."""
+        job_id = self._create_job()
+        with mock.patch.object(
+            ingestion.clip, "embed_images", wraps=fake_embed_images
+        ) as embed_images:
+            ingestion.run_job(job_id, self.session_factory)
+        # cat_copy.jpg has the same content as cat.jpg and is not embedded again
+        embedded = [
+            Path(path).name
+            for call in embed_images.call_args_list
+            for path in call.args[1]
+        ]
+        self.assertEqual(embedded, ["cat.jpg", "elephant.jpg"])
+
+        with self.session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            self.assertEqual(job.status, JOB_COMPLETED)
+            self.assertEqual(job.total, 3)
+            self.assertEqual(job.next_offset, 3)
+            self.assertEqual(job.indexed, 3)
+            images = {img.filename: img for img in db.scalars(select(Image))}
+            self.assertEqual(
+                sorted(images), ["cat.jpg", "cat_copy.jpg", "elephant.jpg"]
+            )
+            np.testing.assert_array_equal(
+                images["cat_copy.jpg"].embedding, images["cat.jpg"].embedding
+            )
+            for content_hash in db.scalars(select(Image.content_hash)):
+                for variant in settings.thumbnail_sizes:
+                    path = thumbnails.variant_path(variant, content_hash)
+                    self.assertTrue(path.exists(), path)
+        self.assertEqual(len(self.index), 3)
+
+    def test_resume_job(self):
+        """An interrupted job resumes from its last committed chunk."""
+        job_id = self._create_job(status=JOB_RUNNING, next_offset=2)
+        ingestion.run_job(job_id, self.session_factory)
+
+        with self.session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            self.assertEqual(job.status, JOB_COMPLETED)
+            self.assertEqual(job.started_offset, 2)
+            self.assertEqual(job.indexed, 1)
+            self.assertEqual(db.query(Image).count(), 1)
+
+    def test_rerun_only_hashes_changed_files(self):
+        """Re-ingesting a folder only hashes and embeds what changed."""
+        ingestion.run_job(self._create_job(), self.session_factory)
+
+        # same name, new content
+        shutil.copy(f"{TEST_ASSETS_PATH}/elephant.jpg", self.source_dir / "cat.jpg")
+        with mock.patch.object(
+            ingestion, "hash_file", wraps=ingestion.hash_file
+        ) as hash_file:
+            job_id = self._create_job()
+            ingestion.run_job(job_id, self.session_factory)
+        self.assertEqual(
+            [call.args[0].name for call in hash_file.call_args_list], ["cat.jpg"]
+        )
+
+        with self.session_factory() as db:
+            self.assertEqual(db.get(IngestionJob, job_id).indexed, 1)
+            cat = db.scalars(select(Image).where(Image.filename == "cat.jpg")).one()
+            self.assertEqual(
+                cat.content_hash, ingestion.hash_file(self.source_dir / "elephant.jpg")
+            )
+            self.assertEqual(db.query(Image).count(), 3)
+
+    def test_duplicate_outlives_overwritten_original(self):
+        """A copy stays searchable after the file it duplicated changes."""
+        ingestion.run_job(self._create_job(), self.session_factory)
+        with self.session_factory() as db:
+            cat_vec = np.asarray(
+                db.scalars(
+                    select(Image.embedding).where(Image.filename == "cat.jpg")
+                ).one()
+            )
+
+        shutil.copy(f"{TEST_ASSETS_PATH}/elephant.jpg", self.source_dir / "cat.jpg")
+        ingestion.run_job(self._create_job(), self.session_factory)
+
+        with self.session_factory() as db:
+            (best, score), *_ = self.index.search(db, cat_vec, 3)
+        self.assertEqual(best.filename, "cat_copy.jpg")
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_undecodable_files_are_skipped(self):
+        """A corrupt file is skipped and counted; the job still completes."""
+        (self.source_dir / "broken.jpg").write_bytes(b"not an image")
+        job_id = self._create_job()
+        with self.assertLogs(ingestion.logger, "WARNING"):
+            ingestion.run_job(job_id, self.session_factory)
+
+        with self.session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            self.assertEqual(job.status, JOB_COMPLETED)
+            self.assertEqual((job.total, job.indexed, job.skipped), (4, 3, 1))
+            self.assertIsNone(
+                db.scalars(select(Image).where(Image.filename == "broken.jpg")).first()
+            )
+        self.assertEqual(len(self.index), 3)
+
+    def test_failed_job_bookkeeping_never_raises(self):
+        """A job whose failure cannot be recorded is logged and left active."""
+        job_id = self._create_job()
+        sessions = iter([self.session_factory()])
+
+        def session_factory():  # the job's session, then none
+            db = next(sessions, None)
+            if db is None:
+                raise OperationalError("SELECT", {}, Exception("database is down"))
+            return db
+
+        with mock.patch.object(
+            ingestion, "ingest_chunk", side_effect=RuntimeError("boom")
+        ), self.assertLogs(ingestion.logger, "ERROR") as logs:
+            ingestion.run_job(job_id, session_factory)
+        self.assertIn("Could not mark ingestion job", logs.output[-1])
+        with self.session_factory() as db:
+            self.assertEqual(db.get(IngestionJob, job_id).status, JOB_RUNNING)
+
+    def test_worker_survives_failing_jobs(self):
+        """An exception escaping a job does not stop the worker thread."""
+        done = threading.Event()
+        calls = []
+
+        def run_job(job_id, *_args):
+            calls.append(job_id)
+            if job_id == 1:
+                raise OperationalError("SELECT", {}, Exception("database is down"))
+            done.set()
+
+        worker = ingestion.IngestionWorker(self.session_factory)
+        with mock.patch.object(ingestion, "run_job", run_job), self.assertLogs(
+            ingestion.logger, "ERROR"
+        ):
+            worker.submit(1)
+            worker.submit(2)
+            self.assertTrue(done.wait(10))
+        worker.stop(timeout=10)
+        self.assertEqual(calls, [1, 2])
+
+    def test_worker_resumes_active_jobs(self):
+        """The worker picks up jobs left pending or running."""
+        done_id = self._create_job(status=JOB_COMPLETED)
+        job_id = self._create_job(status=JOB_RUNNING)
+
+        worker = ingestion.IngestionWorker(self.session_factory)
+        self.assertEqual(worker.resume_active_jobs(), [job_id])
+        worker.stop(timeout=10)
+
+        with self.session_factory() as db:
+            self.assertEqual(db.get(IngestionJob, done_id).indexed, 0)
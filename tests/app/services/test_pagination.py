@@ -0,0 +1,49 @@
+"""Tests for keyset pagination and NDJSON export."""
+
+import json
+
+from app.db.models.image import Image
+from app.services import pagination
+from helpers import SqliteTestCase
+from sqlalchemy import select
+
+
+class TestPagination(SqliteTestCase):
+    """Unit tests for paging and streaming image listings."""
+
+    def setUp(self):
+        super().setUp()
+        with self.session_factory() as db:
+            db.add_all(
+                Image(filename=f"{i}.jpg", url_path=f"/{i}.jpg") for i in range(7)
+            )
+            db.commit()
+        self.stmt = select(Image.id, Image.filename)
+
+    def test_keyset_pages(self):
+        """Following the cursor visits every row once, in key order."""
+        pages, cursor = [], None
+        with self.session_factory() as db:
+            while True:
+                rows, cursor = pagination.keyset_page(
+                    db, self.stmt, Image.id, cursor, limit=3
+                )
+                pages.append([row.id for row in rows])
+                if cursor is None:
+                    break
+        self.assertEqual(pages, [[1, 2, 3], [4, 5, 6], [7]])
+
+    def test_stream_ndjson(self):
+        """Rows after the cursor are streamed as one JSON object per line."""
+        chunks = pagination.stream_ndjson(
+            self.stmt,
+            Image.id,
+            lambda row: {"id": row.id, "filename": row.filename},
+            cursor=5,
+            session_factory=self.session_factory,
+        )
+        lines = b"".join(chunks).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"id": 6, "filename": "5.jpg"}, {"id": 7, "filename": "6.jpg"}],
+        )
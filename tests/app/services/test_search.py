@@ -0,0 +1,126 @@
+"""Tests for the search result cache and search helpers."""
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.schemas.image import ImageMatchingResponse, SearchResponse
+from app.services import search
+
+
+def make_response(query: str, n: int) -> SearchResponse:
+    """Build a response with `n` results of decreasing score."""
+    results = [
+        ImageMatchingResponse(id=i, filename=f"{i}.jpg", url=f"/{i}.jpg", score=1 - i / 10)
+        for i in range(n)
+    ]
+    return SearchResponse(query=query, results=results)
+
+
+class TestSearchCache(unittest.TestCase):
+    """Unit tests for generation-aware search result caching."""
+
+    def setUp(self):
+        self.patch = mock.patch.object(search, "_result_cache", LRUCache(10))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_serves_smaller_top_k(self):
+        """A cached top-5 serves top-3 for an equivalent query."""
+        generation = search.index_generation()
+        search.cache_search("a cat", 5, make_response("a cat", 5), generation)
+
+        cached = search.get_cached_search("A  Cat", 3)
+        self.assertEqual(cached.query, "A  Cat")
+        self.assertEqual([r.id for r in cached.results], [0, 1, 2])
+        self.assertIsNone(search.get_cached_search("a cat", 6))
+
+    def test_exhausted_result_serves_any_top_k(self):
+        """A result holding every indexed image serves larger top_k."""
+        generation = search.index_generation()
+        search.cache_search("a cat", 5, make_response("a cat", 2), generation)
+        self.assertEqual(len(search.get_cached_search("a cat", 50).results), 2)
+
+    def test_generation_bump_invalidates(self):
+        """Committing new images makes cached results stale."""
+        generation = search.index_generation()
+        search.cache_search("a cat", 5, make_response("a cat", 5), generation)
+        search.bump_index_generation()
+        self.assertIsNone(search.get_cached_search("a cat", 1))
+
+    def test_feedback_invalidates_reranked_results(self):
+        """New feedback makes re-ranked results stale, not plain ones."""
+        generation = search.index_generation()
+        feedback_gen = search.feedback_generation()
+        for rerank in (False, True):
+            search.cache_search(
+                "a cat",
+                5,
+                make_response("a cat", 5),
+                generation,
+                rerank=rerank,
+                feedback_gen=feedback_gen,
+            )
+        self.assertIsNotNone(search.get_cached_search("a cat", 5, rerank=True))
+
+        search.bump_feedback_generation()
+        self.assertIsNone(search.get_cached_search("a cat", 5, rerank=True))
+        self.assertIsNotNone(search.get_cached_search("a cat", 5))
+
+    def test_keeps_larger_result(self):
+        """A smaller result does not replace a larger one of the same generation."""
+        generation = search.index_generation()
+        search.cache_search("a cat", 5, make_response("a cat", 5), generation)
+        search.cache_search("a cat", 2, make_response("a cat", 2), generation)
+        self.assertEqual(len(search.get_cached_search("a cat", 5).results), 5)
+
+
+class FakeBackend:
+    """Backend stand-in returning images 0..top_k-1 by decreasing score."""
+
+    def search(self, _db, _query_vec, top_k, ef_search=None):
+        return [(SimpleNamespace(id=i), 1 - i / 10) for i in range(top_k)]
+
+
+class TestSearchExcluding(unittest.TestCase):
+    """Unit tests for searches that leave out the query image."""
+
+    def test_excluded_images_are_replaced(self):
+        """Excluded images are dropped and the next results fill their place."""
+        with mock.patch.object(search, "get_search_backend", FakeBackend):
+            rows = search.search_excluding(None, np.zeros(2), 3, [0, 2])
+        self.assertEqual([img.id for img, _ in rows], [1, 3, 4])
+
+
+class TestResolveEfSearch(unittest.TestCase):
+    """Unit tests for picking the `ef_search` of a request."""
+
+    def setUp(self):
+        self.patch = mock.patch.object(
+            settings, "hnsw_ef_search_tiers", {"fast": 40, "accurate": 400}
+        )
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_explicit_value_wins_over_tier(self):
+        """A per-request ef_search overrides the tier."""
+        self.assertEqual(search.resolve_ef_search(250, "fast"), 250)
+        self.assertEqual(search.resolve_ef_search(250, None), 250)
+
+    def test_tier_defaults(self):
+        """Tiers map to their configured value; no tier means the default."""
+        self.assertEqual(search.resolve_ef_search(None, "fast"), 40)
+        self.assertEqual(search.resolve_ef_search(None, "accurate"), 400)
+        self.assertIsNone(search.resolve_ef_search(None, None))
+
+    def test_unknown_tier(self):
+        """An unknown tier is rejected with the known ones."""
+        with self.assertRaisesRegex(ValueError, r"\['accurate', 'fast'\]"):
+            search.resolve_ef_search(None, "turbo")
@@ -0,0 +1,115 @@
+"""Tests for ingested image file placement."""
+
+from unittest import mock
+
+from app.services import storage
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from helpers import TempDirTestCase
+
+
+class TestPlaceImage(TempDirTestCase):
+    """Unit tests for the image placement modes."""
+
+    def setUp(self):
+        super().setUp()
+        self.data_dir = self.tmp_dir / "data"
+        self.images_dir = self.tmp_dir / "images"
+        self.data_dir.mkdir()
+        self.images_dir.mkdir()
+        self.src = self.data_dir / "dataset" / "cat.jpg"
+        self.src.parent.mkdir()
+        self.src.write_bytes(b"cat")
+
+        self.patches = [
+            mock.patch.object(storage, "IMAGES_DIR", self.images_dir),
+            mock.patch.object(storage, "DATA_DIR", self.data_dir),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_copy(self):
+        """Copies are independent files served from IMAGES_DIR."""
+        path, url = storage.place_image(self.src, "copy")
+        self.assertEqual(path, self.images_dir / "cat.jpg")
+        self.assertEqual(url, storage.image_url("cat.jpg"))
+        self.assertEqual(path.read_bytes(), b"cat")
+        self.assertNotEqual(path.stat().st_ino, self.src.stat().st_ino)
+
+    def test_hardlink(self):
+        """Hardlinks share the source inode."""
+        path, _ = storage.place_image(self.src, "hardlink")
+        self.assertEqual(path.stat().st_ino, self.src.stat().st_ino)
+
+    def test_symlink(self):
+        """Symlinks point at the source file."""
+        path, _ = storage.place_image(self.src, "symlink")
+        self.assertTrue(path.is_symlink())
+        self.assertEqual(path.resolve(), self.src.resolve())
+
+    def test_reference(self):
+        """Files under DATA_DIR are served in place."""
+        path, url = storage.place_image(self.src, "reference")
+        self.assertEqual(path, self.src)
+        self.assertTrue(url.endswith(f"{storage.DATA_ENDPOINT}/dataset/cat.jpg"))
+        self.assertFalse((self.images_dir / "cat.jpg").exists())
+
+    def test_servable_path(self):
+        """Placement URLs map back to the files they serve."""
+        for mode in ("copy", "reference"):
+            path, url = storage.place_image(self.src, mode)
+            self.assertEqual(storage.servable_path(url), path)
+
+    def test_auto_replaces_existing(self):
+        """Placing a changed file replaces the previous one atomically."""
+        storage.place_image(self.src, "auto")
+        self.src.unlink()
+        self.src.write_bytes(b"new cat")
+        path, _ = storage.place_image(self.src, "auto")
+        self.assertEqual(path.read_bytes(), b"new cat")
+        self.assertEqual(sorted(p.name for p in self.images_dir.iterdir()), ["cat.jpg"])
+
+
+class TestCachedStaticFiles(TempDirTestCase):
+    """Unit tests for static files served with caching headers."""
+
+    def setUp(self):
+        super().setUp()
+        (self.tmp_dir / "w256q80").mkdir()
+        (self.tmp_dir / "w256q80" / "abc.webp").write_bytes(b"thumb")
+
+    def _client(self, **kwargs) -> TestClient:
+        app = FastAPI()
+        app.mount(
+            "/static",
+            storage.CachedStaticFiles(directory=str(self.tmp_dir), **kwargs),
+        )
+        return TestClient(app)
+
+    def test_content_addressed(self):
+        """Content-addressed files get a path ETag and are revalidated to 304."""
+        client = self._client(
+            cache_control="public, max-age=31536000, immutable",
+            content_addressed=True,
+        )
+        response = client.get("/static/w256q80/abc.webp")
+        self.assertEqual(response.content, b"thumb")
+        self.assertEqual(response.headers["etag"], '"w256q80-abc"')
+        self.assertIn("immutable", response.headers["cache-control"])
+
+        response = client.get(
+            "/static/w256q80/abc.webp", headers={"If-None-Match": '"w256q80-abc"'}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response.headers["cache-control"])
+
+    def test_cache_control(self):
+        """Other files keep the stat-based ETag."""
+        client = self._client(cache_control="public, max-age=60")
+        response = client.get("/static/w256q80/abc.webp")
+        self.assertEqual(response.headers["cache-control"], "public, max-age=60")
+        self.assertNotEqual(response.headers["etag"], '"w256q80-abc"')
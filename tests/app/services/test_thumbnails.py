@@ -0,0 +1,85 @@
+"""Tests for thumbnail variants."""
+
+import unittest
+from unittest import mock
+
+from app.core import metrics
+from app.core.config import settings
+from app.services import thumbnails
+from helpers import TempDirTestCase
+from PIL import Image as PILImage
+
+CONTENT_HASH = "ab" * 32
+
+
+class TestThumbnails(TempDirTestCase):
+    """Unit tests for generating and addressing thumbnail variants."""
+
+    def setUp(self):
+        super().setUp()
+        self.patches = [
+            mock.patch.object(thumbnails, "THUMBNAILS_DIR", self.tmp_dir),
+            mock.patch.object(settings, "thumbnail_sizes", {"thumb": 64, "big": 256}),
+            mock.patch.object(settings, "thumbnail_format", "webp"),
+            mock.patch.object(settings, "thumbnail_quality", 80),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_save_variants(self):
+        """Variants keep the aspect ratio, never enlarge, and are written once."""
+        image = PILImage.new("RGB", (400, 200), "red")
+        self.assertEqual(thumbnails.save_variants(image, CONTENT_HASH), 2)
+        self.assertEqual(image.size, (400, 200))
+        with PILImage.open(thumbnails.variant_path("thumb", CONTENT_HASH)) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ("WEBP", (64, 32)))
+        with PILImage.open(thumbnails.variant_path("big", CONTENT_HASH)) as big:
+            self.assertEqual(big.size, (256, 128))
+        self.assertEqual(thumbnails.save_variants(image, CONTENT_HASH), 0)
+
+        small = PILImage.new("RGB", (100, 50))
+        self.assertEqual(thumbnails.save_variants(small, "cd" * 32), 2)
+        with PILImage.open(thumbnails.variant_path("big", "cd" * 32)) as big:
+            self.assertEqual(big.size, (100, 50))
+
+    def test_save_errors_are_logged_not_raised(self):
+        """An unusable format is logged and counted, never raised."""
+        image = PILImage.new("RGB", (400, 200), "red")
+        errors = metrics.ERRORS.value("thumbnail")
+        with mock.patch.object(settings, "thumbnail_format", "no-such-format"):
+            with self.assertLogs(thumbnails.logger, "ERROR"):
+                self.assertEqual(thumbnails.save_variants(image, CONTENT_HASH), 0)
+        self.assertEqual(metrics.ERRORS.value("thumbnail"), errors + 2)
+        self.assertFalse([path for path in self.tmp_dir.rglob("*") if path.is_file()])
+
+    def test_variant_urls(self):
+        """URLs name the size, quality and content of each variant."""
+        thumbnails.save_variants(PILImage.new("RGB", (400, 200)), CONTENT_HASH)
+        urls = thumbnails.variant_urls(CONTENT_HASH)
+        self.assertTrue(
+            urls["thumb"].endswith(
+                f"{thumbnails.THUMBNAIL_ENDPOINT}/w64q80/{CONTENT_HASH}.webp"
+            )
+        )
+        self.assertEqual(set(urls), {"thumb", "big"})
+        self.assertEqual(thumbnails.variant_urls(None), {})
+
+    def test_variant_urls_skip_missing_files(self):
+        """Variants that failed to save are not advertised."""
+        image = PILImage.new("RGB", (400, 200), "red")
+        with mock.patch.object(settings, "thumbnail_format", "no-such-format"):
+            with self.assertLogs(thumbnails.logger, "ERROR"):
+                thumbnails.save_variants(image, CONTENT_HASH)
+        self.assertEqual(thumbnails.variant_urls(CONTENT_HASH), {})
+
+        thumbnails.save_variants(image, CONTENT_HASH)
+        thumbnails.variant_path("big", CONTENT_HASH).unlink()
+        self.assertEqual(set(thumbnails.variant_urls(CONTENT_HASH)), {"thumb"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Tests for the multi-process server launcher."""
+
+import unittest
+from unittest.mock import patch
+
+from app import serve
+
+
+class TestCanShareModel(unittest.TestCase):
+    """Unit tests for `can_share_model`."""
+
+    def test_torch_on_cpu_is_shared(self):
+        """The torch model on the CPU is loaded once before forking."""
+        with patch.multiple(
+            "app.serve.settings",
+            preload_model=True,
+            encoder_backend="torch",
+            device="cpu",
+        ):
+            self.assertTrue(serve.can_share_model())
+
+    def test_auto_device_is_resolved(self):
+        """An "auto" device is shared when it resolves to the CPU, and only then."""
+        for resolved, shared in (("cpu", True), ("cuda", False), ("mps", False)):
+            with self.subTest(resolved=resolved), patch.multiple(
+                "app.serve.settings",
+                preload_model=True,
+                encoder_backend="torch",
+                device="auto",
+            ), patch("app.ml.clip.resolve_device", return_value=resolved):
+                self.assertEqual(serve.can_share_model(), shared)
+
+    def test_fork_unsafe_runtimes_load_per_worker(self):
+        """CUDA, ONNX Runtime and a disabled preload load in each worker."""
+        for overrides in (
+            {"device": "cuda"},
+            {"encoder_backend": "onnx"},
+            {"preload_model": False},
+        ):
+            values = {
+                "preload_model": True,
+                "encoder_backend": "torch",
+                "device": "cpu",
+                **overrides,
+            }
+            with self.subTest(**overrides), patch.multiple(
+                "app.serve.settings", **values
+            ):
+                self.assertFalse(serve.can_share_model())
+
+
+if __name__ == "__main__":
+    unittest.main()